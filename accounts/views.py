@@ -1,10 +1,10 @@
 # accounts/views.py
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import Group
 from django.shortcuts import redirect, render
 from django.contrib import messages
 from allauth.account.models import EmailAddress
 from django.views.decorators.http import require_POST
+from core.permissions import get_capabilities
 
 @require_POST
 def resend_verification_view(request):
@@ -30,14 +30,14 @@ def resend_verification_view(request):
 
 @login_required
 def account_panel_view(request):
-    user = request.user
+    capabilities = get_capabilities(request)
     # Verifica se o email foi confirmado
-    email_verified = EmailAddress.objects.filter(user=user, verified=True).exists()
+    email_verified = capabilities.email_verified
     # Verifica se está no grupo "SemAcesso"
-    is_sem_acesso = Group.objects.filter(name="SemAcesso", user=user).exists()
+    is_sem_acesso = not capabilities.has_access
 
     # Grupo a que o user pertence
-    roles = list(request.user.groups.values_list("name", flat=True))
+    roles = list(capabilities.group_names)
     # esconder "SemAcesso" da lista visível
     visible_roles = [r for r in roles if r != "SemAcesso"]
 
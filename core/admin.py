@@ -1,13 +1,33 @@
 # core/admin.py
-from import_export import resources
+import copy
+import os
+import shutil
+import tempfile
+
+import reversion
+from django.utils import timezone
+from import_export import fields, resources
 from import_export.admin import ImportExportModelAdmin, ExportActionMixin
+from import_export.signals import post_import
+from import_export.tmp_storages import TempFolderStorage
 from modeltranslation.admin import TranslationAdmin                         # Importa o TranslationAdmin, uma classe fornecida pelo pacote django-modeltranslation para facilitar a tradução de campos de modelos do Django na interface de administração
 from reversion.admin import VersionAdmin
-from .models import Area, SubArea, Term, News, Warning, Tutorial, Poster, Thesis, DocumentationLink, ContactInfo, ContactTopMessage
+from .models import Area, SubArea, Term, Job, News, Warning, Tutorial, Poster, Thesis, DocumentationLink, ContactInfo, ContactTopMessage
 from django.contrib import admin, messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.core.exceptions import PermissionDenied
 from django.db import transaction
+from django.http import FileResponse, QueryDict
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from core.exporting import stream_terms_response
+from core.forms import BackgroundExportForm, BackgroundImportForm, TermStreamExportForm
+from core.importing import BatchInstanceLoader, CachedForeignKeyWidget, ImportFailed, import_file, refresh_imported_terms
+from core.jobs import MAX_ERRORS, enqueue_export, enqueue_import
+from core.revision_storage import preloaded_versions
 
 # Define as colunas de importação/exportação para o modelo Area (tem que ficar antes do AreaAdmin)
 class AreaResource(resources.ModelResource):
@@ -32,14 +52,136 @@ class SubAreaResource(resources.ModelResource):
                   'name_sl', 'name_sv', 'name_tr', 'name_uk']
 
 
+# Importação/exportação em segundo plano (core/jobs.py): o pedido só grava o Job e responde logo,
+# e o progresso e o ficheiro exportado ficam na lista de Jobs (executados por "manage.py run_jobs")
+class BackgroundJobAdminMixin:
+    import_export_change_list_template = 'admin/core/change_list_jobs.html'   # botões "Background import/export"
+    background_export_form_class = BackgroundExportForm
+
+    def get_urls(self):
+        info = self.get_model_info()
+        urls = [
+            path('background-import/', self.admin_site.admin_view(self.background_import_view),
+                 name='%s_%s_background_import' % info),
+            path('background-export/', self.admin_site.admin_view(self.background_export_view),
+                 name='%s_%s_background_export' % info),
+        ]
+        return urls + super().get_urls()
+
+    def background_import_view(self, request):
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+
+        form = BackgroundImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            job = enqueue_import(self.model, form.cleaned_data['file'], user=request.user,
+                                 dry_run=form.cleaned_data['dry_run'])
+            return self.job_queued(request, job)
+        return self.render_job_form(request, form, 'Background import')
+
+    # Exporta o que a lista mostra (filtros e pesquisa); sem filtros, todos os objetos
+    def background_export_view(self, request):
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+
+        changelist_filters = request.GET.get('_changelist_filters', '')
+        form = self.background_export_form_class(request.POST or None)
+        if request.method == 'POST' and form.is_valid():
+            pks = None
+            if changelist_filters:
+                changelist_request = copy.copy(request)
+                changelist_request.GET = QueryDict(changelist_filters)
+                pks = self.get_export_queryset(changelist_request).values_list('pk', flat=True)
+            job = enqueue_export(self.model, form.cleaned_data['format'], user=request.user, pks=pks,
+                                 languages=form.cleaned_data.get('languages'))
+            return self.job_queued(request, job)
+        return self.render_job_form(request, form, 'Background export')
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if self.has_export_permission(request):
+            actions['export_in_background'] = (
+                type(self).export_in_background,
+                'export_in_background',
+                'Export selected %(verbose_name_plural)s in the background (CSV)',
+            )
+        return actions
+
+    def export_in_background(self, request, queryset):
+        job = enqueue_export(self.model, 'csv', user=request.user, pks=queryset.values_list('pk', flat=True))
+        return self.job_queued(request, job)
+
+    # Importação confirmada no admin (depois da pré-visualização): o ficheiro é lido em blocos por core/importing.py,
+    # como nas importações em segundo plano, em vez de ir inteiro para um dataset do tablib
+    def process_import(self, request, **kwargs):
+        if not self.has_import_permission(request):
+            raise PermissionDenied
+
+        confirm_form = self.create_confirm_form(request)
+        if not confirm_form.is_valid():
+            return super().process_import(request, **kwargs)         # mostra os erros do formulário
+
+        input_format = self.get_import_formats()[int(confirm_form.cleaned_data['format'])](encoding=self.from_encoding)
+        tmp_storage = self.get_tmp_storage_class()(
+            name=confirm_form.cleaned_data['import_file_name'],
+            encoding=None if input_format.is_binary() else self.from_encoding,
+            read_mode=input_format.get_read_mode(),
+            **self.get_tmp_storage_class_kwargs(),
+        )
+        try:
+            with tempfile.NamedTemporaryFile(suffix=f'.{input_format.get_extension()}') as handle:
+                if isinstance(tmp_storage, TempFolderStorage):
+                    # armazenamento por omissão: já é um ficheiro local
+                    with open(tmp_storage.get_full_path(), 'rb') as source:
+                        shutil.copyfileobj(source, handle)
+                else:
+                    data = tmp_storage.read()
+                    handle.write(data.encode('utf-8') if isinstance(data, str) else data)
+                handle.flush()
+                totals = import_file(self.choose_import_resource_class(confirm_form, request), handle.name,
+                                     user=request.user, file_name=confirm_form.cleaned_data.get('original_file_name'))
+        except ImportFailed as error:
+            for message in error.errors[:MAX_ERRORS]:
+                messages.error(request, message)
+            return redirect('admin:%s_%s_import' % self.get_model_info())
+        finally:
+            tmp_storage.remove()
+
+        messages.success(request, "Import finished: {} new, {} updated, {} deleted and {} skipped {}.".format(
+            totals.get('new', 0), totals.get('update', 0), totals.get('delete', 0), totals.get('skip', 0),
+            self.model._meta.verbose_name_plural,
+        ))
+        post_import.send(sender=None, model=self.model)
+        return redirect('admin:%s_%s_changelist' % self.get_model_info())
+
+    def job_queued(self, request, job):
+        job_admin = self.admin_site._registry.get(Job)
+        if job_admin is not None and job_admin.has_view_permission(request, job):
+            messages.success(request, f"Job #{job.pk} queued: it will run in the background. Its progress is shown below.")
+            return redirect('admin:core_job_change', job.pk)
+        # sem acesso aos jobs (core.view_job): volta à lista do modelo
+        messages.success(request, f"Job #{job.pk} queued: it will run in the background.")
+        opts = self.model._meta
+        return redirect(f'admin:{opts.app_label}_{opts.model_name}_changelist')
+
+    def render_job_form(self, request, form, title):
+        context = {
+            **self.admin_site.each_context(request),
+            'title': title,
+            'opts': self.model._meta,
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/core/job_form.html', context)
+
+
 @admin.register(Area)                                                   # Regista o modelo Area na interface de administração do Django, permitindo a sua gestão através do painel de administração.
-class AreaAdmin(VersionAdmin,TranslationAdmin, ImportExportModelAdmin):                    # Classe AreaAdmin herda de TranslationAdmin, permitindo que a interface de administração suporte a tradução dos campos do modelo Area.
+class AreaAdmin(BackgroundJobAdminMixin, VersionAdmin,TranslationAdmin, ImportExportModelAdmin):                    # Classe AreaAdmin herda de TranslationAdmin, permitindo que a interface de administração suporte a tradução dos campos do modelo Area.
     list_display = ['id', 'name']                                       # Define os campos do modelo que serão exibidos na lista de objetos na interface de administração.
     search_fields = ['name']                                            # Permite adicionar uma barra de pesquisa na interface de administração, onde os utilizadores podem procurar por 'name'.
     resource_classes = [AreaResource]                                   # Adiciona a classe de recurso para importação, para definir as colunas a importar.
 
 @admin.register(SubArea)                                                # Regista o modelo SubArea na interface de administração do Django, permitindo a sua gestão através do painel de administração.
-class SubAreaAdmin(VersionAdmin, TranslationAdmin, ImportExportModelAdmin):                # Classe SubAreaAdmin herda de TranslationAdmin, permitindo que a interface de administração suporte a tradução dos campos do modelo SubArea.
+class SubAreaAdmin(BackgroundJobAdminMixin, VersionAdmin, TranslationAdmin, ImportExportModelAdmin):                # Classe SubAreaAdmin herda de TranslationAdmin, permitindo que a interface de administração suporte a tradução dos campos do modelo SubArea.
     list_display = ['ref','id', 'name', 'area']                         # Define os campos do modelo que serão exibidos na lista de objetos na interface de administração.
     list_filter = ['area']                                              # Adiciona um filtro na interface de administração, permitindo filtrar os objetos com base na 'area' associada.
     search_fields = ['name']                                            # Permite adicionar uma barra de pesquisa na interface de administração, onde os utilizadores podem procurar por 'name'.
@@ -52,7 +194,10 @@ class SubAreaAdmin(VersionAdmin, TranslationAdmin, ImportExportModelAdmin):
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
+# Importação em bloco (use_bulk): as linhas são gravadas com bulk_create/bulk_update em lotes de batch_size,
+# sem Term.save por linha; ver core/importing.py
 class TermResource(resources.ModelResource):
+    subarea = fields.Field(attribute='subarea', column_name='subarea', widget=CachedForeignKeyWidget(SubArea))    # todas as subáreas numa só query
 
     def before_save_instance(self, instance, row, **kwargs):
         for field in ['name_en', 'name_pt', 'name_pt_br', 'name_es', 'name_sq', 'name_ar', 'name_hy', 'name_bs',
@@ -63,12 +208,93 @@ class TermResource(resources.ModelResource):
             if getattr(instance, field) == '':
                 setattr(instance, field, None)
 
+        if self._meta.use_bulk:
+            # o bulk_create/bulk_update não passa pelo Term.save: ref, carimbo por idioma e 'updated' são feitos aqui, em memória
+            instance.ref = f"{instance.subarea_id}-{instance.id}"
+            instance.content_hashes = instance.compute_content_hashes()
+            instance.stamp_published_at(now=self.import_started)
+            instance.updated = self.import_started
+            self.imported_terms[instance.ref] = instance        # por ref: uma ref repetida no ficheiro é o mesmo termo
+
+    def save_instance(self, instance, is_create, row, **kwargs):
+        # ref repetida no ficheiro: o loader devolve a instância da linha anterior, já na lista do bulk_create/bulk_update
+        # (como o save linha a linha, a última linha ganha). Não volta a ser acrescentada, a não ser ao bulk_update se o
+        # lote em que estava já foi gravado.
+        if self._meta.use_bulk and self.imported_terms.get(instance.ref) is instance:
+            self.before_save_instance(instance, row, **kwargs)
+            pending = self.create_instances + self.update_instances
+            if not any(queued is instance for queued in pending):
+                self.update_instances.append(instance)
+            self.after_save_instance(instance, row, **kwargs)
+            return
+        super().save_instance(instance, is_create, row, **kwargs)
+
+    def skip_row(self, instance, original, row, import_validation_errors=None):
+        # termo existente com o mesmo hash do conteúdo em todos os idiomas e na mesma subárea: não é gravado,
+        # versionado nem reindexado (numa reimportação do dicionário inteiro quase todas as linhas estão assim)
+        if self.imported_terms.get(instance.ref) is instance:
+            return False                                    # ref repetida: a linha anterior já mudou a instância
+        if instance.is_tracked() and not import_validation_errors:
+            if not instance.content_changed() and not instance.get_changed_fields(['subarea_id', 'id', 'image']):
+                return True
+        return super().skip_row(instance, original, row, import_validation_errors=import_validation_errors)
+
+    def import_data(self, dataset, dry_run=False, **kwargs):
+        # o diff por linha só é mostrado na pré-visualização (dry run); na importação confirmada seria calculado e descartado
+        self._meta = copy.copy(type(self)._meta)
+        self._meta.skip_diff = not dry_run
+        return super().import_data(dataset, dry_run=dry_run, **kwargs)
+
+    def get_import_fields(self):
+        # a lista é igual para todas as linhas: o import-export recalcula-a (ordenando ~160 campos) em cada linha
+        if getattr(self, 'import_fields', None) is None:
+            self.import_fields = super().get_import_fields()
+        return self.import_fields
+
+    def init_instance(self, row=None):
+        # o construtor do modeltranslation calcula o default de cada uma das ~200 colunas traduzidas (ativando o idioma
+        # de cada uma); numa importação grande isso domina o tempo, por isso os termos novos são cópias de um termo vazio
+        if self.empty_instance is None:
+            self.empty_instance = super().init_instance(row)
+        return copy.copy(self.empty_instance)
+
+    def get_bulk_update_fields(self):
+        # só as colunas que mudaram em algum termo do lote (FieldTrackingMixin), incluindo os carimbos published_at_<lang>
+        # e 'updated': o UPDATE gerado pelo bulk_update cresce com o nº de colunas, e o ficheiro quase nunca as tem todas
+        changed = set()
+        for term in self.update_instances:
+            changed |= term.get_changed_fields()
+        changed.discard('ref')
+        return sorted(changed)
+
     def before_import(self, dataset, **kwargs):
                                                             # mimic a 'dynamic field' - i.e. append field which exists on Book model, but not in dataset
         dataset.headers.append('subarea')
         dataset.headers.append('ref')
+        self.fields['subarea'].widget.reset()
+        self.imported_terms = {}
+        self.import_started = timezone.now()
+        self.empty_instance = None
+        self.import_fields = None
         super().before_import(dataset, **kwargs)
 
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        if not self._meta.use_bulk or self._is_dry_run(kwargs) or result.has_errors():
+            return
+        # índice de pesquisa, autocomplete e cache de pesquisa, uma vez para a importação toda
+        imported_terms = list(self.imported_terms.values())
+        refresh_imported_terms(imported_terms)
+        # dentro de TermAdmin.process_dataset: todos os termos ficam numa só revisão do reversion
+        # (a última versão de cada termo, base do delta, é lida por lotes e não termo a termo)
+        if reversion.is_active():
+            batch_size = self._meta.batch_size or 1000
+            for start in range(0, len(imported_terms), batch_size):
+                batch = imported_terms[start:start + batch_size]
+                with preloaded_versions(Term, [term.pk for term in batch]):
+                    for term in batch:
+                        reversion.add_to_revision(term)
+
     def before_import_row(self, row, **kwargs):
         iev_ref = row['ref'].strip()
         #area_id = iev_ref.split('-')[0]                    # 301
@@ -81,6 +307,9 @@ class TermResource(resources.ModelResource):
     class Meta:
         model = Term
         import_id_fields = ['ref']
+        use_bulk = True
+        batch_size = 1000                                   # linhas por bulk_create/bulk_update (e por query às refs existentes)
+        instance_loader_class = BatchInstanceLoader
 
         fields = ['ref', 'subarea', 'id',
             'name_en', 'description_en', 'source_en', 'extra_en',
@@ -169,12 +398,43 @@ class TermResource(resources.ModelResource):
             ]
 
 @admin.register(Term)                                                         # Regista o modelo Term na interface de administração do Django, permitindo a sua gestão através do painel de administração.
-class TermAdmin(VersionAdmin, TranslationAdmin, ImportExportModelAdmin, ExportActionMixin):         # Classe TermAdmin herda de TranslationAdmin, permitindo que a interface de administração suporte a tradução dos campos do modelo Term.
+class TermAdmin(BackgroundJobAdminMixin, VersionAdmin, TranslationAdmin, ImportExportModelAdmin, ExportActionMixin):         # Classe TermAdmin herda de TranslationAdmin, permitindo que a interface de administração suporte a tradução dos campos do modelo Term.
     list_display = ['ref', 'id', 'name', 'area', 'subarea']                   # Define os campos do modelo que serão exibidos na lista de objetos na interface de administração.
     list_filter = ['subarea__area', 'subarea']                                # Adiciona filtros na interface de administração, permitindo filtrar os objetos com base na 'area' associada à 'subarea' ('subarea__area') e na 'subarea'
     search_fields = ['name']
     resource_classes = [TermResource]
 
+    import_export_change_list_template = 'admin/core/term/change_list.html'       # acrescenta o botão da exportação em streaming
+    background_export_form_class = TermStreamExportForm                          # também com a escolha dos idiomas
+
+    def get_urls(self):
+        urls = [
+            path('stream-export/', self.admin_site.admin_view(self.stream_export_view), name='core_term_stream_export'),
+        ]
+        return urls + super().get_urls()
+
+    # Exportação em streaming (core/exporting.py): respeita os filtros e a pesquisa da lista, só com os idiomas escolhidos
+    def stream_export_view(self, request):
+        if not self.has_export_permission(request):
+            raise PermissionDenied
+
+        changelist_filters = request.GET.get('_changelist_filters', '')
+        form = TermStreamExportForm(request.GET if 'format' in request.GET else None)
+        if form.is_valid():
+            changelist_request = copy.copy(request)
+            changelist_request.GET = QueryDict(changelist_filters)
+            queryset = self.get_export_queryset(changelist_request)
+            return stream_terms_response(queryset, form.cleaned_data['format'], form.cleaned_data['languages'])
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Streaming export',
+            'opts': self.model._meta,
+            'form': form,
+            'changelist_filters': changelist_filters,
+        }
+        return TemplateResponse(request, 'admin/core/term/stream_export.html', context)
+
     def area(self, obj):
         return obj.subarea.area
     area.short_description = 'Area'
@@ -188,6 +448,51 @@ class TermAdmin(VersionAdmin, TranslationAdmin, ImportExportModelAdmin, ExportAc
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 
+# Jobs em segundo plano (core/jobs.py): só leitura, criados pelos botões/ações de importação e exportação
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'model_label', 'status', 'progress_display', 'created_by', 'created_at', 'finished_at', 'result_link')
+    list_filter = ('status', 'kind', 'model_label')
+    fields = ('kind', 'model_label', 'status', 'progress_display', 'input_name', 'result_link', 'totals', 'message',
+              'created_by', 'worker', 'created_at', 'started_at', 'finished_at')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('<int:job_id>/download/', self.admin_site.admin_view(self.download_view), name='core_job_download'),
+        ]
+        return urls + super().get_urls()
+
+    # o ficheiro é servido pelo admin (com permissões), não pelo URL público do armazenamento
+    def download_view(self, request, job_id):
+        job = get_object_or_404(Job, pk=job_id)
+        if not self.has_view_permission(request, job) or not job.result_file:
+            raise PermissionDenied
+        return FileResponse(job.result_file.open('rb'), as_attachment=True, filename=os.path.basename(job.result_file.name))
+
+    def progress_display(self, obj):
+        if obj.total is None:
+            return f"{obj.progress}"
+        return f"{obj.progress} / {obj.total} ({obj.progress_percent() or 0}%)"
+    progress_display.short_description = 'Progress'
+
+    def input_name(self, obj):
+        return obj.options.get('file_name', '')
+    input_name.short_description = 'Input file'
+
+    def result_link(self, obj):
+        if not obj.result_file:
+            return ''
+        return format_html('<a href="{}">Download</a>', reverse('admin:core_job_download', args=[obj.pk]))
+    result_link.short_description = 'Result'
+
+
 @admin.register(News)
 class NewsAdmin(VersionAdmin, TranslationAdmin):
     list_display = ('title', 'start_date', 'end_date', 'created_at', 'position', 'active',)
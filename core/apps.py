@@ -4,3 +4,6 @@ from django.apps import AppConfig                           # Importa a classe A
 class CoreConfig(AppConfig):                                # Classe CoreConfig herda de AppConfig, permitindo configurar a aplicação 'core'.
     default_auto_field = 'django.db.models.BigAutoField'    # Define o tipo de campo automático padrão para os modelos como BigAutoField. Nºs inteiros grandes, o valor do campo é gerado automaticamente pela base de dados, começando em 1 e incrementando a cada novo registro.
     name = 'core'                                           # Define o nome da aplicação como 'core'.
+
+    def ready(self):                                        # Liga os signals (core/signals.py) quando a aplicação arranca.
+        from core import signals  # noqa: F401
@@ -0,0 +1,107 @@
+# core/caching.py
+"""
+Contadores de versão para invalidar caches derivadas sem as apagar: as chaves das entradas incluem a versão
+atual, e "invalidar" é só incrementar o contador (as entradas antigas deixam de ser lidas e expiram sozinhas).
+
+Os contadores vivem na base de dados (modelo CacheVersion) e não na cache do Django, que por defeito é memória
+local de cada processo: assim um incremento feito pelo run_jobs ou por outro worker do gunicorn chega a todos.
+Cada processo relê os contadores (uma query para todos) no máximo a cada CACHE_VERSION_CHECK_INTERVAL segundos;
+os seus próprios incrementos vê-os logo.
+
+O incremento é feito depois do commit da transação em curso: antes disso, um pedido concorrente veria a versão
+nova e guardaria nela resultados calculados sem as alterações ainda por gravar.
+
+Cada incremento da versão do vocabulário regista também as refs dos termos alterados (VocabularyChange), na mesma
+transação do incremento: quem lê a versão N encontra já gravadas as alterações até N, e o autocomplete dos outros
+processos (core/suggest.py) atualiza só esses termos em vez de reler o vocabulário inteiro.
+"""
+
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+# muda sempre que um Term é criado, alterado, eliminado ou importado
+VOCABULARY_VERSION_KEY = 'core:version:vocabulary'
+# muda sempre que uma Area é criada, alterada ou eliminada
+AREAS_VERSION_KEY = 'core:version:areas'
+# muda sempre que uma notícia, aviso ou poster é criado, alterado ou eliminado (conteúdo da homepage)
+HOME_VERSION_KEY = 'core:version:home'
+
+# alterações do vocabulário guardadas: um processo mais atrasado do que isto relê o vocabulário inteiro
+VOCABULARY_CHANGES_KEPT = 1000
+
+# cópia local dos contadores e instante (time.monotonic) em que foi lida
+_snapshot = {'versions': {}, 'read_at': None}
+
+
+def _read_versions():
+    from core.models import CacheVersion       # core.models importa (indiretamente) este módulo
+    _snapshot['versions'] = dict(CacheVersion.objects.values_list('key', 'version'))
+    _snapshot['read_at'] = time.monotonic()
+
+
+def get_version(key):
+    read_at = _snapshot['read_at']
+    if read_at is None or time.monotonic() - read_at >= settings.CACHE_VERSION_CHECK_INTERVAL:
+        _read_versions()
+    return _snapshot['versions'].get(key, 0)
+
+
+def _increment(key, on_increment=None):
+    from core.models import CacheVersion
+    with transaction.atomic():
+        if not CacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+            # primeiro incremento: começa no instante atual (ms), para não reutilizar versões de uma cache partilhada
+            # que sobreviva a uma base de dados nova
+            CacheVersion.objects.get_or_create(key=key, defaults={'version': int(time.time() * 1000)})
+            CacheVersion.objects.filter(key=key).update(version=F('version') + 1)
+        if on_increment is not None:
+            # a linha do contador fica bloqueada até ao commit: os incrementos concorrentes esperam por este
+            on_increment(CacheVersion.objects.values_list('version', flat=True).get(key=key))
+    _snapshot['read_at'] = None                 # este processo vê o incremento no próximo get_version
+
+
+def bump_version(key, on_increment=None):
+    """on_increment(versão nova) corre na transação do incremento."""
+    # fora de uma transação, o on_commit corre logo
+    transaction.on_commit(lambda: _increment(key, on_increment))
+
+
+def _record_vocabulary_change(refs, version):
+    from core.models import VocabularyChange
+    VocabularyChange.objects.create(version=version, refs=sorted(refs))
+    VocabularyChange.objects.filter(version__lte=version - VOCABULARY_CHANGES_KEPT).delete()
+
+
+def vocabulary_version():
+    return get_version(VOCABULARY_VERSION_KEY)
+
+
+def bump_vocabulary_version(refs=None):
+    """
+    refs: refs dos termos criados, alterados ou eliminados (vazio se nenhum nome mudou). Sem refs (None) não fica
+    registo da alteração e os outros processos voltam a ler o vocabulário inteiro.
+    """
+    if refs is None:
+        bump_version(VOCABULARY_VERSION_KEY)
+    else:
+        refs = set(refs)
+        bump_version(VOCABULARY_VERSION_KEY, lambda version: _record_vocabulary_change(refs, version))
+
+
+def areas_version():
+    return get_version(AREAS_VERSION_KEY)
+
+
+def bump_areas_version():
+    bump_version(AREAS_VERSION_KEY)
+
+
+def home_version():
+    return get_version(HOME_VERSION_KEY)
+
+
+def bump_home_version():
+    bump_version(HOME_VERSION_KEY)
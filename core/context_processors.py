@@ -6,15 +6,48 @@ que ficam automaticamente disponíveis em todos os templates
 desde que estejam registadas em settings.TEMPLATES[0]['OPTIONS']['context_processors'].
 """
 
+from django.conf import settings
+from django.utils import translation
+
+from .caching import areas_version
 from .models import Area
+from .permissions import get_capabilities
+
+# Áreas da navbar guardadas em memória no processo: {'version': ..., 'areas': {idioma: [{'id', 'name'}, ...]}}
+# A versão (areas_version) é partilhada por todos os processos (core/caching.py): uma Area alterada noutro
+# worker faz reler a lista aqui também.
+_navbar_areas = {'version': None, 'areas': {}}
+
+
+def warm_navbar_areas():
+    """Lê as áreas (uma query) e monta a lista da navbar de todos os idiomas. Chamado no arranque do worker (gunicorn.conf.py)."""
+    version = areas_version()
+    areas = list(Area.objects.order_by('id'))
+    by_language = {}
+    for lang_code, _label in settings.LANGUAGES:
+        with translation.override(lang_code):
+            by_language[lang_code] = [{'id': area.id, 'name': area.name} for area in areas]
+    _navbar_areas.update(version=version, areas=by_language)
+    return by_language
+
+
+def navbar_areas(language=None):
+    """Áreas da navbar no idioma dado (atual por omissão); só volta a ler a base de dados depois de uma Area mudar."""
+    by_language = _navbar_areas['areas']
+    if _navbar_areas['version'] != areas_version():
+        by_language = warm_navbar_areas()
+    language = language or translation.get_language()
+    return by_language.get(language) or by_language.get(settings.LANGUAGE_CODE, [])
+
 
 # Filtrar na navbar por area (garantir que todas as views que usam o base.html enviem as áreas no contexto)
 def areas_dropdown(request):
     """
     Retorna todas as áreas (ordenadas por id) para popular o menu de seleção na navbar.
+    Vêm da lista em memória (navbar_areas), sem query por pedido.
     """
     return {
-        'all_areas': Area.objects.all().order_by('id')
+        'all_areas': navbar_areas()
     }
 
 # Para exibir certas funcionalidades na front end, tal como o Painel Admin.
@@ -23,5 +56,4 @@ def user_permissions(request):
     Retorna um booleano indicando se o utilizador atual é Admin, Gestor ou Superuser,
     para condicionar exibição de funcionalidades no frontend.
     """
-    is_admin_or_gestor = request.user.groups.filter(name__in=['Admin', 'Gestor']).exists() or request.user.is_superuser
-    return {'is_admin_or_gestor': is_admin_or_gestor}
+    return {'is_admin_or_gestor': get_capabilities(request).is_admin_or_gestor}
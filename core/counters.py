@@ -0,0 +1,43 @@
+# core/counters.py
+"""
+Contadores guardados nas áreas e subáreas (Area.subarea_count, Area.term_count, SubArea.term_count), lidos pelas
+listas da hierarquia em vez de um COUNT com JOIN e GROUP BY sobre a tabela dos termos em cada pedido.
+
+Os sinais de Term e SubArea (core/signals.py) atualizam-nos com UPDATE ... SET x = x + 1 (F()): cada alteração é
+uma só instrução na base de dados, sem ler e reescrever o valor (dois pedidos ao mesmo tempo não perdem contagens).
+A importação em bloco não envia sinais, por isso no fim recalcula as subáreas importadas (recount), e o comando
+repair_counters recalcula tudo.
+"""
+
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Greatest
+
+from core.models import Area, SubArea, Term
+
+
+def term_count_changed(subarea_id, delta):
+    """Soma delta (+1/-1) aos termos da subárea e da sua área."""
+    SubArea.objects.filter(pk=subarea_id).update(term_count=Greatest(F('term_count') + delta, 0))
+    Area.objects.filter(subareas=subarea_id).update(term_count=Greatest(F('term_count') + delta, 0))
+
+
+def subarea_count_changed(area_id, delta):
+    Area.objects.filter(pk=area_id).update(subarea_count=Greatest(F('subarea_count') + delta, 0))
+
+
+def recount(subarea_refs=None):
+    """Recalcula os contadores a partir das tabelas: de todas as subáreas e áreas, ou só das subáreas dadas (e das suas áreas)."""
+    subareas = SubArea.objects.all()
+    areas = Area.objects.all()
+    if subarea_refs is not None:
+        subareas = subareas.filter(pk__in=list(subarea_refs))
+        areas = areas.filter(pk__in=subareas.values('area_id'))
+
+    terms = Term.objects.filter(subarea=OuterRef('pk')).order_by().values('subarea').annotate(n=Count('pk')).values('n')
+    subareas.update(term_count=Coalesce(Subquery(terms), 0))
+
+    children = SubArea.objects.filter(area=OuterRef('pk')).order_by().values('area')
+    areas.update(
+        subarea_count=Coalesce(Subquery(children.annotate(n=Count('pk')).values('n')), 0),
+        term_count=Coalesce(Subquery(children.annotate(n=Sum('term_count')).values('n')), 0),
+    )
@@ -0,0 +1,116 @@
+# core/exporting.py
+"""
+Exportação dos termos em streaming, alternativa ao export do django-import-export (que monta o dataset
+inteiro em memória antes de responder).
+
+As linhas vêm de values_list(...).iterator(chunk_size) (sem instâncias do modelo) e são escritas à medida:
+CSV e JSON Lines vão diretamente para o StreamingHttpResponse, por isso o primeiro byte sai logo. O XLSX não
+é streaming: o openpyxl (mesmo em modo write_only) só escreve o zip no save(), por isso o ficheiro é montado
+num ficheiro temporário e só começa a ser enviado (aos blocos) quando estiver completo; para vocabulários
+grandes, a exportação em segundo plano (core/jobs.py) evita esperar com o pedido aberto. Em qualquer caso a
+memória usada não depende do nº de termos.
+As colunas são as mesmas da importação (TermResource), por isso o ficheiro pode voltar a ser importado.
+"""
+
+import csv
+import json
+import tempfile
+from datetime import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from modeltranslation.utils import build_localized_fieldname
+
+# campos traduzidos exportados, por idioma (na mesma ordem do TermResource)
+EXPORT_FIELDS = ('name', 'description', 'source', 'extra')
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+
+CHUNK_SIZE = 2000                       # termos lidos da base de dados de cada vez
+FILE_CHUNK_SIZE = 64 * 1024             # bytes enviados de cada vez (XLSX)
+
+
+def export_columns(languages=None):
+    """Colunas exportadas: ref, subarea, id, os campos traduzidos dos idiomas escolhidos (todos por omissão), image, created, updated."""
+    if languages is None:
+        languages = [lang_code for lang_code, _label in settings.LANGUAGES]
+    translated = [build_localized_fieldname(field, lang_code) for lang_code in languages for field in EXPORT_FIELDS]
+    return ['ref', 'subarea', 'id'] + translated + ['image', 'created', 'updated']
+
+
+def iter_rows(queryset, columns, chunk_size=CHUNK_SIZE):
+    # 'subarea' no ficheiro é a ref da subárea (a chave primária), como no TermResource
+    fields = ['subarea_id' if column == 'subarea' else column for column in columns]
+    return queryset.order_by('ref').values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """Objeto com write() que devolve o que recebe, para usar o csv.writer num gerador."""
+
+    def write(self, value):
+        return value
+
+
+def local_datetime(value):
+    # datas na hora local e sem fuso: é o que o Excel aceita e o que a importação (DateTimeWidget) sabe ler
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def stream_csv(rows, columns):
+    writer = csv.writer(Echo())
+    yield '\ufeff'                             # BOM: o Excel reconhece o UTF-8
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([
+            '' if value is None else f"{value:%Y-%m-%d %H:%M:%S}" if isinstance(value, datetime) else value
+            for value in map(local_datetime, row)
+        ])
+
+
+def stream_jsonl(rows, columns):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def stream_xlsx(rows, columns):
+    from openpyxl import Workbook
+
+    with tempfile.TemporaryFile() as handle:
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet('Terms')
+        sheet.append(columns)
+        for row in rows:
+            sheet.append([local_datetime(value) for value in row])
+        workbook.save(handle)
+        handle.seek(0)
+        while True:
+            data = handle.read(FILE_CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+
+
+STREAM_WRITERS = {
+    'csv': stream_csv,
+    'jsonl': stream_jsonl,
+    'xlsx': stream_xlsx,
+}
+
+
+def stream_terms_response(queryset, file_format, languages=None):
+    """StreamingHttpResponse com os termos do queryset no formato pedido (csv, jsonl ou xlsx)."""
+    content_type, extension = EXPORT_FORMATS[file_format]
+    columns = export_columns(languages)
+    rows = iter_rows(queryset, columns)
+    response = StreamingHttpResponse(STREAM_WRITERS[file_format](rows, columns), content_type=content_type)
+    filename = f"terms-{timezone.now():%Y-%m-%d-%H%M}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,47 @@
+# core/forms.py
+import os
+
+from django import forms
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+
+
+# Formato das exportações em segundo plano (Area, SubArea e Term, ver core/jobs.py)
+class BackgroundExportForm(forms.Form):
+    format = forms.ChoiceField(
+        label=_('Format'),
+        choices=[('csv', 'CSV'), ('xlsx', 'XLSX'), ('jsonl', 'JSON Lines')],
+        initial='csv',
+    )
+
+
+# Opções da exportação em streaming dos termos (TermAdmin, ver core/exporting.py), também usadas em segundo plano
+class TermStreamExportForm(BackgroundExportForm):
+    languages = forms.MultipleChoiceField(
+        label=_('Languages'),
+        choices=settings.LANGUAGES,
+        required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text=_('Leave empty to export every language.'),
+    )
+
+    def clean_languages(self):
+        # a ordem das colunas segue a de settings.LANGUAGES, não a ordem em que foram escolhidos
+        selected = set(self.cleaned_data['languages'])
+        return [lang_code for lang_code, _label in settings.LANGUAGES if lang_code in selected] or None
+
+
+# Importação em segundo plano (Area, SubArea e Term, ver core/jobs.py)
+class BackgroundImportForm(forms.Form):
+    file = forms.FileField(label=_('File'), help_text=_('CSV or XLSX, with the same columns as the normal import.'))
+    dry_run = forms.BooleanField(
+        label=_('Dry run'),
+        required=False,
+        help_text=_('Validate the file and count the changes without saving anything.'),
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data['file']
+        if os.path.splitext(file.name)[1].lower() not in ('.csv', '.xlsx'):
+            raise forms.ValidationError(_('Only CSV and XLSX files can be imported.'))
+        return file
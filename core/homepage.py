@@ -0,0 +1,67 @@
+# core/homepage.py
+"""
+Conteúdo da homepage (avisos, notícias, posters e últimos termos adicionados) em cache, por idioma.
+
+Guardado em duas partes, pelo que cada tipo de visitante vê: os posters (home_posters), que são tudo o que os
+visitantes anónimos e os utilizadores ainda não aprovados veem, e o resto (home_content), só para os aprovados.
+
+As notícias e os avisos têm uma janela de visibilidade (start_date/end_date, show_from/hide_after): a entrada
+da cache expira no próximo instante em que uma notícia ou aviso ativo aparece ou desaparece (pela linha
+temporal de core/scheduling.py), por isso continua certa sem comparar as datas com now() em cada pedido. Alterar notícias, avisos ou posters (HOME_VERSION_KEY,
+ver core/signals.py) ou os termos (vocabulary_version) invalida-a antes disso.
+
+Só o conteúdo é guardado: o estado do utilizador (email verificado, aprovado, botões do painel) é calculado
+pela view em cada pedido.
+"""
+
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import get_language
+
+from core.caching import home_version, vocabulary_version
+from core.models import News, Poster, Term, Warning
+from core.scheduling import schedule_timeline
+
+LATEST_TERMS = 6                # nº de termos em "Recently added terms"
+
+
+def next_transition(now):
+    """Próximo instante (depois de now) em que uma notícia ou aviso ativo aparece ou desaparece; None se não houver."""
+    moments = [schedule_timeline(model).next_transition(now) for model in (News, Warning)]
+    return min((moment for moment in moments if moment is not None), default=None)
+
+
+def cache_timeout(transition, now):
+    """Segundos até à transição (arredondado para cima: só expira depois dela), no máximo HOME_CACHE_TIMEOUT."""
+    if transition is None:
+        return settings.HOME_CACHE_TIMEOUT
+    seconds = math.ceil((transition - now).total_seconds())
+    return max(1, min(seconds, settings.HOME_CACHE_TIMEOUT))
+
+
+def home_posters():
+    """Posters ativos, no idioma atual."""
+    key = f"core:home:posters:{home_version()}:{get_language()}"
+    posters = cache.get(key)
+    if posters is None:
+        posters = list(Poster.objects.filter(active=True).order_by('position', '-id'))
+        cache.set(key, posters, settings.HOME_CACHE_TIMEOUT)
+    return posters
+
+
+def home_content():
+    """{'news', 'warnings', 'latest_terms'} visíveis agora, no idioma atual (para os utilizadores aprovados)."""
+    key = f"core:home:{home_version()}:{vocabulary_version()}:{get_language()}"
+    content = cache.get(key)
+    if content is None:
+        now = timezone.now()
+        content = {
+            'news': list(News.objects.visible().order_by('position', '-created_at')),
+            'warnings': list(Warning.objects.visible().order_by('position', '-created_at')),
+            'latest_terms': list(Term.objects.localized_only('ref', 'name').order_by('-created')[:LATEST_TERMS]),
+        }
+        cache.set(key, content, cache_timeout(next_transition(now), now))
+    return content
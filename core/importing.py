@@ -0,0 +1,234 @@
+# core/importing.py
+"""
+Peças da importação em bloco dos termos (TermResource com use_bulk do django-import-export).
+
+Em vez de um Term.save por linha (SELECT extra, índice de pesquisa, commit próprio), as linhas são
+resolvidas contra as refs existentes um lote de cada vez, o carimbo published_at_<lang> é calculado em
+memória e a escrita é feita com bulk_create/bulk_update. Como o bulk não chama save() nem envia sinais,
+as estruturas derivadas (índice de pesquisa, autocomplete, cache de pesquisa) são atualizadas no fim.
+
+Para ficheiros grandes há também um leitor em streaming (openpyxl em modo read_only para XLSX, módulo csv
+para CSV) que entrega as linhas ao TermResource em blocos de batch_size: a memória usada depende do tamanho
+do bloco e não do ficheiro (o tablib, usado no admin, carrega o livro inteiro). Ver import_file() e import_terms().
+"""
+
+import csv
+import os
+
+import reversion
+import tablib
+from django.db import transaction
+from import_export.instance_loaders import ModelInstanceLoader
+from import_export.widgets import ForeignKeyWidget
+
+from core.caching import bump_vocabulary_version
+from core.counters import recount
+from core.search import index_terms
+from core.suggest import prefix_index
+from core.term_storage import normalized_storage_enabled, sync_translations
+
+
+class BatchInstanceLoader(ModelInstanceLoader):
+    """
+    Procura os termos existentes por lotes de refs (uma query por lote de batch_size linhas),
+    em vez de uma query por linha, sem carregar o ficheiro inteiro de uma vez.
+    """
+
+    def __init__(self, resource, dataset=None):
+        super().__init__(resource, dataset)
+        self.batch_size = resource._meta.batch_size or 1000
+        column = dataset.headers.index('ref') if dataset is not None and 'ref' in dataset.headers else None
+        self.refs = [str(row[column] or '').strip() for row in dataset] if column is not None else []
+        self.positions = {}
+        for position, ref in enumerate(self.refs):
+            self.positions.setdefault(ref, position)
+        self.loaded_batches = set()
+        self.instances = {}
+
+    def get_instance(self, row):
+        ref = str(row.get('ref') or '').strip()
+        # ref que já apareceu numa linha anterior desta importação (o termo pode ainda não estar gravado)
+        imported = getattr(self.resource, 'imported_terms', None)
+        if imported and ref in imported:
+            return imported[ref]
+        position = self.positions.get(ref)
+        if position is None:
+            return super().get_instance(row)            # ref que não vinha no ficheiro original
+
+        batch = position // self.batch_size
+        if batch not in self.loaded_batches:
+            refs = self.refs[batch * self.batch_size:(batch + 1) * self.batch_size]
+            self.instances.update(self.get_queryset().in_bulk(refs))
+            self.loaded_batches.add(batch)
+        return self.instances.get(ref)
+
+
+class CachedForeignKeyWidget(ForeignKeyWidget):
+    """ForeignKeyWidget que carrega todos os objetos numa só query, em vez de um get() por linha."""
+
+    def __init__(self, model, field='pk', **kwargs):
+        super().__init__(model, field=field, **kwargs)
+        self.objects = None
+
+    def reset(self):
+        self.objects = None
+
+    def clean(self, value, row=None, **kwargs):
+        if not value:
+            return None
+        if self.objects is None:
+            self.objects = {str(getattr(obj, self.field)): obj for obj in self.get_queryset(value, row, **kwargs)}
+        try:
+            return self.objects[str(value).strip()]
+        except KeyError:
+            raise self.model.DoesNotExist(f"{self.model._meta.verbose_name} {value} does not exist.")
+
+
+def refresh_imported_terms(terms, batch_size=500):
+    """Atualiza o que o Term.save e os sinais fariam termo a termo, depois de uma importação em bloco."""
+    terms = list(terms)
+    if not terms:
+        return
+    for start in range(0, len(terms), batch_size):
+        batch = terms[start:start + batch_size]
+        index_terms(batch)
+        if normalized_storage_enabled():
+            sync_translations(batch)
+    for term in terms:
+        prefix_index.update_term(term)
+    recount({term.subarea_id for term in terms})           # contadores de termos das subáreas/áreas (sem sinais no bulk)
+    bump_vocabulary_version([term.ref for term in terms])
+
+
+class ImportFailed(Exception):
+    """Uma importação em streaming com erros: nada foi gravado (tudo corre numa só transação)."""
+
+    def __init__(self, totals, errors):
+        super().__init__(errors[0] if errors else 'Import failed.')
+        self.totals = totals
+        self.errors = errors
+
+
+def _clean_headers(values):
+    return [str(value).strip() if value is not None else '' for value in values]
+
+
+def read_csv_rows(path, encoding='utf-8-sig'):
+    """Cabeçalhos e depois cada linha de um CSV, uma de cada vez."""
+    with open(path, newline='', encoding=encoding) as handle:
+        reader = csv.reader(handle)
+        yield _clean_headers(next(reader, []))
+        yield from reader
+
+
+def read_xlsx_rows(path):
+    """Cabeçalhos e depois cada linha da primeira folha de um XLSX, em modo read_only (sem carregar o livro)."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        yield _clean_headers(next(rows, ()))
+        yield from rows
+    finally:
+        workbook.close()
+
+
+def read_chunks(path, batch_size=1000, file_format=None):
+    """Lê um CSV/XLSX em streaming e devolve tablib.Dataset de no máximo batch_size linhas cada."""
+    file_format = (file_format or os.path.splitext(path)[1].lstrip('.')).lower()
+    if file_format == 'csv':
+        rows = read_csv_rows(path)
+    elif file_format == 'xlsx':
+        rows = read_xlsx_rows(path)
+    else:
+        raise ValueError(f"Unsupported import format: {file_format}")
+
+    headers = next(rows, [])
+    width = len(headers)
+    chunk = []
+    for row in rows:
+        row = list(row)[:width]
+        if not any(value not in (None, '') for value in row):
+            continue                                    # linhas vazias (frequentes no fim das folhas XLSX)
+        chunk.append(row + [None] * (width - len(row)))
+        if len(chunk) == batch_size:
+            yield tablib.Dataset(*chunk, headers=list(headers))
+            chunk = []
+    if chunk:
+        yield tablib.Dataset(*chunk, headers=list(headers))
+
+
+def count_rows(path, file_format=None):
+    """Nº de linhas de dados de um CSV/XLSX (para mostrar o progresso), ou None se não for possível saber sem ler tudo."""
+    file_format = (file_format or os.path.splitext(path)[1].lstrip('.')).lower()
+    if file_format == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as handle:
+            return max(sum(1 for _row in csv.reader(handle)) - 1, 0)
+    if file_format == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.worksheets[0].max_row                # vem da dimensão gravada na folha (pode faltar)
+        finally:
+            workbook.close()
+        return max(max_row - 1, 0) if max_row else None
+    return None
+
+
+def import_file(resource_class, path, batch_size=1000, dry_run=False, user=None, file_format=None, progress=None,
+                file_name=None):
+    """
+    Importa um CSV/XLSX em blocos pelo resource dado (TermResource, AreaResource, ...).
+    Tudo numa só transação: se algum bloco tiver erros, nada fica gravado e é levantado ImportFailed.
+    Cada bloco fica numa revisão do reversion (uma só revisão para o ficheiro inteiro guardaria todas as versões em memória).
+    progress(nº de linhas lidas), se dado, é chamado no fim de cada bloco.
+    file_name: nome do ficheiro no comentário das revisões (por omissão, o de path).
+    Devolve os totais (new, update, skip, ...).
+    """
+    totals = {}
+    errors = []
+    offset = 0
+    try:
+        with transaction.atomic():
+            for chunk in read_chunks(path, batch_size=batch_size, file_format=file_format):
+                resource = resource_class()
+                with reversion.create_revision():
+                    if user is not None:
+                        reversion.set_user(user)
+                    reversion.set_comment(f"Import: {file_name or os.path.basename(path)}")
+                    result = resource.import_data(chunk, dry_run=dry_run, use_transactions=True)
+
+                for key, value in result.totals.items():
+                    totals[key] = totals.get(key, 0) + value
+                errors.extend(str(error.error) for error in result.base_errors)
+                errors.extend(
+                    f"Row {offset + row.number}: {error.error}" for row in result.error_rows for error in row.errors
+                )
+                errors.extend(
+                    f"Row {offset + row.number}: {'; '.join(row.error.messages)}" for row in result.invalid_rows
+                )
+                if errors:
+                    raise ImportFailed(totals, errors)
+                offset += len(chunk)
+                if progress is not None:
+                    progress(offset)
+
+            if dry_run:
+                transaction.set_rollback(True)
+    except Exception:
+        # a transação foi desfeita (erros nas linhas, IntegrityError, ...), mas o autocomplete em memória pode já ter
+        # os termos dos blocos anteriores: volta a lê-lo da base de dados
+        if prefix_index.loaded:
+            prefix_index.build()
+        raise
+    return totals
+
+
+def import_terms(path, batch_size=1000, dry_run=False, user=None, file_format=None, progress=None):
+    """Importa termos de um CSV/XLSX em blocos, pelo mesmo TermResource do admin (modo bulk). Ver import_file()."""
+    from core.admin import TermResource
+
+    return import_file(TermResource, path, batch_size=batch_size, dry_run=dry_run, user=user,
+                       file_format=file_format, progress=progress)
@@ -0,0 +1,230 @@
+# core/jobs.py
+"""
+Fila de jobs em segundo plano guardada na base de dados (modelo Job), sem broker externo.
+
+As importações e exportações grandes do admin (Term, Area, SubArea) deixam de correr dentro do pedido:
+o admin grava um Job "queued" (com o ficheiro enviado, no caso da importação) e responde logo.
+O comando "python manage.py run_jobs" (processo "worker" do Procfile) reclama os jobs por ordem de criação
+e executa cada um num processo de um ProcessPoolExecutor, a gravar o progresso na própria linha do Job,
+que o admin mostra. O resultado de uma exportação fica em Job.result_file.
+
+Reclamar um job é um UPDATE condicional (status queued -> running): com vários run_jobs a ler a mesma fila,
+só um deles fica com cada job. Enquanto executa um job, o run_jobs renova o seu heartbeat a cada volta, mesmo
+que o job não consiga gravar progresso (ex: uma importação numa só transação em SQLite). Um job "running" sem
+heartbeat há mais de JOB_STALE_AFTER segundos (ex: o run_jobs foi terminado a meio) é marcado como falhado.
+
+Os contadores de versão das caches derivadas estão na base de dados (core/caching.py): os processos web veem
+uma importação feita aqui ao fim de no máximo CACHE_VERSION_CHECK_INTERVAL segundos, com qualquer CACHE_BACKEND.
+"""
+
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+
+from core.exporting import CHUNK_SIZE, EXPORT_FORMATS, STREAM_WRITERS, export_columns, iter_rows
+from core.importing import ImportFailed, count_rows, import_file
+from core.models import Job, Term
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS = 100                # erros de uma importação guardados em Job.message
+
+
+def get_resource_class(model_label):
+    from core.admin import AreaResource, SubAreaResource, TermResource
+
+    return {
+        'core.area': AreaResource,
+        'core.subarea': SubAreaResource,
+        'core.term': TermResource,
+    }[model_label]
+
+
+def enqueue_import(model, uploaded_file, user=None, dry_run=False):
+    job = Job(kind=Job.KIND_IMPORT, model_label=model._meta.label_lower, created_by=user,
+              options={'dry_run': dry_run, 'file_name': os.path.basename(uploaded_file.name)})
+    job.input_file.save(os.path.basename(uploaded_file.name), uploaded_file, save=False)
+    job.save()
+    return job
+
+
+def enqueue_export(model, file_format, user=None, pks=None, languages=None):
+    """Exportação de todos os objetos do modelo, ou só dos pks dados (ex: os filtrados/selecionados no admin)."""
+    options = {'format': file_format}
+    if pks is not None:
+        options['pks'] = list(pks)
+    if languages:
+        options['languages'] = list(languages)
+    return Job.objects.create(kind=Job.KIND_EXPORT, model_label=model._meta.label_lower, created_by=user, options=options)
+
+
+def claim_job(worker):
+    """Passa o job em espera mais antigo para "running" em nome deste worker. Devolve o id, ou None se a fila estiver vazia."""
+    queued = Job.objects.filter(status=Job.STATUS_QUEUED).order_by('created_at', 'pk').values_list('pk', flat=True)
+    for job_id in queued[:10]:
+        now = timezone.now()
+        claimed = Job.objects.filter(pk=job_id, status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            return job_id
+    return None
+
+
+def touch_jobs(job_ids):
+    """Renova o heartbeat dos jobs que este run_jobs está a executar (os processos deles continuam vivos)."""
+    return Job.objects.filter(pk__in=list(job_ids), status=Job.STATUS_RUNNING).update(heartbeat_at=timezone.now())
+
+
+def fail_stale_jobs(alive=()):
+    """
+    Jobs "running" sem sinal de vida há mais de JOB_STALE_AFTER segundos (o worker morreu a meio).
+    alive: ids dos jobs que o próprio run_jobs está a executar, que nunca são dados como parados.
+    """
+    limit = timezone.now() - timedelta(seconds=settings.JOB_STALE_AFTER)
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, heartbeat_at__lt=limit).exclude(pk__in=list(alive))
+    return stale.update(
+        status=Job.STATUS_FAILED, finished_at=timezone.now(), message='The worker stopped before the job finished.',
+    )
+
+
+class JobProgress:
+    """
+    Grava o progresso de um job, no máximo uma vez por 'interval' segundos.
+
+    A importação corre numa só transação: escrito pela mesma ligação, o progresso só seria visível no fim.
+    Nesse caso é usada uma segunda ligação à base de dados. Em SQLite a base de dados fica bloqueada para
+    escrita até ao commit da importação, por isso aí só o valor final é gravado.
+    """
+
+    def __init__(self, job, interval=1.0):
+        self.job = job
+        self.interval = interval
+        self.last = 0.0
+        self.side_connection = None
+
+    def set_total(self, total):
+        self.job.total = total
+        Job.objects.filter(pk=self.job.pk).update(total=total, heartbeat_at=timezone.now())
+
+    def __call__(self, done):
+        self.job.progress = done
+        if time.monotonic() - self.last < self.interval:
+            return
+        self.last = time.monotonic()
+        now = timezone.now()
+        if not connection.in_atomic_block:
+            Job.objects.filter(pk=self.job.pk).update(progress=done, heartbeat_at=now)
+        elif connection.vendor != 'sqlite':
+            if self.side_connection is None:
+                self.side_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+            with self.side_connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {Job._meta.db_table} SET progress = %s, heartbeat_at = %s WHERE id = %s",
+                    [done, self.side_connection.ops.adapt_datetimefield_value(now), self.job.pk],
+                )
+
+    def close(self):
+        if self.side_connection is not None:
+            self.side_connection.close()
+
+
+def counted(rows, progress):
+    count = 0
+    for count, row in enumerate(rows, 1):
+        yield row
+        if count % CHUNK_SIZE == 0:
+            progress(count)
+    progress(count)
+
+
+def run_import(job, progress):
+    # o ficheiro pode estar num armazenamento remoto (bucket): é copiado para um ficheiro local, lido em streaming
+    extension = os.path.splitext(job.input_file.name)[1].lower()
+    with tempfile.NamedTemporaryFile(suffix=extension) as handle:
+        with job.input_file.open('rb') as source:
+            shutil.copyfileobj(source, handle)
+        handle.flush()
+        progress.set_total(count_rows(handle.name))
+        job.totals = import_file(
+            get_resource_class(job.model_label), handle.name,
+            dry_run=job.options.get('dry_run', False), user=job.created_by, progress=progress,
+            file_name=job.options.get('file_name'),
+        )
+    summary = ', '.join(f"{key}: {value}" for key, value in job.totals.items() if value)
+    return f"{'Dry run' if job.options.get('dry_run') else 'Imported'} ({summary or 'no rows'})."
+
+
+def export_rows(job):
+    """(linhas, colunas, nº de linhas) a exportar. Os termos são lidos em streaming, como na exportação do admin."""
+    pks = job.options.get('pks')
+    if job.model_label == 'core.term':
+        columns = export_columns(job.options.get('languages'))
+        if pks is None:
+            return iter_rows(Term.objects.all(), columns), columns, Term.objects.count()
+        pks = sorted(pks)
+        rows = itertools.chain.from_iterable(
+            iter_rows(Term.objects.filter(pk__in=pks[start:start + CHUNK_SIZE]), columns)
+            for start in range(0, len(pks), CHUNK_SIZE)
+        )
+        return rows, columns, len(pks)
+
+    # áreas e subáreas são poucas: o export do resource (o mesmo do botão Export do admin) chega
+    resource_class = get_resource_class(job.model_label)
+    queryset = resource_class._meta.model.objects.all()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    dataset = resource_class().export(queryset=queryset)
+    return (dataset[index] for index in range(len(dataset))), list(dataset.headers), len(dataset)
+
+
+def run_export(job, progress):
+    file_format = job.options.get('format', 'csv')
+    _content_type, extension = EXPORT_FORMATS[file_format]
+    rows, columns, total = export_rows(job)
+    progress.set_total(total)
+    with tempfile.TemporaryFile() as handle:
+        for data in STREAM_WRITERS[file_format](counted(rows, progress), columns):
+            handle.write(data.encode('utf-8') if isinstance(data, str) else data)
+        handle.seek(0)
+        name = f"{job.model_label.split('.')[-1]}-{timezone.localtime():%Y-%m-%d-%H%M}.{extension}"
+        job.result_file.save(name, File(handle), save=False)
+    return f"Exported {job.progress} rows."
+
+
+def run_job(job_id):
+    """Executa um job já reclamado (ver claim_job), num processo do run_jobs. Devolve o status final."""
+    job = Job.objects.select_related('created_by').get(pk=job_id)
+    progress = JobProgress(job)
+    job.totals = {}
+    try:
+        if job.kind == Job.KIND_IMPORT:
+            message = run_import(job, progress)
+        else:
+            message = run_export(job, progress)
+        job.status = Job.STATUS_DONE
+    except ImportFailed as error:
+        job.totals = error.totals
+        message = '\n'.join(error.errors[:MAX_ERRORS])
+        job.status = Job.STATUS_FAILED
+    except Exception:
+        logger.exception("Job %s failed.", job_id)
+        message = traceback.format_exc()
+        job.status = Job.STATUS_FAILED
+    finally:
+        progress.close()
+
+    job.message = message
+    job.finished_at = job.heartbeat_at = timezone.now()
+    job.save(update_fields=['status', 'message', 'totals', 'progress', 'result_file', 'finished_at', 'heartbeat_at'])
+    return job.status
@@ -0,0 +1,142 @@
+# core/management/commands/compact_revisions.py
+import re
+from datetime import timedelta
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import Length, Right
+from django.utils import timezone
+from reversion.models import Revision, Version
+
+from core.revision_storage import FORMAT as DELTA_FORMAT
+
+# fim de uma versão em formato "delta" que é um delta (ver core/revision_storage.py): ...,"base":<id>,"n":<k>}]
+# (os snapshots acabam em "}}]"); basta ler o fim do texto para saber de que snapshot depende
+DELTA_TAIL = re.compile(r'"base":(\d+),"n":\d+\}\]$')
+
+
+class Command(BaseCommand):
+    help = ("Compacta o histórico do reversion por objeto: mantém todas as versões recentes, uma por dia durante "
+            "um período e uma por mês depois disso. Apaga por lotes e indica o espaço libertado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', dest='models',
+                            help="Modelo a compactar (ex: core.term); pode repetir-se. Por omissão Area, SubArea e Term.")
+        parser.add_argument('--keep-all-days', type=int, default=30,
+                            help="Dias em que todas as versões são mantidas.")
+        parser.add_argument('--daily-days', type=int, default=365,
+                            help="Até esta idade (dias) é mantida a última versão de cada dia; depois, a última de cada mês.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Versões apagadas por DELETE (e por transação).")
+        parser.add_argument('--dry-run', action='store_true', help="Só mostra o que seria apagado.")
+
+    def handle(self, *args, **options):
+        if options['daily_days'] < options['keep_all_days']:
+            raise CommandError("--daily-days must be greater than or equal to --keep-all-days.")
+
+        labels = options['models'] or ['core.area', 'core.subarea', 'core.term']
+        now = timezone.now()
+        self.keep_all_after = now - timedelta(days=options['keep_all_days'])
+        self.daily_after = now - timedelta(days=options['daily_days'])
+
+        total_deleted = total_size = 0
+        for label in labels:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError):
+                raise CommandError(f"Unknown model: {label}")
+            scanned, to_delete, size = self.plan(model)
+            if not options['dry_run']:
+                self.delete_versions(to_delete, options['batch_size'])
+            self.stdout.write(f"{label}: {scanned} versões, {len(to_delete)} a apagar ({self.format_size(size)}).")
+            total_deleted += len(to_delete)
+            total_size += size
+
+        revisions = 0 if options['dry_run'] else self.delete_empty_revisions(options['batch_size'])
+        verb = "seriam apagadas" if options['dry_run'] else "apagadas"
+        self.stdout.write(self.style.SUCCESS(
+            f"{total_deleted} versões {verb}, {revisions} revisões vazias apagadas, "
+            f"{self.format_size(total_size)} de dados serializados libertados."
+        ))
+        if total_deleted and not options['dry_run']:
+            self.stdout.write("O espaço em disco só é devolvido depois de um VACUUM da base de dados.")
+
+    def plan(self, model):
+        """Percorre as versões do modelo (por objeto, da mais antiga para a mais recente) e devolve as que não ficam."""
+        content_type = ContentType.objects.get_for_model(model)
+        rows = (
+            Version.objects.filter(content_type=content_type)
+            .order_by('object_id', 'pk')
+            .values_list('pk', 'object_id', 'format', 'revision__date_created',
+                         Length('serialized_data') + Length('object_repr'), Right('serialized_data', 40))
+            .iterator(chunk_size=5000)
+        )
+        scanned = 0
+        to_delete = []
+        size = 0
+        group = []
+        current = None
+        for row in rows:
+            scanned += 1
+            if row[1] != current and group:
+                size += self.compact_object(group, to_delete)
+                group = []
+            current = row[1]
+            group.append(row)
+        if group:
+            size += self.compact_object(group, to_delete)
+        return scanned, to_delete, size
+
+    def bucket(self, date_created):
+        """Período da versão: None (mantém-se sempre), o dia ou o mês."""
+        if date_created >= self.keep_all_after:
+            return None
+        local = timezone.localtime(date_created)
+        if date_created >= self.daily_after:
+            return local.date()
+        return (local.year, local.month)
+
+    def compact_object(self, versions, to_delete):
+        # fica a última versão de cada período (e a última de todas); percorre da mais recente para a mais antiga
+        kept = {versions[-1][0]}
+        seen_buckets = set()
+        for pk, _object_id, _format, date_created, _size, _tail in reversed(versions):
+            bucket = self.bucket(date_created)
+            if bucket is None or bucket not in seen_buckets:
+                kept.add(pk)
+                seen_buckets.add(bucket)
+
+        # os snapshots de que dependem os deltas que ficam também ficam
+        for pk, _object_id, version_format, _date, _size, tail in versions:
+            if pk in kept and version_format == DELTA_FORMAT:
+                match = DELTA_TAIL.search(tail or '')
+                if match:
+                    kept.add(int(match.group(1)))
+
+        size = 0
+        for pk, _object_id, _format, _date, version_size, _tail in versions:
+            if pk not in kept:
+                to_delete.append(pk)
+                size += version_size or 0
+        return size
+
+    def delete_versions(self, pks, batch_size):
+        # lotes pequenos, cada um na sua transação (autocommit): não bloqueia a tabela durante a compactação toda
+        for start in range(0, len(pks), batch_size):
+            Version.objects.filter(pk__in=pks[start:start + batch_size]).delete()
+
+    def delete_empty_revisions(self, batch_size):
+        deleted = 0
+        while True:
+            batch = list(Revision.objects.filter(version__isnull=True).values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return deleted
+            Revision.objects.filter(pk__in=batch).delete()
+            deleted += len(batch)
+
+    def format_size(self, size):
+        for unit in ('B', 'KB', 'MB'):
+            if size < 1024:
+                return f"{size:.0f} {unit}"
+            size /= 1024
+        return f"{size:.1f} GB"
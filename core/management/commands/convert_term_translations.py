@@ -0,0 +1,57 @@
+# core/management/commands/convert_term_translations.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.caching import bump_vocabulary_version
+from core.models import Term
+from core.search import index_terms
+from core.term_storage import apply_translations, sync_translations
+
+
+class Command(BaseCommand):
+    help = ("Converte as traduções dos termos entre as colunas do modeltranslation (name_<lang>, ...) "
+            "e a tabela estreita TermTranslation.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Nº de termos convertidos por transação.")
+        parser.add_argument('--to-wide', action='store_true',
+                            help="Copia a tabela TermTranslation para as colunas (em vez das colunas para a tabela).")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        last_ref = None
+        while True:
+            # percorre por ref (chave primária) em lotes, sem OFFSET
+            batch = Term.objects.order_by('ref')
+            if last_ref is not None:
+                batch = batch.filter(ref__gt=last_ref)
+            if options['to_wide']:
+                batch = batch.prefetch_related('translations')
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+
+            if options['to_wide']:
+                self.copy_to_wide(batch)
+            else:
+                sync_translations(batch)
+
+            total += len(batch)
+            last_ref = batch[-1].ref
+            self.stdout.write(f"{total} termos convertidos...")
+
+        if options['to_wide']:
+            bump_vocabulary_version()
+        self.stdout.write(self.style.SUCCESS(f"{total} termos convertidos."))
+
+    def copy_to_wide(self, terms):
+        # grava só as colunas traduzidas (sem Term.save, para não voltar a carimbar published_at)
+        columns = set()
+        for term in terms:
+            columns.update(apply_translations(term, term.translations.all()))
+            term.content_hashes = term.compute_content_hashes()
+        with transaction.atomic():
+            if columns:
+                Term.objects.bulk_update(terms, sorted(columns) + ['content_hashes'])
+            index_terms(terms)
@@ -0,0 +1,44 @@
+# core/management/commands/import_terms.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importing import ImportFailed, import_terms
+
+
+class Command(BaseCommand):
+    help = ("Importa termos de um ficheiro CSV/XLSX (mesmas colunas da importação do admin) em streaming, "
+            "por blocos, sem carregar o ficheiro inteiro em memória.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Ficheiro .csv ou .xlsx.")
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'xlsx'],
+                            help="Formato do ficheiro (por omissão, pela extensão).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Nº de linhas lidas e gravadas por bloco.")
+        parser.add_argument('--dry-run', action='store_true', help="Valida o ficheiro sem gravar nada.")
+        parser.add_argument('--user', help="Username a associar às revisões do reversion.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Utilizador '{options['user']}' não existe.")
+
+        try:
+            totals = import_terms(
+                options['path'],
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+                user=user,
+                file_format=options['file_format'],
+            )
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        except ImportFailed as error:
+            for message in error.errors[:20]:
+                self.stderr.write(message)
+            raise CommandError(f"Importação cancelada: {len(error.errors)} erro(s), nada foi gravado.")
+
+        summary = ', '.join(f"{key}: {value}" for key, value in totals.items() if value)
+        self.stdout.write(self.style.SUCCESS(f"{'Validação' if options['dry_run'] else 'Importação'} concluída ({summary or 'sem linhas'})."))
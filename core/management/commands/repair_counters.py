@@ -0,0 +1,27 @@
+# core/management/commands/repair_counters.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.counters import recount
+from core.models import Area, SubArea
+
+
+class Command(BaseCommand):
+    help = ("Recalcula os contadores de subáreas e termos guardados nas áreas e subáreas "
+            "(ex: depois de alterações feitas diretamente na base de dados).")
+
+    def handle(self, *args, **options):
+        before = self.snapshot()
+        with transaction.atomic():
+            recount()
+        after = self.snapshot()
+        fixed = sorted(key for key, value in after.items() if before.get(key) != value)
+        for model_name, pk in fixed:
+            self.stdout.write(f"{model_name} {pk}: {before.get((model_name, pk))} -> {after[(model_name, pk)]}")
+        self.stdout.write(self.style.SUCCESS(f"{len(after)} contadores verificados, {len(fixed)} corrigidos."))
+
+    def snapshot(self):
+        counters = {('area', pk): (subareas, terms)
+                    for pk, subareas, terms in Area.objects.values_list('pk', 'subarea_count', 'term_count')}
+        counters.update({('subarea', pk): terms for pk, terms in SubArea.objects.values_list('pk', 'term_count')})
+        return counters
@@ -0,0 +1,115 @@
+# core/management/commands/run_jobs.py
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+
+from core.jobs import claim_job, fail_stale_jobs, run_job, touch_jobs
+from core.models import Job
+
+
+class Command(BaseCommand):
+    help = ("Executa os jobs em segundo plano (importações/exportações do admin, modelo Job) "
+            "num conjunto de processos. Corre até receber SIGTERM/SIGINT.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS,
+                            help="Nº de jobs executados ao mesmo tempo (um processo cada).")
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help="Segundos entre leituras da fila quando está vazia.")
+        parser.add_argument('--once', action='store_true',
+                            help="Executa os jobs em espera e termina (em vez de ficar à espera de novos).")
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        workers = max(options['workers'], 1)
+        if connection.vendor == 'sqlite':
+            workers = 1                                 # o SQLite só aceita uma transação de escrita de cada vez
+        poll_interval = options['poll_interval']
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"run_jobs {name}: {workers} processos.")
+
+        pool = self.make_pool(workers)
+        running = {}
+        try:
+            while True:
+                self.check_jobs(list(running.values()))
+                while not self.stopping and len(running) < workers:
+                    job_id = claim_job(name)
+                    if job_id is None:
+                        break
+                    self.stdout.write(f"Job #{job_id} iniciado.")
+                    running[pool.submit(run_job, job_id)] = job_id
+
+                if not running:
+                    if self.stopping or options['once']:
+                        break
+                    connections.close_all()             # não manter uma ligação aberta enquanto a fila está vazia
+                    time.sleep(poll_interval)
+                    continue
+
+                done, _pending = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        status = future.result()
+                    except BrokenProcessPool:
+                        # um processo morreu (ex: sem memória) e o pool deixa de aceitar trabalho:
+                        # os jobs em curso são dados como falhados e é criado um pool novo
+                        for broken_id in [job_id, *running.values()]:
+                            self.stdout.write(f"Job #{broken_id}: {self.fail(broken_id, 'The job process was terminated unexpectedly.')}.")
+                        running.clear()
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        pool = self.make_pool(workers)
+                        break
+                    except Exception as error:
+                        status = self.fail(job_id, repr(error))
+                    self.stdout.write(f"Job #{job_id}: {status}.")
+        finally:
+            pool.shutdown(wait=True)
+
+    def make_pool(self, workers):
+        # "spawn" + um job por processo: cada job começa num processo novo (sem ligações à base de dados herdadas
+        # do pai) e a memória de uma importação grande é devolvida ao sistema quando o job acaba
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+            max_tasks_per_child=1,
+        )
+
+    def check_jobs(self, running_ids):
+        """Renova o heartbeat dos jobs em curso e dá como falhados os abandonados por outros run_jobs."""
+        if running_ids and connection.vendor == 'sqlite':
+            # a importação em curso bloqueia a escrita no SQLite até ao fim (e só há um worker)
+            return
+        try:
+            if running_ids:
+                touch_jobs(running_ids)
+            fail_stale_jobs(alive=running_ids)
+        except OperationalError as error:
+            # ex: base de dados bloqueada ou ligação perdida; tenta de novo na volta seguinte
+            self.stderr.write(f"Não foi possível atualizar os jobs: {error}")
+
+    def fail(self, job_id, message):
+        Job.objects.filter(pk=job_id, status=Job.STATUS_RUNNING).update(
+            status=Job.STATUS_FAILED, message=message, finished_at=timezone.now(),
+        )
+        return Job.STATUS_FAILED
+
+    def stop(self, signum, frame):
+        # acaba os jobs em curso, mas não reclama novos
+        self.stdout.write("A terminar depois dos jobs em curso...")
+        self.stopping = True
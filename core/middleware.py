@@ -0,0 +1,75 @@
+# core/middleware.py
+import json
+
+from django.conf import settings
+
+from core.permissions import UserCapabilities
+
+NAVIGATION_STACK_SIZE = 10                  # caminhos guardados no cookie do botão "voltar"
+NAVIGATION_COOKIE_MAX_SIZE = 2048           # bytes (antes da assinatura); os browsers aceitam ~4 KB por cookie
+
+
+class CapabilitiesMiddleware:
+    """
+    Põe em request.capabilities as permissões do utilizador (core.permissions.UserCapabilities).
+    Nada é lido da base de dados aqui: os grupos só são lidos se alguém os consultar, e uma só vez por pedido.
+    Tem de vir depois do AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.capabilities = UserCapabilities(request.user)
+        return self.get_response(request)
+
+
+class NavigationStackMiddleware:
+    """
+    Stack de navegação do botão "voltar" (update_navigation_stack/get_back_url, core/views.py) num cookie assinado,
+    em vez da sessão: ver uma página não grava nada na base de dados. Lida para request.navigation_stack (lista de
+    caminhos) e o cookie só é reescrito se a lista mudar. Limitada a NAVIGATION_STACK_SIZE caminhos e
+    NAVIGATION_COOKIE_MAX_SIZE bytes (saem os mais antigos).
+    """
+
+    cookie_name = 'navigation_stack'
+    salt = 'core.navigation_stack'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.navigation_stack = self.read(request)
+        original = list(request.navigation_stack)
+        response = self.get_response(request)
+        if request.navigation_stack != original:
+            self.write(response, request.navigation_stack)
+        return response
+
+    def read(self, request):
+        value = request.get_signed_cookie(self.cookie_name, default=None, salt=self.salt)
+        if not value:
+            return []
+        try:
+            stack = json.loads(value)
+        except ValueError:
+            return []
+        if not isinstance(stack, list):
+            return []
+        # só caminhos locais (o cookie é assinado, mas nunca redirecionar para outro site)
+        return [url for url in stack if isinstance(url, str) and url.startswith('/') and not url.startswith('//')]
+
+    def write(self, response, stack):
+        stack = stack[-NAVIGATION_STACK_SIZE:]
+        value = json.dumps(stack, separators=(',', ':'))
+        while stack and len(value) > NAVIGATION_COOKIE_MAX_SIZE:
+            stack = stack[1:]
+            value = json.dumps(stack, separators=(',', ':'))
+        if not stack:
+            response.delete_cookie(self.cookie_name, samesite='Lax')
+            return
+        # sem max_age: dura o mesmo que a sessão (SESSION_EXPIRE_AT_BROWSER_CLOSE)
+        response.set_signed_cookie(
+            self.cookie_name, value, salt=self.salt, httponly=True, samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.1 on 2026-10-17 17:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from modeltranslation.utils import build_localized_fieldname
+
+# Cópia do SQL de core/search.py nesta data: a migração não pode depender do código atual
+_SQLITE_INSTALL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS core_termsearchdocument_fts USING fts5(
+        name, body,
+        content='core_termsearchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    "INSERT INTO core_termsearchdocument_fts(core_termsearchdocument_fts, rank) VALUES('rank', 'bm25(10.0, 1.0)')",
+    """CREATE TRIGGER IF NOT EXISTS core_termsearchdocument_ai AFTER INSERT ON core_termsearchdocument BEGIN
+        INSERT INTO core_termsearchdocument_fts(rowid, name, body) VALUES (new.id, new.name, new.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_termsearchdocument_ad AFTER DELETE ON core_termsearchdocument BEGIN
+        INSERT INTO core_termsearchdocument_fts(core_termsearchdocument_fts, rowid, name, body)
+        VALUES ('delete', old.id, old.name, old.body);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_termsearchdocument_au AFTER UPDATE ON core_termsearchdocument BEGIN
+        INSERT INTO core_termsearchdocument_fts(core_termsearchdocument_fts, rowid, name, body)
+        VALUES ('delete', old.id, old.name, old.body);
+        INSERT INTO core_termsearchdocument_fts(rowid, name, body) VALUES (new.id, new.name, new.body);
+    END""",
+    "INSERT INTO core_termsearchdocument_fts(core_termsearchdocument_fts) VALUES('rebuild')",
+]
+
+_SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS core_termsearchdocument_ai",
+    "DROP TRIGGER IF EXISTS core_termsearchdocument_ad",
+    "DROP TRIGGER IF EXISTS core_termsearchdocument_au",
+    "DROP TABLE IF EXISTS core_termsearchdocument_fts",
+]
+
+_POSTGRES_INSTALL = [
+    """ALTER TABLE core_termsearchdocument ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS core_termsearchdocument_vector_gin ON core_termsearchdocument USING gin (search_vector)",
+]
+
+_POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS core_termsearchdocument_vector_gin",
+    "ALTER TABLE core_termsearchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    statements = {'sqlite': _SQLITE_INSTALL, 'postgresql': _POSTGRES_INSTALL}.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    statements = {'sqlite': _SQLITE_UNINSTALL, 'postgresql': _POSTGRES_UNINSTALL}.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def populate_documents(apps, schema_editor):
+    # Preenche o índice com os termos já existentes (os seguintes são indexados no Term.save)
+    Term = apps.get_model('core', 'Term')
+    TermSearchDocument = apps.get_model('core', 'TermSearchDocument')
+    documents = []
+    for term in Term.objects.order_by('ref').iterator(chunk_size=500):
+        for lang_code, _label in settings.LANGUAGES:
+            name = getattr(term, build_localized_fieldname('name', lang_code), None) or ''
+            body = strip_tags(getattr(term, build_localized_fieldname('description', lang_code), None) or '')
+            if name.strip() or body.strip():
+                documents.append(TermSearchDocument(term_id=term.ref, lang=lang_code, name=name, body=body))
+        if len(documents) >= 500:
+            TermSearchDocument.objects.bulk_create(documents)
+            documents = []
+    TermSearchDocument.objects.bulk_create(documents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_remove_area_name_pt_pt_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lang', models.CharField(max_length=10)),
+                ('name', models.TextField(blank=True, default='')),
+                ('body', models.TextField(blank=True, default='')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to='core.term')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lang'], name='core_searchdoc_lang_idx')],
+                'constraints': [models.UniqueConstraint(fields=('term', 'lang'), name='unique_search_document_term_lang')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(populate_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:05
+
+import re
+import unicodedata
+from html import unescape
+
+from django.conf import settings
+from django.db import migrations
+from modeltranslation.utils import build_localized_fieldname
+
+# Cópia de core.search nesta data: a migração não pode depender do código atual
+BODY_FIELDS = ('description', 'source', 'extra')
+_TAG_RE = re.compile(r'<[^>]*>')
+_GREEK_TONOS = '\u0301'
+_DIAERESIS = '\u0308'                                           # trema: no cirílico só é retirado do ё (е + trema)
+_ARABIC_HARAKAT = frozenset(chr(code) for code in range(0x064B, 0x0653))    # tashkeel: fatha, damma, kasra, shadda, ...
+_ARABIC_TATWEEL = '\u0640'
+
+
+def _folded_mark(base, mark):
+    """
+    Se a marca combinatória (depois do NFKD) é um diacrítico a retirar: acentos latinos, tonos grego,
+    o trema do ё e o tashkeel árabe. As outras ficam (й, ї, ў, sinais de vogal devanágari/tailandeses, dakuten...),
+    porque distinguem letras diferentes.
+    """
+    if mark in _ARABIC_HARAKAT:
+        return True
+    name = unicodedata.name(base, '')
+    if name.startswith('LATIN'):
+        return True
+    if name.startswith('GREEK'):
+        return mark == _GREEK_TONOS
+    return base in 'еЕ' and mark == _DIAERESIS
+
+
+def fold_text(value):
+    if not value:
+        return ''
+    text = unescape(_TAG_RE.sub(' ', value))
+    kept = []
+    base = ''
+    for ch in unicodedata.normalize('NFKD', text):
+        if ch == _ARABIC_TATWEEL:
+            continue
+        if unicodedata.category(ch) != 'Mn':
+            base = ch
+        elif _folded_mark(base, ch):
+            continue
+        kept.append(ch)
+    text = unicodedata.normalize('NFKC', ''.join(kept)).casefold()
+    return ' '.join(text.split())
+
+
+def refold_documents(apps, schema_editor):
+    # Regrava os documentos de pesquisa com o texto normalizado (sem HTML nem diacríticos, com source/extra)
+    Term = apps.get_model('core', 'Term')
+    TermSearchDocument = apps.get_model('core', 'TermSearchDocument')
+    TermSearchDocument.objects.all().delete()
+    documents = []
+    for term in Term.objects.order_by('ref').iterator(chunk_size=500):
+        for lang_code, _label in settings.LANGUAGES:
+            name = fold_text(getattr(term, build_localized_fieldname('name', lang_code), None))
+            body = ' '.join(filter(None, (
+                fold_text(getattr(term, build_localized_fieldname(base, lang_code), None)) for base in BODY_FIELDS
+            )))
+            if name or body:
+                documents.append(TermSearchDocument(term_id=term.ref, lang=lang_code, name=name, body=body))
+        if len(documents) >= 500:
+            TermSearchDocument.objects.bulk_create(documents)
+            documents = []
+    TermSearchDocument.objects.bulk_create(documents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_termsearchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(refold_documents, migrations.RunPython.noop),
+    ]
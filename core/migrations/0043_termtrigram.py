@@ -0,0 +1,70 @@
+# Generated by Django 5.2.1 on 2026-10-17 17:37
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Cópia de core.search nesta data: a migração não pode depender do código atual.
+# Os nomes dos documentos já estão normalizados (migração 0042), basta separar as palavras.
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def trigrams(text):
+    grams = set()
+    for word in _TOKEN_RE.findall(text or ''):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS core_termsearchdocument_name_trgm ON core_termsearchdocument "
+            "USING gin (name gin_trgm_ops)"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS core_termsearchdocument_name_trgm")
+
+
+def populate_trigrams(apps, schema_editor):
+    # Em Postgres o pg_trgm indexa a coluna diretamente; a tabela auxiliar só é preenchida em SQLite
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    TermSearchDocument = apps.get_model('core', 'TermSearchDocument')
+    TermTrigram = apps.get_model('core', 'TermTrigram')
+    rows = []
+    for document in TermSearchDocument.objects.only('id', 'name').iterator(chunk_size=1000):
+        rows.extend(TermTrigram(document_id=document.pk, gram=gram) for gram in trigrams(document.name))
+        if len(rows) >= 5000:
+            TermTrigram.objects.bulk_create(rows)
+            rows = []
+    TermTrigram.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0042_fold_termsearchdocument_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='core.termsearchdocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['gram', 'document'], name='core_trigram_gram_doc_idx')],
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        migrations.RunPython(populate_trigrams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-17 17:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0043_termtrigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermTranslation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lang', models.CharField(max_length=10)),
+                ('name', models.CharField(blank=True, max_length=255, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('source', models.TextField(blank=True, null=True)),
+                ('extra', models.TextField(blank=True, null=True)),
+                ('published_at', models.DateTimeField(blank=True, null=True)),
+                ('term', models.ForeignKey(db_column='term_ref', on_delete=django.db.models.deletion.CASCADE, related_name='translations', to='core.term')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lang', 'term'], name='core_termtrans_lang_term_idx')],
+                'constraints': [models.UniqueConstraint(fields=('term', 'lang'), name='unique_term_translation_term_lang')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:03
+
+import hashlib
+
+from django.conf import settings
+from django.db import migrations, models
+from modeltranslation.utils import build_localized_fieldname
+
+# Cópia de core.models nesta data: a migração não pode depender do código atual
+CONTENT_FIELDS = ('name', 'description', 'source', 'extra')
+
+
+def content_columns(lang_code):
+    return tuple(build_localized_fieldname(base, lang_code) for base in CONTENT_FIELDS)
+
+
+def term_content_hashes(term):
+    hashes = {}
+    for lang_code, _label in settings.LANGUAGES:
+        values = ['' if getattr(term, column, None) is None else str(getattr(term, column))
+                  for column in content_columns(lang_code)]
+        if any(value.strip() for value in values):
+            hashes[lang_code] = hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+    return hashes
+
+
+def populate_content_hashes(apps, schema_editor):
+    Term = apps.get_model('core', 'Term')
+    columns = [column for lang_code, _label in settings.LANGUAGES for column in content_columns(lang_code)]
+    batch = []
+    for term in Term.objects.only('ref', *columns).iterator(chunk_size=1000):
+        term.content_hashes = term_content_hashes(term)
+        batch.append(term)
+        if len(batch) >= 1000:
+            Term.objects.bulk_update(batch, ['content_hashes'])
+            batch = []
+    Term.objects.bulk_update(batch, ['content_hashes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0044_termtranslation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='term',
+            name='content_hashes',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(populate_content_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:09
+
+import core.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0045_term_content_hashes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('import', 'Import'), ('export', 'Export')], max_length=10, verbose_name='Kind')),
+                ('model_label', models.CharField(max_length=100, verbose_name='Model')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10, verbose_name='Status')),
+                ('options', models.JSONField(blank=True, default=dict)),
+                ('input_file', models.FileField(blank=True, upload_to=core.models.job_file_path, verbose_name='Input file')),
+                ('result_file', models.FileField(blank=True, upload_to=core.models.job_file_path, verbose_name='Result file')),
+                ('progress', models.PositiveIntegerField(default=0, verbose_name='Processed rows')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Total rows')),
+                ('totals', models.JSONField(blank=True, default=dict)),
+                ('message', models.TextField(blank=True, verbose_name='Message')),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started at')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished at')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Created by')),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='core_job_status_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:19
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    Area = apps.get_model('core', 'Area')
+    SubArea = apps.get_model('core', 'SubArea')
+    for ref, terms in SubArea.objects.annotate(n=Count('termos')).values_list('ref', 'n'):
+        SubArea.objects.filter(ref=ref).update(term_count=terms)
+    areas = Area.objects.annotate(subareas_n=Count('subareas', distinct=True), terms_n=Count('subareas__termos'))
+    for pk, subareas, terms in areas.values_list('pk', 'subareas_n', 'terms_n'):
+        Area.objects.filter(pk=pk).update(subarea_count=subareas, term_count=terms)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0046_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='area',
+            name='subarea_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Subareas'),
+        ),
+        migrations.AddField(
+            model_name='area',
+            name='term_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Terms'),
+        ),
+        migrations.AddField(
+            model_name='subarea',
+            name='term_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Terms'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
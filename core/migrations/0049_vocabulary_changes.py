@@ -0,0 +1,20 @@
+# Generated by Django 5.2.1 on 2026-10-17 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0048_cache_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VocabularyChange',
+            fields=[
+                ('version', models.PositiveBigIntegerField(primary_key=True, serialize=False)),
+                ('refs', models.JSONField(default=list)),
+            ],
+        ),
+    ]
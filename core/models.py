@@ -2,18 +2,114 @@
 from ckeditor_uploader.fields import RichTextUploadingField     # Para fazer edição de texto rico e upload de imagens no CKEditor.
 from django.db import models                                    # Importa o módulo models do Django, que contém classes para definir modelos de dados.
 from django.utils.translation import gettext_lazy as _          # Importa a função gettext lazy do Django, renomeando-a como '_', para facilitar a tradução de strings.
+import functools
+import hashlib
+import uuid
 import reversion
 from django.utils import timezone
 from modeltranslation.utils import build_localized_fieldname
 from django.conf import settings
+from core.scheduling import in_window, schedule_timeline
+
+
+# QuerySet partilhado pelos modelos traduzidos (Area, SubArea, Term): cada linha tem uma coluna por idioma
+# para cada campo traduzido, e as listagens só precisam das do idioma ativo
+class TranslatedQuerySet(models.QuerySet):
+
+    def localized_fields(self, *fields, lang=None):
+        """
+        Converte os nomes dos campos traduzidos nas colunas do idioma ativo e do idioma padrão
+        (usado pelos templates como alternativa, ex. area.name|default:area.name_en): name -> name_pt_br, name_en.
+        Os restantes campos ficam como estão.
+        """
+        from modeltranslation.translator import translator
+        from modeltranslation.utils import get_language
+
+        translated = translator.get_options_for_model(self.model).all_fields
+        languages = [lang or get_language(), settings.MODELTRANSLATION_DEFAULT_LANGUAGE]
+        columns = []
+        for field in fields:
+            names = [build_localized_fieldname(field, code) for code in languages] if field in translated else [field]
+            columns.extend(name for name in names if name not in columns)
+        return columns
+
+    def localized_only(self, *fields, lang=None):
+        # only() que não carrega as colunas dos outros 38 idiomas ('name' continua a ler name_<idioma ativo>)
+        return self.only(*self.localized_fields(*fields, lang=lang))
+
+
+# QuerySet partilhado pelos conteúdos agendados (News, Warning, ContactTopMessage): 'active' e uma janela de
+# visibilidade com início e fim opcionais, cujos nomes vêm de Model.schedule_fields. Ver core/scheduling.py
+class ScheduledQuerySet(models.QuerySet):
+
+    def visible(self):
+        """Linhas visíveis agora, pela linha temporal em memória: na base de dados é só um filtro por pk."""
+        return self.filter(pk__in=schedule_timeline(self.model).visible_pks())
+
+
+# Guarda os valores de cada instância como vieram da base de dados (from_db), para saber que campos
+# mudaram sem voltar a ler a linha antes de gravar. Reutilizável por qualquer modelo: class X(FieldTrackingMixin, models.Model)
+class FieldTrackingMixin:
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_pk = instance.pk
+        instance._loaded_values = dict(zip(field_names, values))   # só os campos carregados (sem os deferred)
+        return instance
+
+    def is_tracked(self):
+        """True se a instância veio da base de dados com a mesma chave primária (ou seja, não é uma linha nova)."""
+        return getattr(self, '_loaded_values', None) is not None and self.pk == self._loaded_pk
+
+    def get_loaded_values(self, fields):
+        """
+        Valores dos campos (attname) como estão gravados; {} numa instância nova.
+        Os campos que não foram carregados (only()/defer()) são lidos todos numa só query,
+        e ficam também na instância (em vez de uma query por campo ao acedê-los).
+        """
+        if not self.is_tracked():
+            return {}
+        missing = [field for field in fields if field not in self._loaded_values]
+        if missing:
+            row = type(self)._base_manager.filter(pk=self._loaded_pk).values(*missing).first() or {}
+            self._loaded_values.update(row)
+            for field, value in row.items():
+                self.__dict__.setdefault(field, value)
+        return {field: self._loaded_values.get(field) for field in fields}
+
+    def get_changed_fields(self, fields=None):
+        """Campos (attname) cujo valor atual é diferente do gravado; numa instância nova, todos."""
+        if fields is None:
+            fields = [field.attname for field in self._meta.concrete_fields]
+        loaded = self.get_loaded_values(fields)
+        if not loaded:
+            return set(fields)
+        return {field for field in fields if getattr(self, field) != loaded[field]}
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # o que foi gravado passa a ser o estado de referência para a próxima gravação
+        self._loaded_pk = self.pk
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
 
 
 # Modelo para a área de conhecimento
-@reversion.register()
+@reversion.register(exclude=['subarea_count', 'term_count'])                                   # os contadores não se repõem ao reverter uma versão
 class Area(models.Model):                                                                       # Classe Area herda de models.Model, representando um modelo de dados no Django.
     id = models.CharField(_('Id'), max_length=3, primary_key=True)                              # Define o campo 'id' como um IntegerField, que é a chave primária do modelo. Cada 'id' é único.
     name = models.CharField(_('Name'), max_length=255, unique=True, null=True, blank=True)      # Define o campo 'name' como um CharField, com um nome traduzido e restrição de ser único.
 
+    # contadores mantidos por core/counters.py (em vez de um COUNT em cada listagem)
+    subarea_count = models.PositiveIntegerField(_('Subareas'), default=0, editable=False)
+    term_count = models.PositiveIntegerField(_('Terms'), default=0, editable=False)
+
+    objects = TranslatedQuerySet.as_manager()
+
     class Meta:                                         # Classe interna Meta para definir opções adicionais do modelo.
         verbose_name = _('Area')                        # verbose_name é uma string que fornece um nome legível para o modelo, por ex. no painel de administração do django
     def __str__(self):                                  # Metodo que define a representação em string do modelo.
@@ -21,13 +117,17 @@ class Area(models.Model):
 
 
 # Modelo para a subárea de conhecimento
-@reversion.register()
+@reversion.register(exclude=['term_count'])
 class SubArea(models.Model):
     ref = models.CharField(_('Reference'), max_length=6, editable=False, primary_key=True) # Ex: 301-01
     id = models.CharField(_('Id'), max_length=2) # Ex: 01
     name = models.CharField(_('Name'), max_length=255, null=True, blank=True)       # Define o campo 'name' como um CharField, com um nome traduzido e restrição de ser único.
     area = models.ForeignKey(Area, verbose_name=_('Area'), related_name='subareas', on_delete=models.PROTECT)       # Define uma ForeignKey que faz referência ao modelo Area, permitindo associar uma SubArea a uma Area.
 
+    term_count = models.PositiveIntegerField(_('Terms'), default=0, editable=False)     # mantido por core/counters.py
+
+    objects = TranslatedQuerySet.as_manager()
+
     class Meta:                                         # Classe interna Meta para definir opções adicionais do modelo.
         verbose_name = _('Subarea')                     # verbose_name é uma string que fornece um nome legível para o modelo, por ex. no painel de administração do django
 
@@ -43,9 +143,32 @@ class SubArea(models.Model):
         return f"{self.ref} {self.name}"                 # Retorna uma string formatada com o 'id' da área, o 'id' da subárea (com pelo menos dois dígitos inteiros) e o 'name' da subárea.
 
 
-# Modelo para os termos/vocábulos
-@reversion.register()
-class Term(models.Model):                               # Classe Term herda de models.Model, representando um modelo de dados no Django.
+# Colunas usadas no carimbo published_at_<lang> de cada idioma: [(published_at_<lang>, (name_<lang>, description_<lang>, ...))]
+@functools.lru_cache(maxsize=None)
+def published_at_columns():
+    return [
+        (build_localized_fieldname('published_at', lang_code),
+         tuple(build_localized_fieldname(base, lang_code) for base in ('name', 'description', 'source', 'extra')))
+        for lang_code, _label in settings.LANGUAGES
+    ]
+
+
+def term_content_hashes(term):
+    """
+    Hash (sha1) do conteúdo de um termo em cada idioma: {'en': '...', 'pt-br': '...'}, só para os idiomas com conteúdo.
+    Serve para saber se um idioma mudou (ou passou a ter conteúdo) sem comparar o HTML todo.
+    Aceita qualquer objeto com as colunas name_<lang>, description_<lang>, ... (também os modelos históricos das migrações).
+    """
+    hashes = {}
+    for (lang_code, _label), (_pub_field, bases) in zip(settings.LANGUAGES, published_at_columns()):
+        values = ['' if getattr(term, base, None) is None else str(getattr(term, base)) for base in bases]
+        if any(value.strip() for value in values):
+            hashes[lang_code] = hashlib.sha1('\x1f'.join(values).encode('utf-8')).hexdigest()
+    return hashes
+
+
+# Modelo para os termos/vocábulos (registado no reversion em core/translation.py)
+class Term(FieldTrackingMixin, models.Model):                               # Classe Term herda de models.Model, representando um modelo de dados no Django.
     ref = models.CharField(_('IEV Reference'), max_length=9, editable=False, primary_key=True)  # Ex: 301-01-01
     id = models.CharField(_('Id'), max_length=2)        # Ex: 01
     subarea = models.ForeignKey(SubArea, verbose_name=_('Subarea'), related_name='termos', on_delete=models.PROTECT)    # Define uma ForeignKey que faz referência ao modelo SubArea, permitindo associar um Term a uma SubArea.
@@ -62,42 +185,55 @@ class Term(models.Model):                               # Classe Term herda de m
     published_at = models.DateTimeField(_('Added to IEVP'), null=True, blank=True)
     ######################################################################
 
+    content_hashes = models.JSONField(default=dict, blank=True, editable=False)    # {idioma: hash do conteúdo}, ver term_content_hashes
+
+    objects = TranslatedQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
-        self.ref = f"{self.subarea.ref}-{self.id}"
-        ############################## Added to IEVP ##############################
-        # --- carimbar published_at_<lang> só na 1ª vez em que esse idioma ganha conteúdo ---
-        now = timezone.now()
-        bases = ['name', 'description', 'source', 'extra']
-
-        old = None
-        if self.pk:
-            try:
-                old = Term.objects.get(pk=self.pk)
-            except Term.DoesNotExist:
-                old = None
-
-        for lang_code, _label in settings.LANGUAGES:
-            pub_field = build_localized_fieldname('published_at', lang_code)
-
-            # só se ainda não tem data para este idioma
-            if getattr(self, pub_field, None) is None:
-                # há conteúdo agora neste idioma?
-                has_now = any(
-                    bool((getattr(self, build_localized_fieldname(base, lang_code), None) or '').strip())
-                    for base in bases
-                )
-                # havia conteúdo antes?
-                had_before = any(
-                    bool((getattr(old, build_localized_fieldname(base, lang_code), None) or '').strip())
-                    for base in bases
-                ) if old else False
-
-                # define a data apenas quando passa de vazio -> com conteúdo
-                if has_now and not had_before:
-                    setattr(self, pub_field, now)
-        ######################################################################
+        self.ref = f"{self.subarea_id}-{self.id}"          # a chave primária da SubArea é a própria ref (ex: 301-02)
+        self.content_hashes = self.compute_content_hashes()
+        self.stamp_published_at()
         super().save(*args, **kwargs)
 
+        # Mantém o índice de pesquisa full-text sincronizado (na eliminação, o CASCADE trata disso)
+        from core.search import index_term
+        index_term(self)
+
+        # No modo "normalized" mantém também a tabela estreita de traduções
+        from core.term_storage import normalized_storage_enabled, sync_translations
+        if normalized_storage_enabled():
+            sync_translations([self])
+
+    ############################## Added to IEVP ##############################
+    def compute_content_hashes(self):
+        # colunas adiadas (only()/defer()) são lidas todas numa só query, em vez de uma por coluna
+        self.get_loaded_values([base for _pub_field, bases in published_at_columns() for base in bases])
+        return term_content_hashes(self)
+
+    def content_changed(self):
+        """True se o conteúdo de algum idioma é diferente do gravado (compara só os hashes)."""
+        return self.compute_content_hashes() != (self.get_loaded_values(['content_hashes']).get('content_hashes') or {})
+
+    def stamp_published_at(self, now=None):
+        """
+        Carimba published_at_<lang> só na 1ª vez em que esse idioma ganha conteúdo (também usado na importação em bloco).
+        Usa os hashes por idioma: o idioma tem conteúdo agora se está em content_hashes, e antes se estava nos gravados.
+        """
+        now = now or timezone.now()
+        current = self.content_hashes
+        previous = self.get_loaded_values(['content_hashes']).get('content_hashes') or {}
+
+        for (lang_code, _label), (pub_field, _bases) in zip(settings.LANGUAGES, published_at_columns()):
+            # define a data apenas quando passa de vazio -> com conteúdo, e se ainda não tem data para este idioma
+            if lang_code in current and lang_code not in previous and getattr(self, pub_field, None) is None:
+                setattr(self, pub_field, now)
+    ######################################################################
+
+    def translation(self, lang):
+        """Conteúdo do termo num idioma (name, description, source, extra, published_at), seja qual for o armazenamento."""
+        from core.term_storage import get_translation
+        return get_translation(self, lang)
+
     class Meta:                                         # Classe interna Meta para definir opções adicionais do modelo.
         verbose_name = _('Term')                        # verbose_name é uma string que fornece um nome legível para o modelo, por ex., no painel de administração do Django.
 
@@ -105,6 +241,65 @@ class Term(models.Model):                               # Classe Term herda de m
         return f"{self.ref} {self.name}"                # Retorna uma string formatada com a referência IEV e o nome do termo.
 
 
+# Documento de pesquisa: uma linha por termo e idioma, indexada em full-text (ver core/search.py)
+# O texto é derivado dos campos do Term já normalizado: sem HTML, minúsculas e sem diacríticos.
+class TermSearchDocument(models.Model):
+    term = models.ForeignKey(Term, related_name='search_documents', on_delete=models.CASCADE)
+    lang = models.CharField(max_length=10)                  # código do idioma das settings, ex: 'pt-br'
+    name = models.TextField(blank=True, default='')         # name_<lang> normalizado
+    body = models.TextField(blank=True, default='')         # description/source/extra_<lang> normalizados
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'lang'], name='unique_search_document_term_lang'),
+        ]
+        indexes = [
+            models.Index(fields=['lang'], name='core_searchdoc_lang_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term_id} [{self.lang}]"
+
+
+# Trigramas do nome de cada documento de pesquisa, para sugestões "quis dizer" em SQLite
+# (em Postgres é usado o pg_trgm diretamente sobre TermSearchDocument.name)
+class TermTrigram(models.Model):
+    document = models.ForeignKey(TermSearchDocument, related_name='trigrams', on_delete=models.CASCADE)
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['gram', 'document'], name='core_trigram_gram_doc_idx'),    # cobre o GROUP BY document_id
+        ]
+
+    def __str__(self):
+        return f"{self.gram!r} -> {self.document_id}"
+
+
+# Traduções de um termo numa tabela estreita (uma linha por termo e idioma), alternativa às colunas
+# name_<lang>, description_<lang>, ... do modeltranslation; acrescentar um idioma aqui é só inserir linhas.
+# Mantida a par do Term quando TERM_TRANSLATION_STORAGE = "normalized" (ver core/term_storage.py)
+class TermTranslation(models.Model):
+    term = models.ForeignKey(Term, related_name='translations', on_delete=models.CASCADE, db_column='term_ref')
+    lang = models.CharField(max_length=10)                  # código do idioma das settings, ex: 'pt-br'
+    name = models.CharField(max_length=255, null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    source = models.TextField(null=True, blank=True)
+    extra = models.TextField(null=True, blank=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'lang'], name='unique_term_translation_term_lang'),  # índice (term_ref, lang)
+        ]
+        indexes = [
+            models.Index(fields=['lang', 'term'], name='core_termtrans_lang_term_idx'),                  # todos os termos de um idioma
+        ]
+
+    def __str__(self):
+        return f"{self.term_id} [{self.lang}]"
+
+
 # Para mostrar mensagens de notícias na homepage
 class News(models.Model):
     title = models.CharField(_('Title'), max_length=255)
@@ -116,18 +311,16 @@ class News(models.Model):
     created_at = models.DateTimeField(_('Created at'), auto_now_add=True)
     position = models.PositiveIntegerField('Position', default=0)
 
+    schedule_fields = ('start_date', 'end_date')
+    objects = ScheduledQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('News')
         verbose_name_plural = _('News')
         ordering = ('position', '-created_at')
 
     def is_valid_now(self):
-        now = timezone.now()
-        if self.start_date and self.start_date > now:
-            return False
-        if self.end_date and self.end_date < now:
-            return False
-        return True
+        return in_window(self.start_date, self.end_date, timezone.now())
 
     def __str__(self):
         return f"{self.title} ({'Active' if self.active else 'Inactive'})"
@@ -142,6 +335,8 @@ class Warning(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     position = models.PositiveIntegerField('Position', default=0)
 
+    schedule_fields = ('show_from', 'hide_after')
+    objects = ScheduledQuerySet.as_manager()
 
     class Meta:
         verbose_name = _('Warning')
@@ -235,8 +430,82 @@ class ContactTopMessage(models.Model):
     hide_after = models.DateTimeField(null=True, blank=True)
     position = models.PositiveIntegerField(default=0)
 
+    schedule_fields = ('show_from', 'hide_after')
+    objects = ScheduledQuerySet.as_manager()
+
     class Meta:
         ordering = ('position', '-id')
 
     def __str__(self):
         return f"{self.position} – {self.text}"
+
+
+# Contadores de versão das caches derivadas (ver core/caching.py), partilhados por todos os processos
+class CacheVersion(models.Model):
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key} = {self.version}"
+
+
+# Refs dos termos alterados em cada versão do vocabulário (ver bump_vocabulary_version em core/caching.py)
+class VocabularyChange(models.Model):
+    version = models.PositiveBigIntegerField(primary_key=True)
+    refs = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"{self.version}: {len(self.refs)} termos"
+
+
+def job_file_path(instance, filename):
+    # pasta aleatória por ficheiro: o armazenamento (bucket) pode ter leitura pública
+    return f"jobs/{uuid.uuid4().hex}/{filename}"
+
+
+# Importações/exportações longas do admin, executadas em segundo plano pelo comando run_jobs (ver core/jobs.py)
+class Job(models.Model):
+    KIND_IMPORT = 'import'
+    KIND_EXPORT = 'export'
+    KIND_CHOICES = [(KIND_IMPORT, _('Import')), (KIND_EXPORT, _('Export'))]
+
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [(STATUS_QUEUED, _('Queued')), (STATUS_RUNNING, _('Running')),
+                      (STATUS_DONE, _('Done')), (STATUS_FAILED, _('Failed'))]
+
+    kind = models.CharField(_('Kind'), max_length=10, choices=KIND_CHOICES)
+    model_label = models.CharField(_('Model'), max_length=100)                 # ex: core.term
+    status = models.CharField(_('Status'), max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    options = models.JSONField(default=dict, blank=True)                        # formato, dry_run, idiomas, refs a exportar, ...
+    input_file = models.FileField(_('Input file'), upload_to=job_file_path, blank=True)
+    result_file = models.FileField(_('Result file'), upload_to=job_file_path, blank=True)
+    progress = models.PositiveIntegerField(_('Processed rows'), default=0)
+    total = models.PositiveIntegerField(_('Total rows'), null=True, blank=True)
+    totals = models.JSONField(default=dict, blank=True)                         # resultado da importação (new, update, skip, ...)
+    message = models.TextField(_('Message'), blank=True)
+    worker = models.CharField(max_length=100, blank=True)                       # host:pid do run_jobs que o executa
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('Created by'), null=True, blank=True,
+                                   related_name='+', on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(_('Created at'), auto_now_add=True)
+    started_at = models.DateTimeField(_('Started at'), null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)                  # última atualização do progresso
+    finished_at = models.DateTimeField(_('Finished at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Job')
+        verbose_name_plural = _('Jobs')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='core_job_status_created_idx'),
+        ]
+
+    def progress_percent(self):
+        if not self.total:
+            return None
+        return min(100, round(100 * self.progress / self.total))
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_kind_display()} {self.model_label} ({self.get_status_display()})"
@@ -0,0 +1,71 @@
+# core/pagination.py
+"""
+Paginação por cursor (keyset) sobre Term.ref, que já é a chave primária ordenada.
+
+Em vez de OFFSET (cada vez mais lento quanto mais fundo se pagina), cada página é
+"ref > último ref visto ... LIMIT n": uma leitura por intervalo no índice, igual no início
+e no fim do dicionário. O cursor entregue ao cliente é opaco (assinado com a SECRET_KEY),
+para os clientes não dependerem do formato das refs. Também é aceite o ref de um termo tal como está
+(?after=301-02-14, para começar a lista a seguir a esse termo): "ref > x" só escolhe onde a página começa,
+por isso um ref escrito à mão não mostra nada que não se visse a paginar até lá.
+"""
+
+from django.core import signing
+
+from core.search import parse_reference
+
+CURSOR_SALT = 'core.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(ref):
+    return signing.dumps(ref, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    """Ref a partir do qual começa a página: cursor assinado (encode_cursor) ou o ref de um termo."""
+    reference = parse_reference(token)
+    if reference is not None and reference[0] == 'term':
+        return reference[1]
+    try:
+        ref = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise InvalidCursor('Invalid cursor.')
+    if not isinstance(ref, str):
+        raise InvalidCursor('Invalid cursor.')
+    return ref
+
+
+def keyset_page(queryset, after=None, limit=100):
+    """
+    Página de termos por ordem de ref, a seguir ao ref 'after'.
+    Devolve (termos, cursor da página seguinte ou None se for a última).
+    """
+    if after is not None:
+        queryset = queryset.filter(ref__gt=after)
+    items = list(queryset.order_by('ref')[:limit + 1])      # +1 só para saber se há página seguinte
+    if len(items) > limit:
+        items = items[:limit]
+        return items, encode_cursor(items[-1].ref)
+    return items, None
+
+
+def ranked_page(refs, after=None, limit=100):
+    """
+    Mesma ideia para uma lista de refs já ordenada (resultados de pesquisa por relevância):
+    o cursor é o último ref visto e a página começa logo a seguir a ele na lista.
+    """
+    start = 0
+    if after is not None:
+        try:
+            start = refs.index(after) + 1
+        except ValueError:
+            # o vocabulário mudou e o ref já não está nos resultados
+            raise InvalidCursor('Stale cursor.')
+    page_refs = refs[start:start + limit]
+    if start + limit < len(refs):
+        return page_refs, encode_cursor(page_refs[-1])
+    return page_refs, None
@@ -2,21 +2,56 @@
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.functional import cached_property
+
+
+# O que o utilizador do pedido pode fazer, calculado só quando é lido pela 1ª vez e guardado até ao fim do pedido.
+# Os grupos vêm de uma só query, partilhada pelo decorador/mixin, pelos context processors e pelas views.
+class UserCapabilities:
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def group_names(self):
+        if not self.user.is_authenticated:
+            return ()
+        return tuple(self.user.groups.values_list('name', flat=True))
+
+    @property
+    def has_access(self):
+        # autenticado e fora do grupo 'SemAcesso'
+        return self.user.is_authenticated and 'SemAcesso' not in self.group_names
+
+    @property
+    def is_admin_or_gestor(self):
+        # Admin, Gestor ou superuser
+        return self.user.is_authenticated and (
+            self.user.is_superuser or any(name in ('Admin', 'Gestor') for name in self.group_names)
+        )
+
+    @cached_property
+    def email_verified(self):
+        return self.user.is_authenticated and self.user.emailaddress_set.filter(verified=True).exists()
+
+
+def get_capabilities(request):
+    """request.capabilities (posto pelo CapabilitiesMiddleware), ou criado aqui se o pedido não passou pelo middleware."""
+    if not hasattr(request, 'capabilities'):
+        request.capabilities = UserCapabilities(request.user)
+    return request.capabilities
 
 
 # Decorador: Permite acesso apenas a utilizadores autenticados que não estão no grupo 'SemAcesso'
 # Redireciona se não tiver acesso.
 def user_has_access(redirect_url='/'):
 
-    def check(user):
-        return user.is_authenticated and not user.groups.filter(name="SemAcesso").exists()
-
     def decorator(view_func):
         def _wrapped_view(request, *args, **kwargs):
             if not request.user.is_authenticated:
                 from django.contrib.auth.views import redirect_to_login
                 return redirect_to_login(request.get_full_path())
-            elif not check(request.user):
+            elif not get_capabilities(request).has_access:
                 return redirect(redirect_url)  # redireciona em vez de 403
             return view_func(request, *args, **kwargs)
         return _wrapped_view
@@ -27,11 +62,9 @@ def user_has_access(redirect_url='/'):
 class GroupAccessRequiredMixin(UserPassesTestMixin):
 
     def test_func(self):
-        user = self.request.user
-        return user.is_authenticated and not user.groups.filter(name="SemAcesso").exists()
+        return get_capabilities(self.request).has_access
 
     def handle_no_permission(self):
         if not self.request.user.is_authenticated:
             return super().handle_no_permission()  # redireciona para login
         return redirect(reverse('home'))  # user autenticado mas sem permissão
-
@@ -0,0 +1,157 @@
+# core/revision_storage.py
+"""
+Armazenamento compacto das versões do django-reversion (formato "delta", registado em SERIALIZATION_MODULES
+e usado pelo Term, registado no reversion em core/translation.py).
+
+Com o formato "json", cada Version guarda o termo inteiro (~200 colunas traduzidas, com HTML em 39 idiomas),
+mesmo quando só mudou um campo. Aqui cada versão é:
+- um snapshot: todos os campos, como no formato "json" (mas sem escapar o texto não ASCII), ou
+- um delta: só os campos diferentes de um snapshot anterior do mesmo objeto, com o id da Version desse snapshot.
+
+Os deltas referem sempre um snapshot (profundidade 1): reconstruir uma versão é no máximo ler mais uma linha.
+É gravado um snapshot novo a cada SNAPSHOT_INTERVAL versões, ou quando o delta já não é muito mais pequeno
+que o objeto completo. A reconstrução é feita no Deserializer, por isso o histórico, a comparação e a
+reversão do VersionAdmin funcionam sem alterações. As versões antigas (formato "json") continuam legíveis.
+"""
+
+import json
+import threading
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.serializers.python import Deserializer as PythonDeserializer
+from django.core.serializers.python import Serializer as PythonSerializer
+from django.db.models import Max
+
+FORMAT = 'delta'
+SNAPSHOT_INTERVAL = 20              # nº máximo de deltas seguidos sobre o mesmo snapshot
+SNAPSHOT_RATIO = 0.5                # um delta maior que esta fração do objeto completo é gravado como snapshot
+SNAPSHOT_CACHE_SIZE = 2000          # snapshots já lidos, por id da Version (não mudam depois de gravados)
+
+_snapshots = {}
+_preloaded = threading.local()
+
+
+def _dumps(value):
+    return json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _cache_snapshot(version_id, fields):
+    if len(_snapshots) >= SNAPSHOT_CACHE_SIZE:
+        _snapshots.clear()
+    _snapshots[version_id] = fields
+
+
+def snapshot_fields(version_id):
+    """Campos de um snapshot, pelo id da sua Version; None se já não existir (ou não for um snapshot)."""
+    from reversion.models import Version
+
+    if version_id not in _snapshots:
+        data = Version.objects.filter(pk=version_id, format=FORMAT).values_list('serialized_data', flat=True).first()
+        if data is None:
+            return None
+        obj = json.loads(data)[0]
+        if obj.get('base') is not None:
+            return None
+        _cache_snapshot(version_id, obj['fields'])
+    return _snapshots[version_id]
+
+
+def _parse_latest(version_id, version_format, data):
+    """(id do snapshot, nº de deltas desde ele) a partir da última versão de um objeto, ou None se não houver base."""
+    if version_format != FORMAT:
+        return None                                     # versão antiga (json): a próxima é um snapshot
+    obj = json.loads(data)[0]
+    if obj.get('base') is None:
+        _cache_snapshot(version_id, obj['fields'])
+        return version_id, 0
+    return obj['base'], obj['n']
+
+
+def _latest_version(model_label, pk):
+    from reversion.models import Version
+
+    preloaded = getattr(_preloaded, 'versions', {})
+    key = (model_label, pk)
+    if key in preloaded:
+        return preloaded.pop(key)
+    row = Version.objects.get_for_object_reference(apps.get_model(model_label), pk) \
+        .values_list('pk', 'format', 'serialized_data').first()
+    return _parse_latest(*row) if row else None
+
+
+@contextmanager
+def preloaded_versions(model, pks):
+    """
+    Lê numa só query a última versão de cada objeto, antes de muitos reversion.add_to_revision seguidos
+    (ex: no fim de uma importação em bloco), em vez de uma query por objeto ao serializar.
+    """
+    from reversion.models import Version
+
+    pks = [str(pk) for pk in pks]
+    versions = Version.objects.get_for_model(model).filter(object_id__in=pks)
+    latest_ids = versions.values('object_id').annotate(latest=Max('pk')).values_list('latest', flat=True)
+    rows = Version.objects.filter(pk__in=list(latest_ids)).values_list('object_id', 'pk', 'format', 'serialized_data')
+
+    label = model._meta.label_lower
+    cache = {(label, pk): None for pk in pks}
+    for object_id, version_id, version_format, data in rows:
+        cache[(label, object_id)] = _parse_latest(version_id, version_format, data)
+
+    # os snapshots que ainda não estão em memória também são lidos de uma vez
+    missing = {latest[0] for latest in cache.values() if latest is not None and latest[0] not in _snapshots}
+    for version_id, data in Version.objects.filter(pk__in=missing).values_list('pk', 'serialized_data'):
+        _cache_snapshot(version_id, json.loads(data)[0]['fields'])
+
+    _preloaded.versions = cache
+    try:
+        yield
+    finally:
+        _preloaded.versions = {}
+
+
+class Serializer(PythonSerializer):
+
+    def encode(self, obj):
+        # os valores passam por JSON para ficarem iguais aos lidos da base de dados (datas em texto, ...)
+        fields = json.loads(_dumps(obj['fields']))
+        latest = _latest_version(obj['model'], str(obj['pk']))
+        if latest is not None:
+            base_id, count = latest
+            base_fields = snapshot_fields(base_id)
+            if base_fields is not None and count < SNAPSHOT_INTERVAL:
+                delta = {name: value for name, value in fields.items() if name not in base_fields or base_fields[name] != value}
+                if len(_dumps(delta)) <= SNAPSHOT_RATIO * len(_dumps(fields)):
+                    return {**obj, 'fields': delta, 'base': base_id, 'n': count + 1}
+        return {**obj, 'fields': fields}
+
+    def end_serialization(self):
+        # o resultado é calculado uma só vez (serializers.serialize() chama getvalue() duas vezes)
+        self.value = _dumps([self.encode(obj) for obj in self.objects])
+
+    def getvalue(self):
+        return self.value
+
+
+def Deserializer(stream_or_string, **options):
+    if not isinstance(stream_or_string, (bytes, str)):
+        stream_or_string = stream_or_string.read()
+    if isinstance(stream_or_string, bytes):
+        stream_or_string = stream_or_string.decode()
+    try:
+        objects = json.loads(stream_or_string)
+    except ValueError as error:
+        raise DeserializationError() from error
+
+    expanded = []
+    for obj in objects:
+        fields = obj['fields']
+        if obj.get('base') is not None:
+            base_fields = snapshot_fields(obj['base'])
+            if base_fields is None:
+                raise DeserializationError(f"Snapshot version {obj['base']} does not exist.")
+            fields = {**base_fields, **fields}
+        expanded.append({'model': obj['model'], 'pk': obj['pk'], 'fields': fields})
+    yield from PythonDeserializer(expanded, **options)
@@ -0,0 +1,80 @@
+# core/scheduling.py
+"""
+Linha temporal em memória dos conteúdos agendados (ScheduledQuerySet, em core/models.py: News, Warning e
+ContactTopMessage): 'active' mais um início e um fim opcionais (Model.schedule_fields).
+
+Cada processo lê uma vez por modelo o (pk, início, fim) das linhas ativas, que são poucas, e calcula a partir
+daí o conjunto das visíveis e os instantes em que esse conjunto muda. O conjunto visível só é recalculado
+quando passa o instante seguinte. As linhas só são relidas quando uma delas muda: os sinais em core/signals.py
+incrementam um contador de versão por modelo (core/caching.py), guardado na base de dados, por isso uma
+alteração feita noutro processo chega a este ao fim de no máximo CACHE_VERSION_CHECK_INTERVAL segundos.
+"""
+
+import bisect
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core.caching import bump_version, get_version
+
+# o fim da janela é inclusivo (fim >= agora): a linha só deixa de estar visível a seguir a esse instante
+END_OFFSET = timedelta(microseconds=1)
+
+_timelines = {}
+
+
+def in_window(start, end, moment):
+    """True se moment está dentro da janela [start, end] (cada limite é opcional)."""
+    return (start is None or start <= moment) and (end is None or end >= moment)
+
+
+def schedule_version_key(model):
+    return f'core:version:schedule:{model._meta.label_lower}'
+
+
+def bump_schedule_version(model):
+    bump_version(schedule_version_key(model))
+
+
+class ScheduleTimeline:
+
+    def __init__(self, model):
+        self.model = model
+        self.version = None
+        self.rows = []                  # (pk, início, fim) das linhas ativas
+        self.transitions = []           # instantes (ordenados) em que uma linha aparece ou desaparece
+        self.visible = None
+        self.valid_until = None
+
+    def load(self):
+        version = get_version(schedule_version_key(self.model))
+        if version == self.version:
+            return
+        start_field, end_field = self.model.schedule_fields
+        self.rows = list(self.model.objects.filter(active=True).values_list('pk', start_field, end_field))
+        moments = {start for _pk, start, _end in self.rows if start is not None}
+        moments.update(end + END_OFFSET for _pk, _start, end in self.rows if end is not None)
+        self.transitions = sorted(moments)
+        self.version = version
+        self.visible = None
+
+    def next_transition(self, moment=None):
+        """Próximo instante (depois de moment, agora por omissão) em que o conjunto visível muda; None se não houver."""
+        self.load()
+        index = bisect.bisect_right(self.transitions, moment or timezone.now())
+        return self.transitions[index] if index < len(self.transitions) else None
+
+    def visible_pks(self):
+        """pks das linhas visíveis agora."""
+        now = timezone.now()
+        self.load()
+        if self.visible is None or (self.valid_until is not None and now >= self.valid_until):
+            self.visible = frozenset(pk for pk, start, end in self.rows if in_window(start, end, now))
+            self.valid_until = self.next_transition(now)
+        return self.visible
+
+
+def schedule_timeline(model):
+    if model not in _timelines:
+        _timelines[model] = ScheduleTimeline(model)
+    return _timelines[model]
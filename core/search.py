@@ -0,0 +1,556 @@
+# core/search.py
+"""
+Pesquisa de termos com índice full-text.
+
+Cada Term dá origem a uma linha TermSearchDocument por idioma com conteúdo. O texto guardado já vem
+normalizado (fold_text): sem HTML, entidades descodificadas, minúsculas e sem acentos/diacríticos.
+O 'name' guarda o nome e o 'body' a descrição + fonte + conteúdo extra.
+Sobre essa tabela existe um índice full-text que depende da base de dados:
+- SQLite: tabela virtual FTS5 (external content), mantida por triggers;
+- Postgres: coluna tsvector gerada, com índice GIN.
+Noutras bases de dados (ou com o índice ainda vazio) as funções de pesquisa devolvem None
+e a view usa a pesquisa antiga com icontains.
+
+Para sugestões tolerantes a erros ("quis dizer") há um índice de trigramas sobre o nome:
+- SQLite: tabela auxiliar TermTrigram (trigrama -> documento);
+- Postgres: extensão pg_trgm com índice GIN sobre TermSearchDocument.name.
+"""
+
+import re
+import time
+import unicodedata
+from html import unescape
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from modeltranslation.utils import build_localized_fieldname
+
+from core.caching import bump_vocabulary_version
+
+FTS_TABLE = 'core_termsearchdocument_fts'
+DOCUMENT_TABLE = 'core_termsearchdocument'
+
+# limite de resultados devolvidos pelo índice (os mais relevantes); as pesquisas devolvem até MAX_RESULTS + 1 refs,
+# uma a mais para se saber que a lista foi cortada (ver truncate_refs)
+MAX_RESULTS = 5000
+
+# segundos até voltar a verificar se o índice está preenchido, enquanto não está
+INDEX_READY_RECHECK = 60
+
+# palavras da pesquisa (letras/dígitos em qualquer alfabeto)
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_TAG_RE = re.compile(r'<[^>]*>')
+# referência IEV ou prefixo: área '102', subárea '102-01' ou termo '102-01-03'
+_REFERENCE_RE = re.compile(r'^(\d{3})(?:-(\d{2})(?:-(\d{2}))?)?$')
+
+# campos do Term que entram no 'body' do documento de pesquisa
+BODY_FIELDS = ('description', 'source', 'extra')
+
+# sugestões por trigramas: semelhança mínima (igual ao default do pg_trgm) e nº de candidatos avaliados
+TRIGRAM_THRESHOLD = 0.3
+TRIGRAM_CANDIDATES = 200
+TRIGRAM_MAX_QUERY_GRAMS = 32
+# (SQLite) nº máximo de trigramas da pesquisa contados e de linhas lidas por trigrama
+TRIGRAM_COUNTED_GRAMS = 128
+TRIGRAM_MAX_GRAM_ROWS = 5000
+
+# Idiomas (códigos das settings) que podem conter texto de cada escrita não latina.
+# Uma pesquisa só com estas escritas só precisa de procurar nestes idiomas.
+SCRIPT_LANGUAGES = {
+    'CYRILLIC': ('ru', 'uk', 'bg', 'mk', 'sr', 'bs'),
+    'GREEK': ('el',),
+    'ARABIC': ('ar',),
+    'ARMENIAN': ('hy',),
+    'GEORGIAN': ('ka',),
+    'CJK': ('zh-hans', 'ja', 'ko'),          # ideogramas Han
+    'HIRAGANA': ('ja',),
+    'KATAKANA': ('ja',),
+    'HANGUL': ('ko',),
+}
+
+# diacríticos retirados por fold_text (ver _folded_mark)
+_GREEK_TONOS = '\u0301'
+_DIAERESIS = '\u0308'                                           # trema: no cirílico só é retirado do ё (е + trema)
+_ARABIC_HARAKAT = frozenset(chr(code) for code in range(0x064B, 0x0653))    # tashkeel: fatha, damma, kasra, shadda, ...
+_ARABIC_TATWEEL = '\u0640'
+
+_SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, body,
+        content='{DOCUMENT_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    # o nome pesa 10x mais do que a descrição no ranking (bm25)
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES('rank', 'bm25(10.0, 1.0)')",
+    f"""CREATE TRIGGER IF NOT EXISTS {DOCUMENT_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, body) VALUES (new.id, new.name, new.body);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {DOCUMENT_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, body) VALUES ('delete', old.id, old.name, old.body);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {DOCUMENT_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, body) VALUES ('delete', old.id, old.name, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, name, body) VALUES (new.id, new.name, new.body);
+    END""",
+    # reconstrói o índice a partir da tabela de conteúdo (útil depois de o Django recriar a tabela)
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')",
+]
+
+_SQLITE_UNINSTALL = [
+    f"DROP TRIGGER IF EXISTS {DOCUMENT_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {DOCUMENT_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {DOCUMENT_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# 'simple': sem stemming nem stopwords, porque o mesmo índice serve os 39 idiomas
+_POSTGRES_INSTALL = [
+    f"""ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+        ) STORED""",
+    f"CREATE INDEX IF NOT EXISTS {DOCUMENT_TABLE}_vector_gin ON {DOCUMENT_TABLE} USING gin (search_vector)",
+]
+
+# pg_trgm: o operador % usa o índice GIN e a função similarity() dá o ranking
+_POSTGRES_TRIGRAM_INSTALL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS {DOCUMENT_TABLE}_name_trgm ON {DOCUMENT_TABLE} USING gin (name gin_trgm_ops)",
+]
+
+_POSTGRES_TRIGRAM_UNINSTALL = [
+    f"DROP INDEX IF EXISTS {DOCUMENT_TABLE}_name_trgm",
+]
+
+_POSTGRES_UNINSTALL = [
+    f"DROP INDEX IF EXISTS {DOCUMENT_TABLE}_vector_gin",
+    f"ALTER TABLE {DOCUMENT_TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def install_fulltext_index(schema_editor):
+    """Cria o índice full-text da base de dados em uso (chamado pelas migrações, idempotente)."""
+    statements = {
+        'sqlite': _SQLITE_INSTALL,
+        'postgresql': _POSTGRES_INSTALL,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def uninstall_fulltext_index(schema_editor):
+    statements = {
+        'sqlite': _SQLITE_UNINSTALL,
+        'postgresql': _POSTGRES_UNINSTALL,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def install_trigram_index(schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in _POSTGRES_TRIGRAM_INSTALL:
+            schema_editor.execute(sql)
+
+
+def uninstall_trigram_index(schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in _POSTGRES_TRIGRAM_UNINSTALL:
+            schema_editor.execute(sql)
+
+
+def fulltext_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def search_languages():
+    """Códigos de idioma (das settings) indexados."""
+    return [lang_code for lang_code, _label in settings.LANGUAGES]
+
+
+def _folded_mark(base, mark):
+    """
+    Se a marca combinatória (depois do NFKD) é um diacrítico a retirar: acentos latinos, tonos grego,
+    o trema do ё e o tashkeel árabe. As outras ficam (й, ї, ў, sinais de vogal devanágari/tailandeses, dakuten...),
+    porque distinguem letras diferentes.
+    """
+    if mark in _ARABIC_HARAKAT:
+        return True
+    name = unicodedata.name(base, '')
+    if name.startswith('LATIN'):
+        return True
+    if name.startswith('GREEK'):
+        return mark == _GREEK_TONOS
+    return base in 'еЕ' and mark == _DIAERESIS
+
+
+def fold_text(value):
+    """
+    Normaliza texto para pesquisa: remove as tags HTML (CKEditor), descodifica entidades,
+    retira diacríticos (acentos latinos, tonos grego, ё -> е, tashkeel e tatweel árabe)
+    e converte para minúsculas (casefold). Espaços repetidos ficam reduzidos a um.
+    """
+    if not value:
+        return ''
+    text = unescape(_TAG_RE.sub(' ', value))
+    kept = []
+    base = ''
+    for ch in unicodedata.normalize('NFKD', text):
+        if ch == _ARABIC_TATWEEL:
+            continue
+        if unicodedata.category(ch) != 'Mn':
+            base = ch
+        elif _folded_mark(base, ch):
+            continue
+        kept.append(ch)
+    text = unicodedata.normalize('NFKC', ''.join(kept)).casefold()
+    return ' '.join(text.split())
+
+
+def parse_reference(query):
+    """
+    Reconhece uma referência IEV colada na pesquisa. Devolve (tipo, ref) com tipo 'term', 'subarea'
+    ou 'area', ou None se a pesquisa não for uma referência.
+    """
+    match = _REFERENCE_RE.match((query or '').strip())
+    if not match:
+        return None
+    area_id, subarea_id, term_id = match.groups()
+    if term_id:
+        return 'term', match.group(0)
+    if subarea_id:
+        return 'subarea', match.group(0)
+    return 'area', area_id
+
+
+def reference_range(prefix):
+    """Intervalo [início, fim) de refs com o prefixo dado: '102-01' -> ('102-01-', '102-01.'), pois '.' vem logo a seguir a '-'."""
+    return f'{prefix}-', f'{prefix}.'
+
+
+def detect_scripts(query):
+    """Escritas Unicode usadas pelas letras da pesquisa, ex: {'CYRILLIC'} ou {'LATIN', 'GREEK'}."""
+    scripts = set()
+    for ch in fold_text(query):
+        if not ch.isalpha():
+            continue
+        name = unicodedata.name(ch, '')
+        script = name.split(' ', 1)[0]
+        if 'KATAKANA' in name:                  # inclui HALFWIDTH KATAKANA
+            script = 'KATAKANA'
+        scripts.add(script or 'UNKNOWN')
+    return scripts
+
+
+def parse_languages(value):
+    """Lista de idiomas pedida explicitamente (ex: 'lang=ru' ou 'lang=pt,pt-br'), só com idiomas válidos."""
+    valid = set(search_languages())
+    languages = [code.strip().lower() for code in (value or '').split(',')]
+    return [code for code in languages if code in valid]
+
+
+def route_languages(query, override=None):
+    """
+    Planeia em que idiomas procurar: o 'lang=' explícito tem prioridade; senão, uma pesquisa escrita só
+    em alfabetos não latinos fica restrita aos idiomas que os usam (ex: cirílico -> ru, uk, bg, mk, sr, bs).
+    Devolve None para procurar em todos (texto latino, números, siglas e símbolos aparecem em qualquer idioma).
+    """
+    languages = parse_languages(override)
+    if languages:
+        return languages
+    scripts = detect_scripts(query)
+    if not scripts or not scripts <= set(SCRIPT_LANGUAGES):
+        return None
+    if all(len(token) < 2 for token in query_tokens(query)):
+        return None                             # letras soltas são símbolos (Ω, φ, μ), usados em todos os idiomas
+    allowed = set()
+    for script in scripts:
+        allowed.update(SCRIPT_LANGUAGES[script])
+    return [lang_code for lang_code in search_languages() if lang_code in allowed]
+
+
+def build_documents(term):
+    """Gera os documentos de pesquisa (não gravados) de um termo, um por idioma com conteúdo."""
+    from core.models import TermSearchDocument
+
+    documents = []
+    for lang_code in search_languages():
+        name = fold_text(getattr(term, build_localized_fieldname('name', lang_code), None))
+        body = ' '.join(
+            filter(None, (fold_text(getattr(term, build_localized_fieldname(base, lang_code), None)) for base in BODY_FIELDS))
+        )
+        if name or body:
+            documents.append(TermSearchDocument(term_id=term.ref, lang=lang_code, name=name, body=body))
+    return documents
+
+
+def index_terms(terms):
+    """(Re)indexa uma lista de termos: apaga os documentos antigos e cria os novos."""
+    from core.models import TermSearchDocument
+
+    terms = list(terms)
+    if not terms:
+        return
+    documents = []
+    for term in terms:
+        documents.extend(build_documents(term))
+    with transaction.atomic():
+        TermSearchDocument.objects.filter(term_id__in=[term.ref for term in terms]).delete()
+        TermSearchDocument.objects.bulk_create(documents, batch_size=500)
+        if connection.vendor == 'sqlite':
+            index_trigrams(documents)
+    _index_state['checked_at'] = None           # o índice pode ter deixado de estar vazio
+
+
+def index_term(term):
+    index_terms([term])
+
+
+def rebuild_index(batch_size=500):
+    """Reconstrói todo o índice a partir da tabela Term. Devolve o nº de termos indexados."""
+    from core.models import Term, TermSearchDocument, TermTrigram
+
+    TermTrigram.objects.all().delete()
+    TermSearchDocument.objects.all().delete()
+    total = 0
+    batch = []
+    for term in Term.objects.order_by('ref').iterator(chunk_size=batch_size):
+        batch.append(term)
+        if len(batch) >= batch_size:
+            index_terms(batch)
+            total += len(batch)
+            batch = []
+    index_terms(batch)
+    bump_vocabulary_version(refs=())            # os nomes dos termos não mudam: o autocomplete fica como está
+    return total + len(batch)
+
+
+_index_state = {'ready': False, 'checked_at': None}
+
+
+def search_index_ready():
+    """
+    O índice só é usado se a base de dados o suportar e se já tiver sido preenchido.
+    Depois de preenchido fica memorizado no processo; enquanto está vazio, a resposta é reutilizada durante
+    INDEX_READY_RECHECK segundos (ou até este processo indexar termos), para não fazer uma query em cada pesquisa.
+    """
+    if not _index_state['ready']:
+        checked_at = _index_state['checked_at']
+        if checked_at is None or time.monotonic() - checked_at >= INDEX_READY_RECHECK:
+            from core.models import TermSearchDocument
+
+            _index_state['ready'] = fulltext_supported() and TermSearchDocument.objects.exists()
+            _index_state['checked_at'] = time.monotonic()
+    return _index_state['ready']
+
+
+def query_tokens(query):
+    return _TOKEN_RE.findall(fold_text(query))
+
+
+def fulltext_term_refs(query, languages=None):
+    """
+    Pesquisa no índice full-text e devolve as refs dos termos, da mais relevante para a menos relevante.
+    Todas as palavras têm de aparecer, cada uma também por prefixo (como o icontains).
+    Devolve None se o índice não estiver disponível, para a view usar a pesquisa antiga.
+    """
+    tokens = query_tokens(query)
+    if not tokens or not search_index_ready():
+        return None
+
+    lang_filter = ''
+    params = []
+    if connection.vendor == 'sqlite':
+        # cada palavra entre aspas (evita a sintaxe do FTS5) e com prefixo, como o icontains fazia
+        params.append(' '.join('"%s"*' % token for token in tokens))
+        if languages:
+            lang_filter = f" AND d.lang IN ({', '.join(['%s'] * len(languages))})"
+            params.extend(languages)
+        sql = f"""
+            SELECT d.term_id, MIN(f.rank) AS score
+            FROM {FTS_TABLE} f JOIN {DOCUMENT_TABLE} d ON d.id = f.rowid
+            WHERE {FTS_TABLE} MATCH %s{lang_filter}
+            GROUP BY d.term_id
+            ORDER BY score, d.term_id
+            LIMIT {MAX_RESULTS + 1}
+        """
+    else:
+        params.append(' & '.join('%s:*' % token for token in tokens))
+        if languages:
+            lang_filter = " AND d.lang = ANY(%s)"
+            params.append(list(languages))
+        sql = f"""
+            SELECT d.term_id, MAX(ts_rank(d.search_vector, query)) AS score
+            FROM {DOCUMENT_TABLE} d, to_tsquery('simple', %s) query
+            WHERE d.search_vector @@ query{lang_filter}
+            GROUP BY d.term_id
+            ORDER BY score DESC, d.term_id
+            LIMIT {MAX_RESULTS + 1}
+        """
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def contains_term_refs(query, languages=None):
+    """
+    Pesquisa por substring no texto normalizado (apanha partes de palavras e texto CJK sem espaços).
+    Percorre apenas as colunas compactas do TermSearchDocument, nunca o HTML dos termos.
+    """
+    folded = fold_text(query)
+    if not folded or not search_index_ready():
+        return None
+
+    from core.models import TermSearchDocument
+
+    documents = TermSearchDocument.objects.filter(Q(name__contains=folded) | Q(body__contains=folded))
+    if languages:
+        documents = documents.filter(lang__in=languages)
+    refs = documents.order_by('term_id').values_list('term_id', flat=True).distinct()
+    return list(refs[:MAX_RESULTS + 1])
+
+
+def search_term_refs(query, languages=None):
+    """
+    Refs dos termos que correspondem à pesquisa, por ordem de relevância: primeiro o índice full-text
+    (palavras/prefixos); se não encontrar nada, procura a expressão como substring do texto normalizado.
+    Devolve None se o índice não estiver disponível. Pode devolver MAX_RESULTS + 1 refs (ver truncate_refs).
+    """
+    refs = fulltext_term_refs(query, languages)
+    if refs == []:
+        refs = contains_term_refs(query, languages)
+    return refs
+
+
+def truncate_refs(refs):
+    """(refs, cortada): as primeiras MAX_RESULTS refs de uma pesquisa e se havia mais do que essas."""
+    return refs[:MAX_RESULTS], len(refs) > MAX_RESULTS
+
+
+def trigrams(text):
+    """Conjunto de trigramas de um texto, como no pg_trgm: cada palavra com 2 espaços antes e 1 depois."""
+    grams = set()
+    for word in query_tokens(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def trigram_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def name_similarity(query, name):
+    """
+    Semelhança entre a pesquisa e um nome: a melhor entre o nome completo e cada sequência de palavras
+    do nome com o mesmo nº de palavras da pesquisa (parecido com o word_similarity do pg_trgm).
+    """
+    query_words = query_tokens(query)
+    name_words = query_tokens(name)
+    query_grams = trigrams(query)
+    best = trigram_similarity(query_grams, trigrams(name))
+    size = len(query_words)
+    for start in range(max(len(name_words) - size + 1, 0)):
+        window = ' '.join(name_words[start:start + size])
+        best = max(best, trigram_similarity(query_grams, trigrams(window)))
+    return best
+
+
+def index_trigrams(documents):
+    """Cria as linhas TermTrigram dos documentos (já gravados, com id)."""
+    from core.models import TermTrigram
+
+    rows = [
+        TermTrigram(document_id=document.pk, gram=gram)
+        for document in documents
+        for gram in trigrams(document.name)
+    ]
+    TermTrigram.objects.bulk_create(rows, batch_size=2000)
+
+
+def rarest_grams(cursor, grams):
+    """
+    (SQLite) Os TRIGRAM_MAX_QUERY_GRAMS trigramas da pesquisa que aparecem em menos documentos (os que mais
+    distinguem um nome). Cada contagem para em TRIGRAM_MAX_GRAM_ROWS + 1 linhas: um trigrama muito comum
+    não é contado até ao fim. Os que não aparecem em nenhum documento ficam de fora.
+    """
+    grams = sorted(grams)[:TRIGRAM_COUNTED_GRAMS]
+    sql = ' UNION ALL '.join(
+        f"SELECT %s, (SELECT COUNT(*) FROM (SELECT 1 FROM core_termtrigram WHERE gram = %s "
+        f"LIMIT {TRIGRAM_MAX_GRAM_ROWS + 1}))"
+        for _gram in grams
+    )
+    cursor.execute(sql, [value for gram in grams for value in (gram, gram)])
+    frequencies = sorted((count, gram) for gram, count in cursor.fetchall() if count)
+    return [gram for _count, gram in frequencies[:TRIGRAM_MAX_QUERY_GRAMS]]
+
+
+def similar_terms(query, languages=None, limit=5):
+    """
+    Termos com o nome mais parecido com a pesquisa (tolerante a erros de escrita), por semelhança de trigramas.
+    Devolve uma lista de dicts {'ref', 'lang', 'score'}, do mais parecido para o menos parecido.
+    O custo é limitado: só os TRIGRAM_CANDIDATES documentos com mais trigramas em comum são avaliados, e em SQLite
+    só são lidos os trigramas mais raros da pesquisa, até TRIGRAM_MAX_GRAM_ROWS documentos cada (rarest_grams).
+    """
+    query_grams = trigrams(query)
+    if not query_grams or not search_index_ready():
+        return []
+    folded = ' '.join(query_tokens(query))
+
+    if connection.vendor == 'postgresql':
+        # <% (word similarity) usa o índice GIN e aceita que a pesquisa seja só parte do nome
+        params = [folded, folded]
+        lang_filter = ''
+        if languages:
+            lang_filter = " AND lang = ANY(%s)"
+            params.append(list(languages))
+        sql = f"""
+            SELECT term_id, lang, name, word_similarity(%s, name) AS score
+            FROM {DOCUMENT_TABLE}
+            WHERE %s <%% name{lang_filter}
+            ORDER BY score DESC
+            LIMIT {TRIGRAM_CANDIDATES}
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            candidates = cursor.fetchall()
+    else:
+        with connection.cursor() as cursor:
+            # só os trigramas mais raros, e no máximo TRIGRAM_MAX_GRAM_ROWS documentos de cada um
+            grams = rarest_grams(cursor, query_grams)
+            if not grams:
+                return []
+            params = list(grams)
+            lang_filter = ''
+            if languages:
+                lang_filter = f" AND d.lang IN ({', '.join(['%s'] * len(languages))})"
+                params.extend(languages)
+            gram_rows = ' UNION ALL '.join(
+                f"SELECT * FROM (SELECT document_id FROM core_termtrigram WHERE gram = %s LIMIT {TRIGRAM_MAX_GRAM_ROWS})"
+                for _gram in grams
+            )
+            cursor.execute(f"""
+                SELECT d.term_id, d.lang, d.name, c.shared
+                FROM (
+                    SELECT document_id, COUNT(*) AS shared
+                    FROM ({gram_rows})
+                    GROUP BY document_id
+                ) c JOIN {DOCUMENT_TABLE} d ON d.id = c.document_id
+                WHERE 1 = 1{lang_filter}
+                ORDER BY c.shared DESC
+                LIMIT {TRIGRAM_CANDIDATES}
+            """, params)
+            candidates = cursor.fetchall()
+
+    # semelhança calculada aqui (igual nas duas bases de dados); fica o melhor idioma de cada termo
+    best = {}
+    for ref, lang, name, _rank in candidates:
+        score = name_similarity(folded, name)
+        if score >= TRIGRAM_THRESHOLD and score > best.get(ref, {}).get('score', 0):
+            best[ref] = {'ref': ref, 'lang': lang, 'score': score}
+    return sorted(best.values(), key=lambda item: (-item['score'], item['ref']))[:limit]
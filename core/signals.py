@@ -0,0 +1,108 @@
+# core/signals.py
+"""
+Receivers que mantêm estruturas derivadas (índices em memória) sincronizadas com os modelos.
+Ligados em CoreConfig.ready(). Ao contrário de Term.save/delete, o post_delete também é enviado
+quando o admin elimina vários objetos de uma vez (queryset.delete()).
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.caching import bump_areas_version, bump_home_version, bump_vocabulary_version
+from core.counters import recount, subarea_count_changed, term_count_changed
+from core.models import Area, ContactTopMessage, Job, News, Poster, SubArea, Term, Warning
+from core.scheduling import bump_schedule_version
+from core.search import index_term
+from core.suggest import prefix_index
+from core.term_storage import normalized_storage_enabled, sync_translations
+
+
+@receiver(post_save, sender=Term)
+def term_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        # gravado sem passar pelo Term.save: reverter/recuperar uma versão no admin (reversion) ou loaddata.
+        # O índice de pesquisa e a tabela estreita, que o Term.save atualiza, são refeitos aqui (é idempotente)
+        index_term(instance)
+        if normalized_storage_enabled():
+            sync_translations([instance])
+    prefix_index.update_term(instance)
+    bump_vocabulary_version([instance.ref])     # invalida os resultados de pesquisa em cache
+
+
+@receiver(post_delete, sender=Term)
+def term_deleted(sender, instance, **kwargs):
+    prefix_index.remove_term(instance.ref)
+    bump_vocabulary_version([instance.ref])
+
+
+# Contadores de termos/subáreas (core/counters.py). Como a ref do termo inclui a subárea, mudar um termo de subárea
+# no admin grava um termo novo (created); a mudança sem criar uma linha nova só acontece se a ref não mudar.
+@receiver(post_save, sender=Term)
+def term_counted(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # reverter/recuperar no admin (reversion) ou loaddata: recalcula a subárea a partir da tabela (idempotente,
+        # não soma duas vezes se os contadores gravados vierem no mesmo fixture)
+        recount({instance.subarea_id})
+        return
+    if created:
+        term_count_changed(instance.subarea_id, 1)
+        return
+    previous = instance.get_loaded_values(['subarea_id']).get('subarea_id')       # FieldTrackingMixin
+    if previous and previous != instance.subarea_id:
+        term_count_changed(previous, -1)
+        term_count_changed(instance.subarea_id, 1)
+
+
+@receiver(post_delete, sender=Term)
+def term_uncounted(sender, instance, **kwargs):
+    term_count_changed(instance.subarea_id, -1)
+
+
+@receiver(post_save, sender=SubArea)
+def subarea_counted(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        recount({instance.pk})                  # idem (subárea recuperada: termos dela e subáreas da área)
+    elif created:
+        subarea_count_changed(instance.area_id, 1)
+
+
+@receiver(post_delete, sender=SubArea)
+def subarea_uncounted(sender, instance, **kwargs):
+    subarea_count_changed(instance.area_id, -1)
+
+
+# Lista de áreas da navbar em memória em cada processo (core/context_processors.py)
+@receiver(post_save, sender=Area)
+@receiver(post_delete, sender=Area)
+def area_changed(sender, instance, **kwargs):
+    bump_areas_version()
+
+
+# Conteúdo da homepage em cache (core/homepage.py)
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+@receiver(post_save, sender=Warning)
+@receiver(post_delete, sender=Warning)
+@receiver(post_save, sender=Poster)
+@receiver(post_delete, sender=Poster)
+def home_content_changed(sender, instance, **kwargs):
+    bump_home_version()
+
+
+# Linha temporal dos conteúdos agendados (core/scheduling.py)
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+@receiver(post_save, sender=Warning)
+@receiver(post_delete, sender=Warning)
+@receiver(post_save, sender=ContactTopMessage)
+@receiver(post_delete, sender=ContactTopMessage)
+def schedule_changed(sender, instance, **kwargs):
+    bump_schedule_version(sender)
+
+
+@receiver(post_delete, sender=Job)
+def job_deleted(sender, instance, **kwargs):
+    # o ficheiro enviado e o exportado só servem ao job
+    for file in (instance.input_file, instance.result_file):
+        if file:
+            file.delete(save=False)
@@ -0,0 +1,189 @@
+# core/suggest.py
+"""
+Autocomplete dos nomes dos termos, sem ir à base de dados em cada tecla.
+
+Por idioma há uma lista ordenada de (chave, ref), onde a chave é o nome normalizado (fold_text)
+a partir do início de cada palavra ("electric current" -> "electric current", "current").
+A pesquisa por prefixo é um bisect nessa lista. O índice é construído uma vez por processo
+(no arranque do worker ou no primeiro pedido) e atualizado termo a termo quando um Term muda neste processo.
+Guarda a versão do vocabulário (core/caching.py) em que foi lido: se outro processo mudar os termos (outro worker,
+uma importação no run_jobs), a versão muda e o índice relê, numa thread à parte, só os termos registados nas
+alterações entretanto (VocabularyChange). Só o volta a ler inteiro se faltarem alterações (antigas demais, ou
+feitas sem refs) ou se forem muitos termos. Entretanto as sugestões continuam a sair do índice que já existe.
+"""
+
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connections
+from modeltranslation.utils import build_localized_fieldname
+
+from core.caching import vocabulary_version
+from core.search import fold_text
+
+# a partir de quantos termos alterados é mais rápido reconstruir o índice do que atualizá-lo termo a termo
+MAX_INCREMENTAL_REFS = 1000
+
+
+def _keys(name):
+    """Chaves de um nome: o nome normalizado a começar em cada palavra."""
+    words = fold_text(name).split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._refreshing = False            # há uma thread a atualizar o índice
+        self._version = None                # vocabulary_version() lida antes de construir o índice
+        self._entries = {}                  # lang -> lista ordenada de (chave, ref)
+        self._names = {}                    # lang -> {ref: (nome original, nome normalizado)}
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def build(self):
+        """(Re)constrói o índice a partir de Term.name_<lang> para todos os idiomas."""
+        from core.models import Term
+
+        # lida antes dos termos: uma alteração feita durante a leitura volta a mudar a versão
+        version = vocabulary_version()
+        languages = [lang_code for lang_code, _label in settings.LANGUAGES]
+        fields = [build_localized_fieldname('name', lang_code) for lang_code in languages]
+        entries = {lang_code: [] for lang_code in languages}
+        names = {lang_code: {} for lang_code in languages}
+
+        for row in Term.objects.values_list('ref', *fields).iterator(chunk_size=2000):
+            ref = row[0]
+            for lang_code, name in zip(languages, row[1:]):
+                if name and name.strip():
+                    names[lang_code][ref] = (name, fold_text(name))
+                    entries[lang_code].extend((key, ref) for key in _keys(name))
+
+        for lang_entries in entries.values():
+            lang_entries.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._names = names
+            self._version = version
+            self._loaded = True
+
+    def refresh(self):
+        """Aplica as alterações do vocabulário feitas (noutros processos) desde a versão em que o índice foi lido."""
+        from core.models import Term, VocabularyChange
+
+        if not self._loaded:
+            self.build()
+            return
+        version = vocabulary_version()
+        if version == self._version:
+            return
+        changes = list(VocabularyChange.objects.filter(version__gt=self._version, version__lte=version)
+                       .values_list('refs', flat=True))
+        refs = {ref for change_refs in changes for ref in change_refs}
+        if len(changes) < version - self._version or len(refs) > MAX_INCREMENTAL_REFS:
+            self.build()
+            return
+
+        languages = list(self._entries)
+        fields = [build_localized_fieldname('name', lang_code) for lang_code in languages]
+        rows = {row[0]: row[1:] for row in Term.objects.filter(ref__in=refs).values_list('ref', *fields)}
+        with self._lock:
+            for ref in refs:
+                names = rows.get(ref)
+                if names is None:
+                    self._remove_ref(ref)       # eliminado
+                else:
+                    self._set_names(ref, dict(zip(languages, names)))
+            self._version = version
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+            connections.close_all()             # a ligação à base de dados desta thread
+
+    def ensure_current(self):
+        """Constrói o índice, se ainda não existe; se o vocabulário mudou, atualiza-o numa thread à parte."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.build()
+        elif self._version != vocabulary_version() and not self._refreshing:
+            with self._lock:
+                if self._refreshing:
+                    return
+                self._refreshing = True
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def _remove(self, lang_code, ref):
+        names = self._names.get(lang_code, {}).pop(ref, None)
+        if names is None:
+            return
+        lang_entries = self._entries[lang_code]
+        for key in _keys(names[0]):
+            position = bisect_left(lang_entries, (key, ref))
+            if position < len(lang_entries) and lang_entries[position] == (key, ref):
+                del lang_entries[position]
+
+    def _remove_ref(self, ref):
+        for lang_code in self._entries:
+            self._remove(lang_code, ref)
+
+    def _set_names(self, ref, names):
+        """names: {idioma: nome} de um termo."""
+        self._remove_ref(ref)
+        for lang_code, name in names.items():
+            if name and name.strip():
+                self._names[lang_code][ref] = (name, fold_text(name))
+                for key in _keys(name):
+                    insort(self._entries[lang_code], (key, ref))
+
+    def update_term(self, term):
+        """Atualiza as entradas de um termo (chamado depois de gravar)."""
+        if not self._loaded:
+            return                          # ainda não construído: será lido já atualizado
+        with self._lock:
+            self._set_names(term.ref, {lang_code: getattr(term, build_localized_fieldname('name', lang_code), None)
+                                       for lang_code in self._entries})
+
+    def remove_term(self, ref):
+        if not self._loaded:
+            return
+        with self._lock:
+            self._remove_ref(ref)
+
+    def suggest(self, prefix, lang_code, limit=10):
+        """
+        Até 'limit' termos cujo nome (ou uma palavra do nome) começa por 'prefix'.
+        Primeiro os que começam no início do nome, depois os mais curtos.
+        """
+        self.ensure_current()
+        key = fold_text(prefix)
+        lang_entries = self._entries.get(lang_code)
+        if not key or not lang_entries:
+            return []
+
+        names = self._names[lang_code]
+        found = {}
+        position = bisect_left(lang_entries, (key,))
+        # lê alguns candidatos a mais para poder ordenar pelo início do nome
+        while position < len(lang_entries) and len(found) < limit * 5:
+            entry_key, ref = lang_entries[position]
+            if not entry_key.startswith(key):
+                break
+            found[ref] = names[ref][1].startswith(key)
+            position += 1
+
+        ranked = sorted(found.items(), key=lambda item: (not item[1], len(names[item[0]][0]), item[0]))
+        return [{'ref': ref, 'name': names[ref][0]} for ref, _starts in ranked[:limit]]
+
+
+# índice único por processo
+prefix_index = PrefixIndex()
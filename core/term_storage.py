@@ -0,0 +1,101 @@
+# core/term_storage.py
+"""
+Armazenamento normalizado das traduções dos termos (TermTranslation).
+
+O modeltranslation guarda cada campo traduzido numa coluna por idioma (name_en, name_pt_br, ...): cada linha
+de core_term tem ~200 colunas e cada idioma novo obriga a uma migração que reescreve a tabela. A tabela
+TermTranslation guarda o mesmo conteúdo numa linha estreita por (termo, idioma).
+
+As colunas do modeltranslation continuam a ser o formato de edição (TermAdmin, TermResource e term.name_<lang>
+leem e escrevem nelas), por isso no modo "normalized" as duas formas são escritas: cada gravação de um Term
+atualiza também as suas linhas (sem apagar as de idiomas que só existem na tabela estreita). A página do termo
+lê o conteúdo por Term.translation(), que no modo "normalized" vem da tabela estreita.
+O comando convert_term_translations copia as colunas existentes para a tabela estreita, e de volta com --to-wide
+(ex: depois de acrescentar a coluna de um idioma novo).
+"""
+
+from django.conf import settings
+from django.db import transaction
+from modeltranslation.utils import build_localized_fieldname
+
+from core.models import Term, TermTranslation
+
+# campos do Term traduzidos pelo modeltranslation (core/translation.py)
+TRANSLATED_FIELDS = ('name', 'description', 'source', 'extra', 'published_at')
+
+
+def normalized_storage_enabled():
+    return settings.TERM_TRANSLATION_STORAGE == 'normalized'
+
+
+def wide_columns(lang_code):
+    """Colunas do modeltranslation de um idioma que existem no modelo (um idioma só da tabela estreita não tem)."""
+    names = {field.name for field in Term._meta.concrete_fields}
+    return {field: build_localized_fieldname(field, lang_code) for field in TRANSLATED_FIELDS
+            if build_localized_fieldname(field, lang_code) in names}
+
+
+def build_translations(term):
+    """
+    (linhas, idiomas vazios) a partir das colunas de um termo: uma linha TermTranslation por idioma com conteúdo,
+    e os idiomas com colunas mas sem conteúdo. Os idiomas sem colunas ficam de fora.
+    """
+    rows, empty = [], []
+    for lang_code, _label in settings.LANGUAGES:
+        columns = wide_columns(lang_code)
+        if not columns:
+            continue
+        values = {field: getattr(term, column) for field, column in columns.items()}
+        if any(value not in (None, '') for value in values.values()):
+            rows.append(TermTranslation(term_id=term.pk, lang=lang_code, **values))
+        else:
+            empty.append(lang_code)
+    return rows, empty
+
+
+def sync_translations(terms):
+    """
+    Atualiza as linhas TermTranslation dos termos dados com o conteúdo atual das suas colunas (upsert).
+    Só toca nos idiomas que têm colunas: as linhas de um idioma que só existe na tabela estreita ficam intactas.
+    """
+    rows, empty = [], {}
+    for term in terms:
+        term_rows, term_empty = build_translations(term)
+        rows.extend(term_rows)
+        for lang_code in term_empty:
+            empty.setdefault(lang_code, []).append(term.pk)
+    with transaction.atomic():
+        for lang_code, refs in empty.items():
+            TermTranslation.objects.filter(lang=lang_code, term__in=refs).delete()
+        TermTranslation.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['term', 'lang'], update_fields=list(TRANSLATED_FIELDS),
+        )
+
+
+def apply_translations(term, rows):
+    """Copia as linhas da tabela estreita para as colunas do termo (sem gravar). Devolve as colunas alteradas."""
+    changed = []
+    for row in rows:
+        for field, column in wide_columns(row.lang).items():
+            setattr(term, column, getattr(row, field))
+            changed.append(column)
+    return changed
+
+
+def get_translation(term, lang_code):
+    """
+    Conteúdo de um termo num idioma, como TermTranslation (não gravado quando vem das colunas).
+    No modo "normalized" lê da tabela estreita (aproveita um prefetch_related('translations')),
+    e usa as colunas enquanto o termo ainda não foi convertido.
+    """
+    if normalized_storage_enabled():
+        prefetched = getattr(term, '_prefetched_objects_cache', {}).get('translations')
+        if prefetched is not None:
+            rows = [row for row in prefetched if row.lang == lang_code]
+        else:
+            rows = list(term.translations.filter(lang=lang_code)[:1])
+        if rows:
+            return rows[0]
+
+    values = {field: getattr(term, column) for field, column in wide_columns(lang_code).items()}
+    return TermTranslation(term=term, lang=lang_code, **values)
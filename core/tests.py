@@ -0,0 +1,896 @@
+# core/tests.py
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+import reversion
+import tablib
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from reversion.models import Revision, Version
+
+from core.admin import TermResource
+from core.caching import AREAS_VERSION_KEY, VOCABULARY_VERSION_KEY, bump_vocabulary_version, vocabulary_version
+from core.context_processors import navbar_areas
+from core.exporting import export_columns, stream_terms_response
+from core.homepage import home_content
+from core.importing import import_terms, read_chunks
+from core.jobs import fail_stale_jobs
+from core.middleware import NAVIGATION_COOKIE_MAX_SIZE, NAVIGATION_STACK_SIZE, NavigationStackMiddleware
+from core import revision_storage, scheduling, search
+from core.search import fold_text, rarest_grams, route_languages, search_index_ready, similar_terms, trigrams
+from core.models import Area, CacheVersion, Job, News, SubArea, Term, TermSearchDocument, TermTranslation, Warning
+from core.permissions import UserCapabilities
+from core.scheduling import ScheduleTimeline, schedule_version_key
+from core.suggest import PrefixIndex
+from core.term_storage import sync_translations
+from core.views import TermFilterMixin
+
+
+# sem o manifest do collectstatic (os templates usam {% static %})
+PLAIN_STATIC_STORAGES = {**settings.STORAGES,
+                         'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+
+
+class VocabularyTestCase(TestCase):
+    """Área 102 e subárea 102-01, partilhadas pelos testes; add_term cria um termo nessa subárea."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.area = Area.objects.create(id='102', name_en='Area 102')
+        cls.subarea = SubArea(id='01', area=cls.area, name_en='Sub 102-01')
+        cls.subarea.save()
+
+    @classmethod
+    def add_term(cls, id, **fields):
+        term = Term(subarea=cls.subarea, id=id, **fields)
+        term.save()
+        return term
+
+    def setUp(self):
+        # a versão do vocabulário não muda dentro das transações dos testes: a cache de pesquisa passaria entre testes
+        cache.clear()
+
+    def login(self):
+        self.client.force_login(User.objects.create_user('reader'))
+
+
+class TermListDataTests(VocabularyTestCase):
+    """JSON do DataTables (server-side): draw, paginação, ordenação e caixa de pesquisa."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number, name in enumerate(['beta', 'alpha', 'gamma'], 1):
+            cls.add_term(f'{number:02d}', name_en=name)
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def get_data(self, **params):
+        return self.client.get(reverse('term-list-data'), {'draw': '3', **params}).json()
+
+    def test_draw_and_page(self):
+        data = self.get_data(start='1', length='1')
+        self.assertEqual(data['draw'], 3)
+        self.assertEqual((data['recordsTotal'], data['recordsFiltered']), (3, 3))
+        self.assertEqual([row['ref'] for row in data['data']], ['102-01-02'])
+        self.assertEqual(data['data'][0]['url'], reverse('term_detail', args=['102-01-02']))
+
+    def test_order_by_name(self):
+        data = self.get_data(**{'order[0][column]': '1', 'order[0][dir]': 'desc'})
+        self.assertEqual([row['name'] for row in data['data']], ['gamma', 'beta', 'alpha'])
+
+    def test_search_box_filters(self):
+        data = self.get_data(**{'search[value]': 'alp'})
+        self.assertEqual((data['recordsTotal'], data['recordsFiltered']), (3, 1))
+        self.assertEqual([row['name'] for row in data['data']], ['alpha'])
+
+    def test_page_length_is_capped(self):
+        with mock.patch('core.views.TermListDataView.max_page_length', 2):
+            data = self.get_data(length='-1')
+        self.assertEqual(len(data['data']), 2)
+
+    def test_suggestions_come_with_the_json(self):
+        data = self.get_data(q='betta')
+        self.assertEqual(data['suggestions'][0]['name'], 'beta')
+        self.assertEqual(data['suggestions'][0]['url'], f"{reverse('term-list')}?q=beta")
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+    def test_html_page_does_not_search(self):
+        with mock.patch.object(TermFilterMixin, 'get_search_results') as get_search_results:
+            response = self.client.get(reverse('term-list'), {'q': 'beta'})
+        self.assertEqual(response.status_code, 200)
+        get_search_results.assert_not_called()
+
+
+class CursorPaginationTests(VocabularyTestCase):
+    """Paginação por cursor (?after=...&limit=...) do mesmo endpoint, fora do DataTables."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(1, 6):
+            cls.add_term(f'{number:02d}', name_en=f'term {number}')
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def get_page(self, **params):
+        return self.client.get(reverse('term-list-data'), params)
+
+    def test_pages_follow_the_cursor(self):
+        refs = []
+        data = self.get_page(limit='2').json()
+        while True:
+            refs += [row['ref'] for row in data['results']]
+            if not data['next']:
+                break
+            data = self.client.get(data['next_url']).json()
+        self.assertEqual(refs, [f'102-01-{number:02d}' for number in range(1, 6)])
+
+    def test_plain_ref_starts_after_it(self):
+        data = self.get_page(after='102-01-03', limit='10').json()
+        self.assertEqual([row['ref'] for row in data['results']], ['102-01-04', '102-01-05'])
+        self.assertIsNone(data['next'])
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = self.get_page(limit='2').json()['next']
+        self.assertEqual(self.get_page(after=cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')).status_code, 400)
+
+
+class ReferenceSearchTests(VocabularyTestCase):
+    """Uma referência IEV na pesquisa: a de um termo abre o detalhe, a de uma área ou subárea filtra a lista."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        other = SubArea(id='02', area=cls.area, name_en='Sub 102-02')
+        other.save()
+        cls.add_term('01', name_en='voltage')
+        Term(subarea=other, id='01', name_en='current').save()
+
+    def setUp(self):
+        super().setUp()
+        self.login()
+
+    def test_term_reference_redirects_to_detail(self):
+        response = self.client.get(reverse('term-list'), {'q': ' 102-02-01 '})
+        self.assertRedirects(response, reverse('term_detail', args=['102-02-01']), fetch_redirect_response=False)
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+    def test_unknown_term_reference_stays_on_the_list(self):
+        self.assertEqual(self.client.get(reverse('term-list'), {'q': '102-02-99'}).status_code, 200)
+
+    def test_partial_reference_filters(self):
+        def refs(q):
+            data = self.client.get(reverse('term-list-data'), {'q': q, 'draw': '1'}).json()
+            return [row['ref'] for row in data['data']]
+
+        self.assertEqual(refs('102-01'), ['102-01-01'])
+        self.assertEqual(refs('102'), ['102-01-01', '102-02-01'])
+        self.assertEqual(refs('103'), [])
+
+
+class SmallBatchTermResource(TermResource):
+    class Meta(TermResource.Meta):
+        batch_size = 2
+
+
+class RepeatedRefImportTests(VocabularyTestCase):
+    """Uma ref repetida no ficheiro: como no save linha a linha, a última linha ganha (e a importação não falha)."""
+
+    def dataset(self, *rows):
+        return tablib.Dataset(*[[ref, self.subarea.pk, ref.rsplit('-', 1)[-1], name] for ref, name in rows],
+                              headers=['ref', 'subarea', 'id', 'name_en'])
+
+    def assertImported(self, result, ref, name):
+        self.assertFalse(result.has_errors(), [error.error for row in result.error_rows for error in row.errors])
+        self.assertFalse(result.base_errors, [error.error for error in result.base_errors])
+        term = Term.objects.get(ref=ref)
+        self.assertEqual(term.name_en, name)
+        self.assertEqual(TermSearchDocument.objects.filter(term=term, lang='en').count(), 1)
+
+    def test_new_ref_repeated(self):
+        result = TermResource().import_data(
+            self.dataset(('102-01-01', 'first'), ('102-01-01', 'second')), use_transactions=True)
+        self.assertImported(result, '102-01-01', 'second')
+        self.assertEqual(Term.objects.count(), 1)
+
+    def test_new_ref_repeated_in_another_batch(self):
+        result = SmallBatchTermResource().import_data(
+            self.dataset(('102-01-01', 'first'), ('102-01-02', 'other'), ('102-01-03', 'third'),
+                         ('102-01-01', 'last')), use_transactions=True)
+        self.assertImported(result, '102-01-01', 'last')
+        self.assertEqual(Term.objects.count(), 3)
+
+    def test_existing_ref_repeated(self):
+        Term(id='01', subarea=self.subarea, name_en='stored').save()
+        result = TermResource().import_data(
+            self.dataset(('102-01-01', 'first'), ('102-01-01', 'second')), use_transactions=True)
+        self.assertImported(result, '102-01-01', 'second')
+
+    def test_existing_ref_repeated_back_to_stored_value(self):
+        Term(id='01', subarea=self.subarea, name_en='stored').save()
+        result = TermResource().import_data(
+            self.dataset(('102-01-01', 'changed'), ('102-01-01', 'stored')), use_transactions=True)
+        self.assertImported(result, '102-01-01', 'stored')
+        self.assertEqual(Term.objects.get(ref='102-01-01').content_hashes, Term.objects.get(ref='102-01-01').compute_content_hashes())
+
+    def test_streaming_import_with_repeated_refs(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', encoding='utf-8') as csv_file:
+            csv_file.write('ref,name_en\n102-01-01,first\n102-01-02,other\n102-01-01,last\n')
+        try:
+            totals = import_terms(path, batch_size=2)
+        finally:
+            os.remove(path)
+        self.assertEqual(totals['error'], 0)
+        self.assertEqual(Term.objects.get(ref='102-01-01').name_en, 'last')
+        self.assertEqual(Term.objects.count(), 2)
+
+
+class ReimportTests(VocabularyTestCase):
+    """Reimportar o mesmo ficheiro: só as linhas com conteúdo diferente (hash por idioma) são gravadas."""
+
+    def import_rows(self, *names):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w', newline='', encoding='utf-8') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['ref', 'subarea', 'id', 'name_en'])
+            writer.writerows([f'102-01-{number:02d}', '102-01', f'{number:02d}', name] for number, name in enumerate(names, 1))
+        try:
+            return import_terms(path)
+        finally:
+            os.remove(path)
+
+    def test_unchanged_rows_are_skipped(self):
+        self.import_rows('voltage', 'current', 'power')
+        unchanged = Term.objects.get(ref='102-01-01')
+        versions = Version.objects.get_for_object(unchanged).count()
+        self.assertEqual(versions, 1)
+
+        totals = self.import_rows('voltage', 'electric current', 'power')
+
+        self.assertEqual((totals['skip'], totals['update'], totals['new']), (2, 1, 0))
+        self.assertEqual(Term.objects.get(ref='102-01-01').updated, unchanged.updated)
+        self.assertEqual(Version.objects.get_for_object(unchanged).count(), versions)
+        changed = Term.objects.get(ref='102-01-02')
+        self.assertEqual(changed.name_en, 'electric current')
+        self.assertEqual(changed.content_hashes, changed.compute_content_hashes())
+
+
+class ChunkedImportTests(VocabularyTestCase):
+    """Importação de CSV/XLSX em blocos de batch_size linhas, sem passar o ficheiro inteiro pelo tablib."""
+
+    rows = [['ref', 'subarea', 'id', 'name_en']] + [[f'102-01-{number:02d}', '102-01', f'{number:02d}', f'term {number}']
+                                                     for number in range(1, 6)]
+
+    def write_csv(self, directory=None):
+        handle, path = tempfile.mkstemp(suffix='.csv', dir=directory)
+        with os.fdopen(handle, 'w', newline='', encoding='utf-8') as csv_file:
+            csv.writer(csv_file).writerows(self.rows)
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        return path
+
+    def test_csv_and_xlsx_are_read_in_batches(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        for row in self.rows + [[None] * 4]:                # linha vazia no fim, como nas folhas do Excel
+            workbook.active.append(row)
+        handle, xlsx_path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(handle)
+        self.addCleanup(os.remove, xlsx_path)
+        workbook.save(xlsx_path)
+
+        for path in (self.write_csv(), xlsx_path):
+            chunks = list(read_chunks(path, batch_size=2))
+            self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+            self.assertEqual(chunks[0].headers, self.rows[0])
+            self.assertEqual(chunks[2][0][3], 'term 5')
+
+    def test_admin_confirmed_import_is_read_in_batches(self):
+        from import_export.formats.base_formats import TablibFormat
+
+        self.client.force_login(User.objects.create_superuser('admin'))
+        path = self.write_csv(directory=tempfile.gettempdir())              # onde o TempFolderStorage o guarda
+        with mock.patch.object(TablibFormat, 'create_dataset', side_effect=AssertionError('read by tablib')):
+            response = self.client.post(reverse('admin:core_term_process_import'), {
+                'import_file_name': os.path.basename(path), 'original_file_name': 'terms.csv',
+                'format': '0', 'resource': '0',
+            })
+        self.assertRedirects(response, reverse('admin:core_term_changelist'), fetch_redirect_response=False)
+        self.assertEqual(Term.objects.count(), 5)
+        self.assertFalse(os.path.exists(path))
+
+
+class StreamExportTests(VocabularyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.add_term('10', name_en='voltage')
+        cls.add_term('11', name_en='current')
+
+    def test_csv_rows_are_read_while_streaming(self):
+        with self.assertNumQueries(0):
+            response = stream_terms_response(Term.objects.all(), 'csv', ['en'])
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], export_columns(['en']))
+        self.assertEqual([row[:4] for row in rows[1:]],
+                         [['102-01-10', '102-01', '10', 'voltage'], ['102-01-11', '102-01', '11', 'current']])
+
+    def test_xlsx_has_the_same_rows(self):
+        from openpyxl import load_workbook
+
+        response = stream_terms_response(Term.objects.all(), 'xlsx', ['en'])
+        sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)['Terms']
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(list(rows[0]), export_columns(['en']))
+        self.assertEqual([row[3] for row in rows[1:]], ['voltage', 'current'])
+
+
+class FieldTrackingTests(VocabularyTestCase):
+    """Os valores carregados (from_db) dizem o que mudou sem voltar a ler a linha antes de gravar."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.add_term('01', name_en='voltage')
+
+    def test_changed_fields(self):
+        term = Term.objects.get(ref='102-01-01')
+        self.assertEqual(term.get_changed_fields(['name_en', 'name_fr']), set())
+        term.name_fr = 'tension'
+        self.assertEqual(term.get_changed_fields(['name_en', 'name_fr']), {'name_fr'})
+        self.assertEqual(Term(subarea=self.subarea, id='02').get_changed_fields(['name_en']), {'name_en'})
+
+    def test_save_does_not_read_the_term_again(self):
+        term = Term.objects.get(ref='102-01-01')
+        term.name_fr = 'tension'
+        with CaptureQueriesContext(connection) as queries:
+            term.save()
+        term_selects = [query['sql'] for query in queries
+                        if query['sql'].startswith('SELECT') and 'FROM "core_term"' in query['sql']]
+        self.assertEqual(term_selects, [])
+        self.assertIsNotNone(Term.objects.get(ref='102-01-01').published_at_fr)
+
+    def test_deferred_fields_are_read_in_one_query(self):
+        term = Term.objects.only('ref').get(ref='102-01-01')
+        with self.assertNumQueries(1):
+            self.assertEqual(term.get_loaded_values(['name_en', 'name_fr']), {'name_en': 'voltage', 'name_fr': None})
+            self.assertEqual(term.name_en, 'voltage')
+
+    def test_published_at_is_stamped_once(self):
+        term = Term.objects.get(ref='102-01-01')
+        stamped = term.published_at_en
+        self.assertIsNotNone(stamped)
+        term.name_en = 'electric voltage'
+        term.save()
+        self.assertEqual(Term.objects.get(ref='102-01-01').published_at_en, stamped)
+
+
+class RevertTermTests(VocabularyTestCase):
+    """Reverter uma versão (reversion) grava o termo sem Term.save (raw): as estruturas derivadas têm de acompanhar."""
+
+    def test_revert_reindexes_term(self):
+        with reversion.create_revision():
+            Term(id='01', subarea=self.subarea, name_en='voltage').save()
+        with reversion.create_revision():
+            term = Term.objects.get(ref='102-01-01')
+            term.name_en = 'current'
+            term.save()
+
+        version_before = vocabulary_version()
+        with self.captureOnCommitCallbacks(execute=True):          # a versão só muda depois do commit
+            Version.objects.get_for_object(term).last().revert()    # a versão mais antiga
+
+        self.assertEqual(Term.objects.get(ref='102-01-01').name_en, 'voltage')
+        self.assertEqual(TermSearchDocument.objects.get(term_id='102-01-01', lang='en').name, 'voltage')
+        self.assertNotEqual(vocabulary_version(), version_before)
+
+    def test_recover_deleted_term_counts_it(self):
+        with reversion.create_revision():
+            Term(id='01', subarea=self.subarea, name_en='voltage').save()
+        term = Term.objects.get(ref='102-01-01')
+        version = Version.objects.get_for_object(term).first()
+        term.delete()
+        self.assertEqual(SubArea.objects.get(pk=self.subarea.pk).term_count, 0)
+
+        version.revert()                                            # "Recover deleted" do VersionAdmin
+
+        self.assertEqual(SubArea.objects.get(pk=self.subarea.pk).term_count, 1)
+        self.assertEqual(Area.objects.get(pk='102').term_count, 1)
+
+
+class RevisionStorageMixin:
+
+    def setUp(self):
+        super().setUp()
+        # os ids das Versions repetem-se entre testes (rollback): os snapshots em memória de outro teste não servem
+        revision_storage._snapshots.clear()
+
+    def save_versions(self, *names):
+        """Grava o termo 102-01-01 uma vez por nome, cada uma numa revisão; devolve as Versions, da mais antiga."""
+        for name in names:
+            with reversion.create_revision():
+                term = Term.objects.filter(ref='102-01-01').first() or Term(subarea=self.subarea, id='01')
+                term.name_en = name
+                term.description_en = '<p>A long description that stays the same between versions.</p>'
+                term.save()
+        return list(Version.objects.get_for_object(term).order_by('pk'))
+
+
+class RevisionStorageTests(RevisionStorageMixin, VocabularyTestCase):
+    """Versões do Term em formato "delta": um snapshot e depois só os campos que mudaram."""
+
+    def test_deltas_store_only_changed_fields(self):
+        first, second, third = self.save_versions('voltage', 'electric voltage', 'tension')
+        self.assertNotIn('base', json.loads(first.serialized_data)[0])
+        for version in (second, third):
+            stored = json.loads(version.serialized_data)[0]
+            self.assertEqual(stored['base'], first.pk)
+            self.assertNotIn('description_en', stored['fields'])
+            self.assertLess(len(version.serialized_data), len(first.serialized_data) / 2)
+
+    def test_versions_are_rebuilt_from_the_snapshot(self):
+        first, second, _third = self.save_versions('voltage', 'electric voltage', 'tension')
+        self.assertEqual(second.field_dict['name_en'], 'electric voltage')
+        self.assertEqual(second.field_dict['description_en'], first.field_dict['description_en'])
+        second.revert()
+        self.assertEqual(Term.objects.get(ref='102-01-01').name_en, 'electric voltage')
+
+
+class CompactRevisionsTests(RevisionStorageMixin, VocabularyTestCase):
+
+    def test_retention_rules(self):
+        versions = self.save_versions(*[f'name {number}' for number in range(7)])
+        now = timezone.localtime()
+        month = (now - timedelta(days=400)).replace(day=10, hour=12)
+        day = (now - timedelta(days=100)).replace(hour=9)
+        dates = [month, month + timedelta(days=1), month + timedelta(days=2),      # mensal: fica a última do mês
+                 day, day + timedelta(hours=1),                                     # diária: fica a última do dia
+                 now - timedelta(days=1), now]                                      # recentes: ficam todas
+        for version, date_created in zip(versions, dates):
+            Revision.objects.filter(pk=version.revision_id).update(date_created=date_created)
+
+        call_command('compact_revisions', '--model', 'core.term', stdout=io.StringIO())
+
+        remaining = set(Version.objects.get_for_model(Term).values_list('pk', flat=True))
+        # a 1ª (snapshot) fica porque as seguintes são deltas sobre ela
+        self.assertEqual(remaining, {versions[index].pk for index in (0, 2, 4, 5, 6)})
+        self.assertFalse(Revision.objects.filter(pk__in=[versions[1].revision_id, versions[3].revision_id]).exists())
+        self.assertEqual(Version.objects.get(pk=versions[2].pk).field_dict['name_en'], 'name 2')
+
+    def test_dry_run_deletes_nothing(self):
+        versions = self.save_versions('voltage', 'tension', 'electric tension')
+        Revision.objects.filter(pk__in=[version.revision_id for version in versions]).update(
+            date_created=timezone.now() - timedelta(days=100))
+        out = io.StringIO()
+        call_command('compact_revisions', '--dry-run', stdout=out)
+        self.assertEqual(Version.objects.get_for_model(Term).count(), 3)
+        self.assertIn('1 versões seriam apagadas', out.getvalue())
+
+
+class VersionBumpTests(TestCase):
+
+    def test_bump_waits_for_commit(self):
+        before = vocabulary_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            bump_vocabulary_version()
+            self.assertEqual(vocabulary_version(), before)         # ainda dentro da transação
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(vocabulary_version(), before)
+
+    def test_bump_from_another_process_is_seen(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_vocabulary_version()
+        before = vocabulary_version()
+        # outro processo (ex: run_jobs) incrementa o contador diretamente na base de dados
+        CacheVersion.objects.filter(key=VOCABULARY_VERSION_KEY).update(version=F('version') + 1)
+        with override_settings(CACHE_VERSION_CHECK_INTERVAL=3600):
+            self.assertEqual(vocabulary_version(), before)         # cópia local ainda válida
+        with override_settings(CACHE_VERSION_CHECK_INTERVAL=0):
+            self.assertEqual(vocabulary_version(), before + 1)
+
+
+class JobTests(TestCase):
+
+    def test_stale_job_of_a_live_worker_is_kept(self):
+        old = timezone.now() - timedelta(days=1)
+        mine = Job.objects.create(kind=Job.KIND_IMPORT, model_label='core.term', status=Job.STATUS_RUNNING, heartbeat_at=old)
+        lost = Job.objects.create(kind=Job.KIND_IMPORT, model_label='core.term', status=Job.STATUS_RUNNING, heartbeat_at=old)
+        self.assertEqual(fail_stale_jobs(alive=[mine.pk]), 1)
+        mine.refresh_from_db()
+        lost.refresh_from_db()
+        self.assertEqual(mine.status, Job.STATUS_RUNNING)
+        self.assertEqual(lost.status, Job.STATUS_FAILED)
+
+    def test_queued_redirect_without_job_permission(self):
+        user = User.objects.create_user('staff', is_staff=True)
+        user.user_permissions.add(Permission.objects.get(codename='view_area'))
+        job = Job.objects.create(kind=Job.KIND_EXPORT, model_label='core.area')
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=user.pk)
+        request._messages = CookieStorage(request)
+        response = admin.site._registry[Area].job_queued(request, job)
+        self.assertEqual(response.url, '/admin/core/area/')
+
+        user.user_permissions.add(Permission.objects.get(codename='view_job'))
+        request.user = User.objects.get(pk=user.pk)
+        response = admin.site._registry[Area].job_queued(request, job)
+        self.assertEqual(response.url, f'/admin/core/job/{job.pk}/change/')
+
+
+@override_settings(CACHE_VERSION_CHECK_INTERVAL=0)
+class PrefixIndexTests(VocabularyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.add_term('10', name_en='Voltage')
+        cls.add_term('11', name_en='Volume')
+
+    def setUp(self):
+        super().setUp()
+        # o primeiro incremento cria o contador (salta para o instante atual): não é uma alteração a seguir
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_vocabulary_version(refs=())
+
+    def names(self, index, prefix):
+        return [item['name'] for item in index.suggest(prefix, 'en')]
+
+    def test_applies_changes_from_another_process_without_rebuilding(self):
+        index = PrefixIndex()
+        index.build()
+        # outro processo (ex: uma importação no run_jobs) muda um termo, elimina outro e incrementa a versão
+        with self.captureOnCommitCallbacks(execute=True):
+            Term.objects.filter(ref='102-01-10').update(name_en='Volt')
+            Term.objects.filter(ref='102-01-11').delete()
+            bump_vocabulary_version(['102-01-10', '102-01-11'])
+        with mock.patch.object(index, 'build', side_effect=AssertionError('full rebuild')):
+            index.refresh()
+            self.assertEqual(self.names(index, 'vol'), ['Volt'])
+
+    def test_rebuilds_when_changes_are_not_recorded(self):
+        index = PrefixIndex()
+        index.build()
+        Term.objects.filter(ref='102-01-10').update(name_en='Volt')
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_vocabulary_version()
+        with mock.patch.object(index, 'build', wraps=index.build) as build:
+            index.refresh()
+        build.assert_called_once()
+        self.assertEqual(self.names(index, 'volt'), ['Volt'])
+
+    def test_suggest_refreshes_in_the_background(self):
+        index = PrefixIndex()
+        index.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_vocabulary_version(['102-01-10'])
+        with mock.patch('core.suggest.threading.Thread') as thread:
+            # responde logo com o índice que tem, enquanto a thread o atualiza
+            self.assertEqual(self.names(index, 'vol'), ['Volume', 'Voltage'])
+            self.names(index, 'volt')
+        thread.assert_called_once_with(target=index._refresh_in_background, daemon=True)
+
+
+@override_settings(CACHE_VERSION_CHECK_INTERVAL=0)
+class SharedVersionTests(VocabularyTestCase):
+    """Listas em memória por processo que outro processo invalida pelos contadores na base de dados."""
+
+    def bump_elsewhere(self, key):
+        # como o _increment de outro processo: sem passar pela cópia local dos contadores deste
+        if not CacheVersion.objects.filter(key=key).update(version=F('version') + 1):
+            CacheVersion.objects.create(key=key, version=1)
+
+    def test_navbar_follows_area_changed_elsewhere(self):
+        navbar_areas('en')
+        Area.objects.filter(pk=self.area.pk).update(name_en='Changed')       # sem sinais, como noutro processo
+        self.bump_elsewhere(AREAS_VERSION_KEY)
+        self.assertEqual(navbar_areas('en'), [{'id': '102', 'name': 'Changed'}])
+
+    def test_timeline_follows_news_changed_elsewhere(self):
+        timeline = ScheduleTimeline(News)
+        self.assertEqual(timeline.visible_pks(), frozenset())
+        news = News.objects.create(title='News', active=True)
+        self.bump_elsewhere(schedule_version_key(News))
+        self.assertEqual(timeline.visible_pks(), frozenset([news.pk]))
+
+
+@override_settings(TERM_TRANSLATION_STORAGE='normalized')
+class NormalizedStorageTests(VocabularyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.add_term('10', name_en='voltage', name_fr='tension')
+
+    def test_sync_keeps_narrow_only_languages(self):
+        TermTranslation.objects.create(term_id='102-01-10', lang='xx', name='narrow only')
+        term = Term.objects.get(ref='102-01-10')
+        term.name_en = 'electric voltage'
+        term.name_fr = None
+        sync_translations([term])
+        names = dict(TermTranslation.objects.filter(term=term).values_list('lang', 'name'))
+        self.assertEqual(names['en'], 'electric voltage')
+        self.assertIsNone(names['fr'])                                  # só fica a data de publicação
+        self.assertEqual(names['xx'], 'narrow only')
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+    def test_detail_reads_translation_table(self):
+        TermTranslation.objects.filter(term_id='102-01-10', lang='fr').update(name='tension électrique')
+        self.login()
+        response = self.client.get(reverse('term_detail', args=['102-01-10']), {'language': 'fr'})
+        self.assertEqual(response.context['term_name'], 'tension électrique')
+
+
+class SimilarTermsTests(VocabularyTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number, name in enumerate(['voltage', 'volume', 'volt', 'voltmeter'], 1):
+            cls.add_term(f'{number:02d}', name_en=name)
+
+    def test_typo_finds_term(self):
+        self.assertEqual(similar_terms('voltge', ['en'])[0]['ref'], '102-01-01')
+
+    def test_rarest_grams_first(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("só o fallback do SQLite escolhe os trigramas")
+        with connection.cursor() as cursor:
+            grams = rarest_grams(cursor, trigrams('voltage'))
+        self.assertEqual(set(grams[-3:]), {'  v', ' vo', 'vol'})          # em todos os nomes: os menos úteis
+        self.assertIn(grams[0], {'lta', 'tag', 'age', 'ge '})             # só em "voltage"
+
+
+class SearchLimitsTests(VocabularyTestCase):
+
+    def add_terms(self):
+        for number, name in enumerate(['resistor', 'resistance', 'resistivity'], 1):
+            self.add_term(f'{number:02d}', name_en=name)
+
+    def test_truncated_search_is_reported(self):
+        self.add_terms()
+        self.login()
+        with mock.patch('core.search.MAX_RESULTS', 2):
+            response = self.client.get(reverse('term-list-data'), {'q': 'resist', 'draw': '1'})
+        data = response.json()
+        self.assertTrue(data['truncated'])
+        self.assertEqual(data['recordsTotal'], 2)
+        self.assertEqual(len(data['data']), 2)
+
+    def test_index_not_ready_is_cached_until_indexing(self):
+        search._index_state.update(ready=False, checked_at=None)
+        with self.assertNumQueries(1):
+            self.assertFalse(search_index_ready())
+            self.assertFalse(search_index_ready())
+        self.add_terms()                                    # indexar neste processo volta a verificar
+        self.assertTrue(search_index_ready())
+
+
+class FoldTextTests(SimpleTestCase):
+
+    def test_markup_entities_case_and_spaces(self):
+        self.assertEqual(fold_text('<p>Tension&nbsp;<b>ÉLECTRIQUE</b></p>\n  x'), 'tension electrique x')
+
+    def test_folds_requested_diacritics(self):
+        self.assertEqual(fold_text('Ångström façade naïve'), 'angstrom facade naive')
+        self.assertEqual(fold_text('ηλεκτρικό ρεύμα'), 'ηλεκτρικο ρευμα')           # tonos grego
+        self.assertEqual(fold_text('Ёмкость'), 'емкость')                          # ё -> е
+        self.assertEqual(fold_text('تَيّـــار'), 'تيار')                             # tashkeel e tatweel
+
+    def test_keeps_marks_that_distinguish_letters(self):
+        for word in ('й', 'їжак', 'ўзбек', 'विद्युत', 'ไฟฟ้า', 'が'):
+            self.assertEqual(fold_text(word), word, word)
+        self.assertNotEqual(fold_text('мій'), fold_text('мии'))
+
+
+class LanguageRoutingTests(VocabularyTestCase):
+
+    def test_non_latin_scripts_pick_their_languages(self):
+        self.assertEqual(route_languages('напряжение'), ['bs', 'bg', 'mk', 'ru', 'sr', 'uk'])
+        self.assertEqual(route_languages('τάση'), ['el'])
+        self.assertEqual(route_languages('電圧'), ['zh-hans', 'ja', 'ko'])
+        self.assertEqual(route_languages('でんあつ'), ['ja'])
+
+    def test_latin_symbols_and_mixed_queries_search_everywhere(self):
+        self.assertIsNone(route_languages('voltage'))
+        self.assertIsNone(route_languages('Ω'))                 # letra solta: símbolo
+        self.assertIsNone(route_languages('μ voltage'))
+        self.assertIsNone(route_languages('102'))
+
+    def test_explicit_language_wins(self):
+        self.assertEqual(route_languages('напряжение', override='en,xx'), ['en'])
+
+    def test_search_only_reads_routed_languages(self):
+        self.add_term('10', name_ru='напряжение')
+        self.add_term('11', name_en='напряжение')               # escrito por engano no campo inglês
+        self.login()
+        data = self.client.get(reverse('term-list-data'), {'q': 'напряжение', 'draw': '1'}).json()
+        self.assertEqual([row['ref'] for row in data['data']], ['102-01-10'])
+
+
+@override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+class CapabilitiesTests(VocabularyTestCase):
+    """Grupos do utilizador lidos uma só vez por pedido (request.capabilities, CapabilitiesMiddleware)."""
+
+    def user_in(self, *group_names):
+        user = User.objects.create_user('member')
+        user.groups.set([Group.objects.get_or_create(name=name)[0] for name in group_names])
+        return user
+
+    def test_groups_are_read_once(self):
+        capabilities = UserCapabilities(self.user_in('Gestor'))
+        with self.assertNumQueries(1):
+            self.assertTrue(capabilities.has_access)
+            self.assertTrue(capabilities.is_admin_or_gestor)
+            self.assertEqual(capabilities.group_names, ('Gestor',))
+
+    def test_no_access_group(self):
+        capabilities = UserCapabilities(self.user_in('SemAcesso'))
+        self.assertFalse(capabilities.has_access)
+        self.assertFalse(capabilities.is_admin_or_gestor)
+
+    def test_page_view_reads_groups_once(self):
+        self.client.force_login(self.user_in('Admin'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('area-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_admin_or_gestor'])
+        self.assertEqual(len([query for query in queries if 'auth_user_groups' in query['sql']]), 1)
+
+    def test_no_access_group_is_sent_home(self):
+        self.client.force_login(self.user_in('SemAcesso'))
+        self.assertRedirects(self.client.get(reverse('area-list')), reverse('home'), fetch_redirect_response=False)
+
+
+class NavigationCookieTests(VocabularyTestCase):
+    """Stack do botão "voltar" num cookie assinado e limitado, em vez da sessão."""
+
+    cookie_name = NavigationStackMiddleware.cookie_name
+
+    def run_middleware(self, cookie=None, push=()):
+        """Passa um pedido pelo middleware; devolve (stack lida do cookie, resposta)."""
+        seen = []
+
+        def view(request):
+            seen.extend(request.navigation_stack)
+            request.navigation_stack.extend(push)
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        if cookie is not None:
+            request.COOKIES[self.cookie_name] = cookie
+        return seen, NavigationStackMiddleware(view)(request)
+
+    def stored_stack(self, response):
+        request = RequestFactory().get('/')
+        request.COOKIES[self.cookie_name] = response.cookies[self.cookie_name].value
+        return json.loads(request.get_signed_cookie(self.cookie_name, salt=NavigationStackMiddleware.salt))
+
+    def test_round_trip(self):
+        _seen, response = self.run_middleware(push=['/core/areas/', '/core/subareas/102/'])
+        cookie = response.cookies[self.cookie_name].value
+        seen, response = self.run_middleware(cookie)
+        self.assertEqual(seen, ['/core/areas/', '/core/subareas/102/'])
+        self.assertNotIn(self.cookie_name, response.cookies)               # não mudou: não é reescrito
+
+    def test_tampered_cookie_is_ignored(self):
+        _seen, response = self.run_middleware(push=['/core/areas/'])
+        cookie = response.cookies[self.cookie_name].value
+        seen, _response = self.run_middleware(cookie.replace('areas', 'other'))
+        self.assertEqual(seen, [])
+
+    def test_only_local_paths_are_read(self):
+        _seen, response = self.run_middleware(push=['//evil.example/', 'https://evil.example/', '/core/areas/'])
+        seen, _response = self.run_middleware(response.cookies[self.cookie_name].value)
+        self.assertEqual(seen, ['/core/areas/'])
+
+    def test_size_is_bounded(self):
+        paths = [f'/core/terms/?q={number}{"x" * 300}' for number in range(30)]
+        _seen, response = self.run_middleware(push=paths)
+        stack = self.stored_stack(response)
+        self.assertLessEqual(len(stack), NAVIGATION_STACK_SIZE)
+        self.assertLessEqual(len(json.dumps(stack, separators=(',', ':'))), NAVIGATION_COOKIE_MAX_SIZE)
+        self.assertEqual(stack[-1], paths[-1])                             # saem os mais antigos
+
+    @override_settings(STORAGES=PLAIN_STATIC_STORAGES)
+    def test_page_views_do_not_write_to_the_database(self):
+        self.add_term('01', name_en='voltage')
+        self.login()
+        for url in (reverse('area-list'), reverse('term-list-by-subarea', args=['102-01']),
+                    reverse('term_detail', args=['102-01-01'])):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            writes = [query['sql'] for query in queries if query['sql'].split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')]
+            self.assertEqual(writes, [], url)
+
+
+@override_settings(CACHE_VERSION_CHECK_INTERVAL=0, STORAGES=PLAIN_STATIC_STORAGES)
+class HomeTests(VocabularyTestCase):
+
+    def test_anonymous_visitors_only_read_the_posters(self):
+        with mock.patch('core.views.home_content') as content:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        content.assert_not_called()
+
+    def test_content_expires_when_scheduled_news_appears(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            News.objects.create(title='Later', content='...', start_date=timezone.now() + timedelta(minutes=5))
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.assertEqual(home_content()['news'], [])
+        self.assertAlmostEqual(cache_set.call_args.args[2], 300, delta=2)
+
+
+@override_settings(CACHE_VERSION_CHECK_INTERVAL=0)
+class ScheduledVisibilityTests(TestCase):
+    """visible() de News, Warning e ContactTopMessage: 'active' e a janela [início, fim], pela linha temporal em memória."""
+
+    def setUp(self):
+        scheduling._timelines.clear()
+        self.now = timezone.now()
+
+    def warning(self, title, active=True, show_from=None, hide_after=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Warning.objects.create(title=title, content='...', active=active, show_from=show_from,
+                                          hide_after=hide_after)
+
+    def visible_titles(self, moment):
+        with mock.patch('django.utils.timezone.now', return_value=moment):
+            return set(Warning.objects.visible().values_list('title', flat=True))
+
+    def test_active_rows_inside_their_window(self):
+        hour = timedelta(hours=1)
+        self.warning('always')
+        self.warning('window', show_from=self.now - hour, hide_after=self.now + hour)
+        self.warning('later', show_from=self.now + hour)
+        self.warning('ended', hide_after=self.now - hour)
+        self.warning('inactive', active=False)
+        self.assertEqual(self.visible_titles(self.now), {'always', 'window'})
+
+    def test_window_bounds_are_inclusive(self):
+        start, end = self.now + timedelta(minutes=1), self.now + timedelta(minutes=2)
+        self.warning('window', show_from=start, hide_after=end)
+        self.assertEqual(self.visible_titles(start - timedelta(microseconds=1)), set())
+        self.assertEqual(self.visible_titles(start), {'window'})
+        self.assertEqual(self.visible_titles(end), {'window'})
+        self.assertEqual(self.visible_titles(end + timedelta(microseconds=1)), set())
+
+    def test_passing_a_transition_does_not_reread_the_rows(self):
+        self.warning('later', show_from=self.now + timedelta(minutes=1))
+        self.assertEqual(self.visible_titles(self.now), set())
+        with mock.patch.object(scheduling.ScheduleTimeline, 'load'):      # só com a linha temporal já em memória
+            self.assertEqual(self.visible_titles(self.now + timedelta(minutes=2)), {'later'})
+
+    def test_changes_bump_the_timeline(self):
+        self.assertEqual(self.visible_titles(self.now), set())
+        warning = self.warning('new')
+        self.assertEqual(self.visible_titles(self.now), {'new'})
+        with self.captureOnCommitCallbacks(execute=True):
+            warning.active = False
+            warning.save()
+        self.assertEqual(self.visible_titles(self.now), set())
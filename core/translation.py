@@ -1,5 +1,6 @@
 # core/translation.py
 
+import reversion
 from modeltranslation.translator import register, TranslationOptions    # Importa as funções e classes necessárias para registar modelos e definir opções de tradução.
 from .models import Area, SubArea, Term, News, Warning, ContactTopMessage, \
     Tutorial, \
@@ -25,6 +26,13 @@ class SubAreaTranslationOptions(TranslationOptions):
 class TermTranslationOptions(TranslationOptions):
     fields = ['name', 'description', 'source', 'extra', 'published_at']
 
+# O reversion tem de guardar as colunas de todos os idiomas (name_en, name_pt, ...), que só existem depois do registo acima;
+# os campos originais (name, ...) ficam de fora porque leem/escrevem a coluna do idioma ativo.
+# Formato "delta": snapshots + deltas por campo, ver core/revision_storage.py
+reversion.register(Term, format='delta', fields=[
+    field.name for field in Term._meta.concrete_fields if field.name not in TermTranslationOptions.fields
+])
+
 @register(News)
 class NewsTranslationOptions(TranslationOptions):
     fields = ['title', 'content']
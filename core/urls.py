@@ -1,12 +1,15 @@
 # core/urls.py
 from django.urls import path
-from .views import TermListView, TermDetailView, AreaListView, SubAreaListView, poster_view, thesis_view, documentation_view, contacts_view, home
+from .views import TermListView, TermListDataView, TermDetailView, AreaListView, SubAreaListView, poster_view, thesis_view, documentation_view, contacts_view, home
 from . import views
 
 
 urlpatterns = [
     path('terms/', TermListView.as_view(), name='term-list'),
+    path('terms/data/', TermListDataView.as_view(), name='term-list-data'),                # JSON do DataTables (server-side)
+    path('terms/suggest/', views.term_suggest, name='term-suggest'),                         # autocomplete da pesquisa
     path('terms/subarea/<str:ref>/', TermListView.as_view(), name='term-list-by-subarea'),  # termos filtrados por subarea
+    path('terms/subarea/<str:ref>/data/', TermListDataView.as_view(), name='term-list-by-subarea-data'),
     path('terms/<str:ref>/', TermDetailView.as_view(), name='term_detail'),
 
     path('areas/', AreaListView.as_view(), name='area-list'),
@@ -1,22 +1,35 @@
 # core/views.py
 
-from django.views.generic import DetailView, ListView       # Importa classes de visualização genéricas do Django.
+from django.views.generic import DetailView, ListView, View # Importa classes de visualização genéricas do Django.
 from django.shortcuts import render, redirect, get_object_or_404        # Importa funções para renderizar templates e redirecionar.
 from django.urls import reverse_lazy
 from django.utils.translation import get_language                       # Para obter idioma da interface
 from core.models import Term, Area, SubArea, News, Warning, Tutorial, Poster, Thesis, DocumentationLink, ContactInfo, ContactTopMessage                             # Importa o modelo Term,  que contém os dados dos termos.
-from django.db.models import Q, Count                                   # Count, Contar o nº de termos nas data tables
+from django.db.models import Q
 from django.db import models
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse                                         # usado para gerar URLs com base no nome dos caminhos
-from core.permissions import user_has_access, GroupAccessRequiredMixin
-from django.contrib.auth.models import Group, User
+from core.permissions import user_has_access, GroupAccessRequiredMixin, get_capabilities
+from core.caching import vocabulary_version
+from core.homepage import home_content, home_posters
+from core.pagination import InvalidCursor, decode_cursor, keyset_page, ranked_page
+from core.search import MAX_RESULTS, fold_text, parse_reference, reference_range, route_languages, search_index_ready, search_term_refs, similar_terms, truncate_refs
+from core.suggest import prefix_index
+from django.contrib.auth.models import User
 from django.utils.timezone import now
+from django.http import JsonResponse
+from modeltranslation.utils import build_localized_fieldname
+from urllib.parse import urlencode
+from django.core.cache import cache
+import hashlib
+import json
 
 # funções para gerar uma stack para usar no botão "voltar"
+# A stack está em request.navigation_stack, lida de um cookie assinado e gravada na resposta pelo
+# NavigationStackMiddleware (core/middleware.py): as páginas não escrevem na sessão (base de dados).
 def update_navigation_stack(request):
-    stack = request.session.get('navigation_stack', [])
+    stack = request.navigation_stack
     current_url = request.get_full_path()
 
     # Se a pilha estiver vazia ou o topo for diferente da URL atual, adiciona
@@ -27,19 +40,16 @@ def update_navigation_stack(request):
         stack.append(current_url)
 
     # Mantém apenas os últimos 10 itens
-    request.session['navigation_stack'] = stack[-10:]
+    del stack[:-10]
 
 def get_back_url(request, fallback_url):
-    stack = request.session.get('navigation_stack', [])
+    stack = request.navigation_stack
 
     # Remover a página atual do topo
     current_url = request.get_full_path()
     if stack and stack[-1] == current_url:
         stack.pop()
 
-    # Atualizar a stack no request.session
-    request.session['navigation_stack'] = stack
-
     if stack:
         return stack[-1]  # página anterior real
     return fallback_url
@@ -58,10 +68,8 @@ class AreaListView(GroupAccessRequiredMixin, ListView):
         return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        return Area.objects.annotate(                                           # Contador de subareas e termos. Distinct -> evita contagens duplicadas.
-            subarea_count=Count('subareas', distinct=True),          # conta quantas SubArea estão ligadas à Area
-            term_count=Count('subareas__termos', distinct=True)      # conta todos os termos associados às SubArea dessa Area
-        ).order_by('id')
+        # subarea_count e term_count são contadores guardados na Area (core/counters.py)
+        return Area.objects.localized_only('id', 'name', 'subarea_count', 'term_count').order_by('id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -85,8 +93,8 @@ class SubAreaListView(GroupAccessRequiredMixin, ListView):
 
     def get_queryset(self):
         area_id = self.kwargs.get('area_id')
-        # já tem o contador de termos por subarea
-        qs = SubArea.objects.select_related('area').annotate(term_count=Count('termos')).order_by('area__id', 'id')
+        # já tem o contador de termos por subarea (guardado na SubArea)
+        qs = SubArea.objects.localized_only('ref', 'name', 'term_count').order_by('area__id', 'id')
         if area_id:
             qs = qs.filter(area__id=area_id)
         return qs
@@ -108,46 +116,141 @@ def term_detail(request, ref):
     term = get_object_or_404(Term, ref=ref)                     # vai buscar o termo pela ref
     return render(request, 'core/term_detail.html', {'term': term})  # aqui podemos escolher o idioma dos conteúdos se necessário
 
-class TermListView(GroupAccessRequiredMixin, ListView):
-    model = Term
-    context_object_name = 'terms'
-    login_url = reverse_lazy("account_login")
-
-    def get(self, request, *args, **kwargs):
-        update_navigation_stack(request)
-        return super().get(request, *args, **kwargs)
+# Filtros comuns à lista de termos (HTML) e ao endpoint JSON do DataTables
+class TermFilterMixin:
+    ranked_refs = None                                          # refs que correspondem à pesquisa de texto (já com os filtros), por ordem de relevância
+    similar = None                                              # sugestões por semelhança, quando a pesquisa exata não encontra nada
+    truncated = False                                           # a pesquisa encontrou mais do que MAX_RESULTS termos (só os primeiros são listados)
+    similar_limit = 20                                          # nº máximo de termos parecidos mostrados na tabela
 
-    def get_queryset(self):
+    def get_filtered_queryset(self):
         q = self.request.GET.get("q")
         area_id = self.request.GET.get("area")                  # para o filtro por area da navbar
         subarea_ref = self.kwargs.get('ref')                    # vem da URL
-        object_list = self.model.objects.all()
+        object_list = Term.objects.all()
+
+        # Referência IEV colada na pesquisa: filtro direto pela chave primária, sem pesquisa de texto
+        reference = parse_reference(q)
+        if reference:
+            kind, ref = reference
+            if kind == 'term':
+                object_list = object_list.filter(ref=ref)
+            else:
+                start, end = reference_range(ref)
+                object_list = object_list.filter(ref__gte=start, ref__lt=end)
+            q = None
 
-        # Filtra pelo termo de busca, se existir
+        # Filtro por área (menu dropdown da navbar)
+        if area_id:
+            object_list = object_list.filter(subarea__area__id=area_id)
+
+        # Filtro por subárea (URL)
+        if subarea_ref:
+            object_list = object_list.filter(subarea__ref=subarea_ref)
+
+        # Filtra pelo termo de busca, se existir: as refs encontradas vêm da cache ou da pesquisa
         if q:
+            self.ranked_refs, self.similar, self.truncated = self.get_search_results(q, object_list, filtered=bool(area_id or subarea_ref))
+            object_list = Term.objects.filter(ref__in=self.ranked_refs)
+
+        return object_list.order_by('ref')
+
+    def get_search_results(self, q, object_list, filtered):
+        """
+        Refs (por relevância) que correspondem à pesquisa e aos filtros, sugestões por semelhança, e se a lista
+        foi cortada em MAX_RESULTS (a contagem mostrada é então a dos termos listados, não a de todos).
+        Guardadas na cache com a versão do vocabulário na chave: qualquer alteração a um Term invalida-as.
+        """
+        # Idiomas onde procurar: 'lang=' explícito ou deduzido do alfabeto da pesquisa (None = todos)
+        languages = route_languages(q, self.request.GET.get('lang'))
+        normalized = fold_text(q) if search_index_ready() else q.strip().lower()
+        key_data = json.dumps([normalized, self.request.GET.get('area'), self.kwargs.get('ref'), languages])
+        cache_key = f"core:search:{vocabulary_version()}:{hashlib.md5(key_data.encode()).hexdigest()}"
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        similar = None
+        truncated = False
+        # Primeiro pelo índice de pesquisa (core/search.py)
+        refs = search_term_refs(q, languages)
+        if refs:
+            refs, truncated = truncate_refs(refs)
+        if refs == []:
+            # Nada encontrado: mostra os termos com nome mais parecido (erros de escrita)
+            similar = similar_terms(q, languages, limit=self.similar_limit)
+            refs = [item['ref'] for item in similar]
+
+        if refs is None:
+            # Sem índice disponível: pesquisa antiga com icontains nos idiomas escolhidos
             search_queries = Q()
 
-            # Procura nos campos padrão (sem tradução)
-            search_queries |= Q(name__icontains=q)
-            search_queries |= Q(description__icontains=q)
+            # Procura nos campos padrão (sem tradução), que têm o conteúdo do idioma padrão
+            if languages is None or settings.MODELTRANSLATION_DEFAULT_LANGUAGE in languages:
+                search_queries |= Q(name__icontains=q)
+                search_queries |= Q(description__icontains=q)
 
-            # Procura nas traduções, para todos os idiomas definidos nas settings
+            # Procura nas traduções, para os idiomas selecionados
             for lang_code, _ in settings.LANGUAGES:
+                if languages is not None and lang_code not in languages:
+                    continue
                 lang_suffix = lang_code.lower().replace('-', '_')              # resolve o problema do django só reconhecer pt-br, e na base de dados estar pt_br
                 search_queries |= Q(**{f'name_{lang_suffix}__icontains': q})
                 search_queries |= Q(**{f'description_{lang_suffix}__icontains': q})
 
-            object_list = object_list.filter(search_queries)
+            refs = list(object_list.filter(search_queries).order_by('ref').values_list('ref', flat=True))
+        elif filtered and refs:
+            # Aplica os filtros de área/subárea, mantendo a ordem de relevância
+            matching = set(object_list.filter(ref__in=refs).values_list('ref', flat=True))
+            refs = [ref for ref in refs if ref in matching]
+
+        cache.set(cache_key, (refs, similar, truncated), settings.SEARCH_CACHE_TIMEOUT)
+        return refs, similar, truncated
+
+    def get_suggestions(self):
+        """"Quis dizer": nomes dos termos mais parecidos (no idioma em que foram encontrados) e o link para os pesquisar."""
+        suggestions = []
+        if not self.similar:
+            return suggestions
+        top = self.similar[:5]
+        terms = Term.objects.in_bulk([item['ref'] for item in top])
+        area_id = self.request.GET.get('area')
+        for item in top:
+            term = terms.get(item['ref'])
+            name = term and getattr(term, build_localized_fieldname('name', item['lang']), None)
+            if name and name not in [suggestion['name'] for suggestion in suggestions]:
+                params = {'q': name, 'area': area_id} if area_id else {'q': name}
+                suggestions.append({'ref': item['ref'], 'name': name, 'url': f"{reverse('term-list')}?{urlencode(params)}"})
+        return suggestions
+
+    def get_filter_params(self):
+        # parâmetros da pesquisa (q, area e lang) a preservar nos links
+        params = {}
+        for key in ('q', 'area', 'lang'):
+            value = self.request.GET.get(key)
+            if value:
+                params[key] = value
+        return params
+
+
+class TermListView(GroupAccessRequiredMixin, TermFilterMixin, ListView):
+    model = Term
+    context_object_name = 'terms'
+    login_url = reverse_lazy("account_login")
 
-        # Filtro por área (menu dropdown da navbar)
-        if area_id:
-            object_list = object_list.filter(subarea__area__id=area_id)
+    def get(self, request, *args, **kwargs):
+        # Referência completa de um termo na pesquisa: vai direto para o detalhe
+        reference = parse_reference(request.GET.get('q'))
+        if reference and reference[0] == 'term' and Term.objects.filter(ref=reference[1]).exists():
+            return redirect('term_detail', ref=reference[1])
 
-        # Filtro por subárea (URL)
-        if subarea_ref:
-            object_list = object_list.filter(subarea__ref=subarea_ref)
+        update_navigation_stack(request)
+        return super().get(request, *args, **kwargs)
 
-        return object_list.order_by('ref')
+    def get_queryset(self):
+        # A tabela é preenchida pelo TermListDataView (server-side): a página não faz a pesquisa
+        # (as sugestões "Quis dizer" e o aviso de lista cortada também vêm no JSON)
+        return Term.objects.none()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -157,14 +260,21 @@ class TermListView(GroupAccessRequiredMixin, ListView):
             subarea = SubArea.objects.select_related('area').filter(ref=subarea_ref).first()#############
             context['subarea'] = subarea
             context['subarea_ref'] = subarea_ref
+            data_url = reverse('term-list-by-subarea-data', kwargs={'ref': subarea_ref})
         else:
             # Se não há subarea, evita usar esses campos no template
             context['subarea_ref'] = None
             context['subarea'] = None
+            data_url = reverse('term-list-data')
+
+        # URL do endpoint JSON usado pelo DataTables, com os mesmos filtros
+        params = self.get_filter_params()
+        context['data_url'] = f"{data_url}?{urlencode(params)}" if params else data_url
 
         # Adiciona o valor da área selecionada (se algum)
         context['selected_area_id'] = self.request.GET.get('area')
         context['search_query'] = self.request.GET.get('q', '')
+        context['max_results'] = MAX_RESULTS
 
         # fallback dinâmico com área da subárea
         if subarea and subarea.area:
@@ -177,6 +287,137 @@ class TermListView(GroupAccessRequiredMixin, ListView):
         return context
 
 
+# Endpoint JSON para o DataTables em modo server-side (devolve só a página visível) e API com paginação por cursor
+class TermListDataView(GroupAccessRequiredMixin, TermFilterMixin, View):
+    login_url = reverse_lazy("account_login")
+    max_page_length = 100                                       # limite de linhas por pedido (inclui o "All" = -1 do DataTables)
+    order_columns = {0: 'ref', 1: 'name'}                       # índice da coluna do DataTables -> campo do modelo
+
+    def get(self, request, *args, **kwargs):
+        params = request.GET
+        if 'draw' not in params:
+            # Fora do DataTables (API): paginação por cursor, ex. ?after=<cursor>&limit=100
+            return self.get_cursor_page(request)
+
+        draw = self._get_int(params.get('draw'), 0)
+        start = max(self._get_int(params.get('start'), 0), 0)
+        length = self._get_int(params.get('length'), 10)
+        if length <= 0 or length > self.max_page_length:
+            length = self.max_page_length
+
+        object_list = self.get_filtered_queryset()
+        # numa pesquisa de texto as refs já são conhecidas (cache): não é preciso contar na base de dados
+        records_total = len(self.ranked_refs) if self.ranked_refs is not None else object_list.count()
+
+        # Caixa de pesquisa do próprio DataTables: filtra só pelas colunas visíveis (ref e nome no idioma atual)
+        dt_search = (params.get('search[value]') or '').strip()
+        if dt_search:
+            object_list = object_list.filter(Q(ref__icontains=dt_search) | Q(name__icontains=dt_search))
+            records_filtered = object_list.count()
+        else:
+            records_filtered = records_total
+
+        if self.ranked_refs is not None and 'order[0][column]' not in params:
+            # Sem ordenação pedida: mantém a ordem de relevância e só vai buscar a página pela chave primária
+            ordered_refs = self.ranked_refs
+            if dt_search:
+                visible = set(object_list.values_list('ref', flat=True))
+                ordered_refs = [ref for ref in ordered_refs if ref in visible]
+            page_refs = ordered_refs[start:start + length]
+            terms = Term.objects.localized_only('ref', 'name').in_bulk(page_refs)
+            page = [terms[ref] for ref in page_refs if ref in terms]
+        else:
+            # Ordenação pedida pelo DataTables ('name' é reescrito pelo modeltranslation para name_<idioma>)
+            column = self.order_columns.get(self._get_int(params.get('order[0][column]'), 0), 'ref')
+            direction = '-' if params.get('order[0][dir]') == 'desc' else ''
+            ordering = [f'{direction}{column}']
+            if column != 'ref':
+                ordering.append('ref')
+            page = object_list.localized_only('ref', 'name').order_by(*ordering)[start:start + length]
+
+        return JsonResponse({
+            'draw': draw,
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'truncated': self.truncated,
+            'suggestions': self.get_suggestions(),
+            'data': self.serialize_terms(page),
+        })
+
+    def get_cursor_page(self, request):
+        # Paginação keyset: cada página é um intervalo 'ref > cursor' no índice, sem OFFSET nem COUNT
+        limit = self._get_int(request.GET.get('limit'), self.max_page_length)
+        if limit <= 0 or limit > self.max_page_length:
+            limit = self.max_page_length
+
+        try:
+            after = decode_cursor(request.GET['after']) if request.GET.get('after') else None
+            object_list = self.get_filtered_queryset()
+            if self.ranked_refs is not None:
+                # Pesquisa de texto: segue a ordem de relevância das refs (em cache)
+                page_refs, next_cursor = ranked_page(self.ranked_refs, after, limit)
+                terms = Term.objects.localized_only('ref', 'name').in_bulk(page_refs)
+                page = [terms[ref] for ref in page_refs if ref in terms]
+            else:
+                page, next_cursor = keyset_page(object_list.localized_only('ref', 'name'), after, limit)
+        except InvalidCursor as error:
+            return JsonResponse({'error': str(error)}, status=400)
+
+        next_url = None
+        if next_cursor:
+            next_params = {**self.get_filter_params(), 'after': next_cursor, 'limit': limit}
+            next_url = f"{request.path}?{urlencode(next_params)}"
+
+        return JsonResponse({
+            'results': self.serialize_terms(page),
+            'next': next_cursor,
+            'next_url': next_url,
+            'truncated': self.truncated,
+        })
+
+    def serialize_terms(self, terms):
+        # Parâmetros a preservar no link para o detalhe (igual ao que o template fazia)
+        detail_params = self.get_filter_params()
+        subarea_ref = self.kwargs.get('ref')
+        if subarea_ref:
+            detail_params = {'ref': subarea_ref, **detail_params}
+        detail_query = f"?{urlencode(detail_params)}" if detail_params else ''
+
+        return [
+            {
+                'ref': term.ref,
+                'name': term.name or '',
+                'url': reverse('term_detail', args=[term.ref]) + detail_query,
+            }
+            for term in terms
+        ]
+
+    @staticmethod
+    def _get_int(value, default):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
+
+
+# Autocomplete da pesquisa: sugestões a partir do índice de prefixos em memória (core/suggest.py)
+@user_has_access()
+def term_suggest(request):
+    query = request.GET.get('q', '').strip()
+    lang = request.GET.get('lang') or get_language()
+    if lang not in dict(settings.LANGUAGES):
+        lang = settings.LANGUAGE_CODE
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 20)
+    except ValueError:
+        limit = 10
+
+    results = prefix_index.suggest(query, lang, limit) if query else []
+    for result in results:
+        result['url'] = reverse('term_detail', args=[result['ref']])
+    return JsonResponse({'query': query, 'lang': lang, 'results': results})
+
+
 class TermDetailView(GroupAccessRequiredMixin, DetailView):
     model = Term
     context_object_name = 'term'
@@ -218,18 +459,15 @@ class TermDetailView(GroupAccessRequiredMixin, DetailView):
         content_language = self.request.GET.get('language') or get_language()
         query = self.request.GET.get('q', '')
 
-        ######### added to IEVP #########
-        published_field = f'published_at_{content_language}'
-        ###################################################
+        if content_language not in dict(settings.LANGUAGES):
+            content_language = get_language()
         term = context['term']
-        # Campos traduzidos dinamicamente
-        name_field = f'name_{content_language}'
-        description_field = f'description_{content_language}'
-        extra_field = f'extra_{content_language}'
-        # Atribui os valores traduzidos ao contexto
-        context['term_name'] = getattr(term, name_field, term.name)
-        context['term_description'] = getattr(term, description_field, term.description)
-        context['term_extra'] = getattr(term, extra_field, term.extra)
+        # Campos traduzidos: das colunas do modeltranslation ou, no modo "normalized", da tabela TermTranslation
+        translation = term.translation(content_language)
+        context['term_name'] = translation.name
+        context['term_description'] = translation.description
+        context['term_source'] = translation.source
+        context['term_extra'] = translation.extra
         context['content_language'] = content_language
         context['subarea'] = term.subarea
         # Adiciona filtros ao contexto para manter os valores no link de retorno
@@ -239,57 +477,43 @@ class TermDetailView(GroupAccessRequiredMixin, DetailView):
         # Definir back_url usando a stack de navegação, ou fallback com filtros
         context['back_url'] = get_back_url(self.request, fallback_url=fallback)
         ######### added to IEVP #############
-        context['term_published_at'] = getattr(term, published_field, None)
+        context['term_published_at'] = translation.published_at
 
         return context
 
 # homepage
 def home(request):
+    # conteúdo em cache, ver core/homepage.py: os posters para todos, o resto só para os utilizadores aprovados
     # listas vazias para evitar erros com users anonimos
     context = {
         'news': [],
         'warnings': [],
         'user_status': 'anonymous',  # default
-        'posters': Poster.objects.filter(active=True).order_by('position','-id')
+        'posters': home_posters(),
     }
 
+    capabilities = get_capabilities(request)
     # verificação para mostrar o botão quick access do painel admin
-    context['is_admin_or_gestor'] = (
-            request.user.is_authenticated
-            and (
-                    request.user.is_superuser
-                    or request.user.groups.filter(name__in=['Admin', 'Gestor']).exists()
-            )
-    )
+    context['is_admin_or_gestor'] = capabilities.is_admin_or_gestor
 
     if request.user.is_authenticated:
-        if not request.user.emailaddress_set.filter(verified=True).exists():
+        if not capabilities.email_verified:
             context['user_status'] = 'email_unverified'
-        elif Group.objects.filter(name="SemAcesso", user=request.user).exists():
+        elif not capabilities.has_access:
             context['user_status'] = 'awaiting_approval'
         else:
             context['user_status'] = 'approved'
-            # Só carrega conteúdos se tiver email verificado e for aprovado
-            context['news'] = News.objects.filter(
-                active=True
-            ).filter(
-                models.Q(start_date__lte=now()) | models.Q(start_date__isnull=True),
-                models.Q(end_date__gte=now()) | models.Q(end_date__isnull=True)
-            ).order_by('position','-created_at')
-
-            context['warnings'] = Warning.objects.filter(
-                active=True
-            ).filter(
-                models.Q(show_from__lte=now()) | models.Q(show_from__isnull=True),
-                models.Q(hide_after__gte=now()) | models.Q(hide_after__isnull=True)
-            ).order_by('position','-created_at')
+            # Só mostra conteúdos se tiver email verificado e for aprovado
+            content = home_content()
+            context['news'] = content['news']
+            context['warnings'] = content['warnings']
 
     # Se aprovado mostra os últimos termos adicionados + atalhos
     context['latest_terms'] = []
     context['show_quick'] = False
 
     if context['user_status'] == 'approved':
-        context['latest_terms'] = Term.objects.order_by('-created')[:6]
+        context['latest_terms'] = content['latest_terms']
         context['show_quick'] = True
 
     return render(request, 'home.html', context)
@@ -299,7 +523,7 @@ def home(request):
 @user_has_access()
 def tutorial_view(request):
     # Verifica se o user é Admin, Gestor ou Superuser
-    is_admin_or_gestor_or_superuser = request.user.groups.filter(name__in=['Admin', 'Gestor']).exists() or request.user.is_superuser
+    is_admin_or_gestor_or_superuser = get_capabilities(request).is_admin_or_gestor
 
     # Se o user for Admin, Gestor ou Superuser, mostra todos os tutoriais, caso contrário, só os não restritos
     if is_admin_or_gestor_or_superuser:
@@ -326,12 +550,8 @@ def documentation_view(request):
 
 
 def contacts_view(request):
-    top_messages = ContactTopMessage.objects.filter(
-        active=True
-    ).filter(
-        models.Q(show_from__lte=now()) | models.Q(show_from__isnull=True),
-        models.Q(hide_after__gte=now()) | models.Q(hide_after__isnull=True),
-    ).order_by("position", "-id")
+    # mensagens dentro da janela show_from/hide_after (ver ScheduledQuerySet)
+    top_messages = ContactTopMessage.objects.visible().order_by("position", "-id")
 
     contacts = ContactInfo.objects.filter(active=True).order_by("position")
     return render(request, "core/contacts.html", {
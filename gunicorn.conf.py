@@ -0,0 +1,18 @@
+# gunicorn.conf.py
+# O gunicorn lê este ficheiro automaticamente (pasta de onde é lançado, ver Procfile).
+
+
+def post_worker_init(worker):
+    # Aquece as estruturas em memória de cada worker antes de começar a receber pedidos
+    from core.context_processors import warm_navbar_areas
+    from core.suggest import prefix_index
+
+    try:
+        prefix_index.build()
+    except Exception:                           # ex: base de dados ainda sem migrações; constrói no 1º pedido
+        worker.log.exception("Não foi possível construir o índice de sugestões no arranque.")
+
+    try:
+        warm_navbar_areas()
+    except Exception:                           # idem: lidas no 1º pedido
+        worker.log.exception("Não foi possível carregar as áreas da navbar no arranque.")
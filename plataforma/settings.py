@@ -98,6 +98,8 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',                # Talvez faltasse este middleware. Permitia ao django usar o request.LANGUAGE_CODE e determinar automaticamente o idioma da interface
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CapabilitiesMiddleware',                   # request.capabilities: grupos do user lidos uma só vez por pedido
+    'core.middleware.NavigationStackMiddleware',                # stack do botão "voltar" num cookie assinado (sem escrever na sessão)
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -141,6 +143,47 @@ DATABASES = {
 
 
 
+# Cache (resultados de pesquisa e conteúdo da homepage). Por defeito é memória local de cada processo;
+# CACHE_BACKEND/CACHE_LOCATION podem apontar para uma cache partilhada (ex:
+# django.core.cache.backends.filebased.FileBasedCache + uma pasta local) para os workers partilharem resultados.
+# A invalidação não depende disso: os contadores de versão estão na base de dados (ver core/caching.py).
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+# Intervalo (segundos) entre duas leituras dos contadores de versão por cada processo: é o atraso máximo com que
+# um processo vê as alterações feitas noutro (ex: uma importação no run_jobs, uma área alterada noutro worker).
+# Cada leitura é uma query (todos os contadores de uma vez) por processo; as alterações feitas no próprio processo
+# veem-se logo. Um valor mais baixo deixa a navbar, as pesquisas e a homepage mais frescas à custa de mais queries.
+CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get("CACHE_VERSION_CHECK_INTERVAL", 30))
+
+# Validade (segundos) dos resultados de pesquisa em cache; as alterações ao vocabulário invalidam-nos antes
+SEARCH_CACHE_TIMEOUT = int(os.environ.get("SEARCH_CACHE_TIMEOUT", 3600))
+
+# Validade máxima (segundos) do conteúdo da homepage em cache (core/homepage.py); expira antes se uma notícia
+# ou aviso agendado aparecer/desaparecer, e as alterações no admin invalidam-no logo
+HOME_CACHE_TIMEOUT = int(os.environ.get("HOME_CACHE_TIMEOUT", 3600))
+
+# Armazenamento das traduções dos termos: "wide" (só as colunas name_<lang>, ... do modeltranslation) ou
+# "normalized" (também mantém a tabela estreita TermTranslation, uma linha por termo e idioma)
+TERM_TRANSLATION_STORAGE = os.environ.get("TERM_TRANSLATION_STORAGE", "wide")
+
+# Formato "delta" das versões do django-reversion (snapshots + deltas por campo), usado pelo Term: ver core/revision_storage.py
+SERIALIZATION_MODULES = {
+    "delta": "core.revision_storage",
+}
+
+# Jobs em segundo plano (importações/exportações grandes do admin), executados por "python manage.py run_jobs"
+# (processo "worker" do Procfile, ver core/jobs.py): nº de jobs em simultâneo, intervalo de leitura da fila (s)
+# e tempo sem progresso (s) ao fim do qual um job "running" é dado como falhado
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2))
+JOB_STALE_AFTER = int(os.environ.get("JOB_STALE_AFTER", 3600))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 